@@ -1,8 +1,15 @@
 import os
 from pathlib import Path
+from typing import Optional
 import google.generativeai as genai
 from dotenv import load_dotenv
 
+from cost_ledger import track_call
+from deadlines import hedged, request_timeout
+from rate_limiter import get_rate_limiter
+
+REQUEST_TIMEOUT_SECONDS = 120
+
 # Explicitly load .env from current directory or parent
 env_path = Path(".") / ".env"
 if not env_path.exists():
@@ -18,12 +25,27 @@ class BaseAgent:
             print("Warning: GEMINI_API_KEY or GOOGLE_API_KEY not found in environment variables.")
             
         genai.configure(api_key=api_key)
+        self.model_name = model_name
         self.model = genai.GenerativeModel(model_name)
 
-    def generate(self, prompt: str) -> str:
-        try:
-            response = self.model.generate_content(prompt)
+    def generate(self, prompt: str, hedge_name: Optional[str] = None) -> str:
+        """
+        Generate text within the current request deadline.
+        With hedge_name set, slow calls may be hedged (see deadlines.hedged).
+        """
+        def call() -> str:
+            with get_rate_limiter().slot(self.model_name), track_call(self.model_name) as record:
+                response = self.model.generate_content(
+                    prompt,
+                    request_options={"timeout": request_timeout(REQUEST_TIMEOUT_SECONDS)},
+                )
+                record.add_usage(response.usage_metadata)
             return response.text
+
+        try:
+            if hedge_name:
+                return hedged(hedge_name, call)
+            return call()
         except Exception as e:
             print(f"Error generating content: {e}")
             return ""
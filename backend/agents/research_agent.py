@@ -85,7 +85,7 @@ class ResearchAgent(BaseAgent):
         }}
         """
         
-        response_text = self.generate(prompt)
+        response_text = self.generate(prompt, hedge_name="research.analyze")
         if not response_text:
             return MOCK_RESEARCH_DATA
         
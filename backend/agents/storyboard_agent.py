@@ -3,6 +3,10 @@ import os
 from pathlib import Path
 from typing import Dict, Any, Callable
 import concurrent.futures
+
+from deadlines import bind
+from image_engine import get_image_engine
+
 from .base_agent import BaseAgent
 
 MOCK_STORYBOARD_DATA = {
@@ -122,7 +126,8 @@ class StoryboardAgent(BaseAgent):
                 generated_path = image_agent.generate_image(visual_prompt, str(output_path))
                 
                 if generated_path:
-                    relative_url = f"/uploads/{filename}"
+                    # The extension follows the returned image type
+                    relative_url = f"/uploads/{Path(generated_path).name}"
                     with lock:
                         # Find and update the item in storyboard_data
                         for i, data_item in enumerate(storyboard_data.get(list_name, [])):
@@ -139,20 +144,23 @@ class StoryboardAgent(BaseAgent):
                 
                 return item_id
 
+            # ImageAgent calls run through the shared image engine; match its pool size
+            image_workers = get_image_engine().max_workers
+
             # Phase 1: Generate Assets (Characters, Locations, Objects) in Parallel
             asset_futures = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=image_workers) as executor:
                 if "characters" in storyboard_data:
                     for item in storyboard_data["characters"]:
-                        asset_futures.append(executor.submit(generate_and_update, item, "char", "characters"))
+                        asset_futures.append(executor.submit(bind(generate_and_update), item, "char", "characters"))
                 
                 if "locations" in storyboard_data:
                     for item in storyboard_data["locations"]:
-                        asset_futures.append(executor.submit(generate_and_update, item, "loc", "locations"))
+                        asset_futures.append(executor.submit(bind(generate_and_update), item, "loc", "locations"))
                         
                 if "objects" in storyboard_data:
                     for item in storyboard_data["objects"]:
-                        asset_futures.append(executor.submit(generate_and_update, item, "obj", "objects"))
+                        asset_futures.append(executor.submit(bind(generate_and_update), item, "obj", "objects"))
                 
                 # Wait for all assets to complete
                 for future in concurrent.futures.as_completed(asset_futures):
@@ -168,10 +176,10 @@ class StoryboardAgent(BaseAgent):
 
             # Phase 2: Generate Scenes (Frames) in Parallel
             scene_futures = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=image_workers) as executor:
                 if "frames" in storyboard_data:
                     for item in storyboard_data["frames"]:
-                        scene_futures.append(executor.submit(generate_and_update, item, "frame", "frames"))
+                        scene_futures.append(executor.submit(bind(generate_and_update), item, "frame", "frames"))
                 
                 for future in concurrent.futures.as_completed(scene_futures):
                     try:
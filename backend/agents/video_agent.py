@@ -4,6 +4,13 @@ import threading
 from google import genai
 from google.genai import types
 
+from cost_ledger import track_call
+from rate_limiter import get_rate_limiter
+
+VIDEO_MODEL = "veo-3.1-generate-preview"
+# Length requested from Veo (3.1 Preview accepts 4-8 seconds); also what the cost ledger books
+CLIP_SECONDS = 6
+
 class VideoAgent:
     def __init__(self):
         self.api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
@@ -24,9 +31,8 @@ class VideoAgent:
             manager_callback(project_id, {"status": "failed", "error": "Client not initialized"})
             return
 
-        # Use a semaphore to limit concurrent video generations if needed, 
-        # but for now we fire them off. 
-        # Note: Veo 3.1 might have quota limits.
+        # Veo quota is enforced by the shared rate limiter in _run_generation,
+        # so threads beyond the model's concurrency limit simply wait their turn.
         
         thread = threading.Thread(
             target=self._run_generation,
@@ -41,19 +47,23 @@ class VideoAgent:
             manager_callback(project_id, {"status": "processing", "progress": 10})
 
             # Call Veo API (using Veo 3.1 Preview - duration must be 4-8 seconds)
-            operation = self.client.models.generate_videos(
-                model="veo-3.1-generate-preview",
-                prompt=prompt,
-                config=types.GenerateVideosConfig(
-                    duration_seconds=6
+            # The slot is held until the operation finishes: it caps concurrent generations
+            with get_rate_limiter().slot(VIDEO_MODEL), track_call(VIDEO_MODEL) as call:
+                operation = self.client.models.generate_videos(
+                    model=VIDEO_MODEL,
+                    prompt=prompt,
+                    config=types.GenerateVideosConfig(
+                        duration_seconds=CLIP_SECONDS
+                    )
                 )
-            )
-            
-            print("Video generation operation started...")
-            manager_callback(project_id, {"status": "processing", "progress": 30})
 
-            # Wait for result
-            response = operation.result()
+                print("Video generation operation started...")
+                manager_callback(project_id, {"status": "processing", "progress": 30})
+
+                # Wait for result
+                response = operation.result()
+                if response.generated_videos:
+                    call.video_seconds = CLIP_SECONDS
             
             manager_callback(project_id, {"status": "processing", "progress": 90})
             
@@ -87,18 +97,21 @@ class VideoAgent:
         print(f"Starting video generation for: {prompt[:80]}...")
         try:
             # Call Veo API (using Veo 3.1 Preview - duration must be 4-8 seconds)
-            operation = self.client.models.generate_videos(
-                model="veo-3.1-generate-preview",
-                prompt=prompt,
-                config=types.GenerateVideosConfig(
-                    duration_seconds=6
+            with get_rate_limiter().slot(VIDEO_MODEL), track_call(VIDEO_MODEL) as call:
+                operation = self.client.models.generate_videos(
+                    model=VIDEO_MODEL,
+                    prompt=prompt,
+                    config=types.GenerateVideosConfig(
+                        duration_seconds=CLIP_SECONDS
+                    )
                 )
-            )
-            
-            print("Video generation operation started, waiting for result...")
 
-            # Wait for result (blocking)
-            response = operation.result()
+                print("Video generation operation started, waiting for result...")
+
+                # Wait for result (blocking)
+                response = operation.result()
+                if response.generated_videos:
+                    call.video_seconds = CLIP_SECONDS
             
             if response.generated_videos:
                 video_bytes = response.generated_videos[0].video.video_bytes
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark keyframe analysis against full-video analysis of a walkthrough.
+
+For each mode this reports prompt / output tokens, latency and how much of the
+walkthrough JSON schema the answer fills in. The response cache is bypassed so
+every run hits the API.
+
+Usage:
+    cd backend
+    python benchmark_keyframes.py                           # sample walkthrough
+    python benchmark_keyframes.py path/to/video.mp4 --runs 3 --out results.json
+
+Needs GOOGLE_API_KEY, ffmpeg and numpy.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+from google import genai
+
+from file_uploads import upload_file
+from gemini_utils import (
+    WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT,
+    build_walkthrough_user_message,
+    call_gemini_with_video,
+)
+from keyframes import extract_keyframes
+
+load_dotenv()
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_VIDEO = ROOT_DIR / "frontend" / "public" / "sample-inputs" / "Boards App Walkthrough.mp4"
+DEFAULT_MODEL = "gemini-2.5-flash"
+PRODUCT_CONTEXT = "Visual project management / kanban board app"
+
+
+def schema_template() -> Dict[str, Any]:
+    """The JSON skeleton embedded in WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT."""
+    prompt = WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT
+    return json.loads(prompt[prompt.index("{", prompt.index("JSON schema")):prompt.rindex("}") + 1])
+
+
+def _leaf_paths(template: Any, prefix: str = "") -> List[str]:
+    if isinstance(template, dict):
+        return [p for key, value in template.items() for p in _leaf_paths(value, f"{prefix}.{key}".lstrip("."))]
+    if isinstance(template, list) and template and isinstance(template[0], dict):
+        return _leaf_paths(template[0], f"{prefix}[]")
+    return [prefix]
+
+
+def _filled(value: Any, path: List[str]) -> bool:
+    if not path:
+        return value not in (None, "", [], {})
+    head, rest = path[0], path[1:]
+    if head.endswith("[]"):
+        items = value.get(head[:-2]) if isinstance(value, dict) else None
+        return isinstance(items, list) and any(_filled(item, rest) for item in items)
+    return isinstance(value, dict) and _filled(value.get(head), rest)
+
+
+def schema_completeness(analysis: Dict[str, Any]) -> float:
+    """Share of schema leaf fields that are present and non-empty."""
+    paths = _leaf_paths(schema_template())
+    filled = sum(_filled(analysis, path.split(".")) for path in paths)
+    return filled / len(paths)
+
+
+def _parse(text: str) -> Dict[str, Any]:
+    fenced = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
+    try:
+        return json.loads(fenced.group(1) if fenced else text)
+    except json.JSONDecodeError:
+        return {}
+
+
+def run_mode(name: str, model: str, runs: int, **video_kwargs: Any) -> Dict[str, Any]:
+    samples = []
+    for attempt in range(runs):
+        started = time.monotonic()
+        result = call_gemini_with_video(
+            system_prompt=WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT,
+            user_message=build_walkthrough_user_message(PRODUCT_CONTEXT),
+            model=model,
+            media_resolution="medium",
+            thinking_level="high",
+            use_cache=False,
+            **video_kwargs,
+        )
+        latency = time.monotonic() - started
+        usage = result.get("usage") or {}
+        samples.append({
+            "latency_seconds": round(latency, 2),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+            "completeness": round(schema_completeness(_parse(result.get("text", ""))), 3),
+        })
+        print(f"[{name}] run {attempt + 1}/{runs}: {samples[-1]}")
+    return {
+        "mode": name,
+        "runs": samples,
+        **{
+            f"median_{key}": statistics.median(s[key] for s in samples)
+            for key in ("latency_seconds", "prompt_tokens", "output_tokens", "completeness")
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video", nargs="?", type=Path, default=DEFAULT_VIDEO)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--out", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"))
+    video_uri = upload_file(client, args.video).uri
+
+    started = time.monotonic()
+    keyframes = extract_keyframes(args.video)
+    extraction_seconds = time.monotonic() - started
+
+    results = {
+        "video": str(args.video),
+        "model": args.model,
+        "keyframes": len(keyframes),
+        "keyframe_extraction_seconds": round(extraction_seconds, 2),
+        "modes": [
+            run_mode("full_video", args.model, args.runs, video_uri=video_uri),
+            run_mode(
+                "keyframes",
+                args.model,
+                args.runs,
+                video_uri="",
+                video_frames=[k.as_video_frame() for k in keyframes],
+            ),
+        ],
+    }
+
+    print("\n" + "=" * 72)
+    print(f"{'mode':<12}{'latency s':>12}{'prompt tok':>14}{'output tok':>14}{'complete':>12}")
+    for mode in results["modes"]:
+        print(
+            f"{mode['mode']:<12}{mode['median_latency_seconds']:>12.1f}{mode['median_prompt_tokens']:>14.0f}"
+            f"{mode['median_output_tokens']:>14.0f}{mode['median_completeness']:>12.0%}"
+        )
+    print(f"(keyframe extraction: {extraction_seconds:.1f}s for {len(keyframes)} frames)")
+
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
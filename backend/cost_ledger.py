@@ -0,0 +1,213 @@
+"""
+Per-run cost ledger for external model calls.
+
+Every Gemini text, Gemini image and Veo call records its model, token usage
+(prompt / output / thinking / cached), images produced, video seconds and
+wall time under the current run and stage:
+
+    with cost_scope(run_id):               # API handler / script
+        with cost_stage("images"):          # pipeline step, also times the step
+            with track_call(IMAGE_MODEL) as call:
+                response = client.models.generate_content(...)
+                call.add_usage(response.usage_metadata)
+                call.images += 1
+
+Run and stage live in context variables, so deadlines.bind() and
+asyncio.to_thread carry them into worker threads. totals(run_id) is written
+into status.json and served by GET /runs/{run_id}/cost.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+UNSCOPED_RUN = "unscoped"
+DEFAULT_STAGE = "default"
+
+_run_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("cost_run_id", default=None)
+_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("cost_stage", default=None)
+
+# ============================================================================
+# COUNTERS
+# ============================================================================
+
+
+@dataclass
+class UsageCounters:
+    calls: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    thinking_tokens: int = 0
+    cached_tokens: int = 0
+    images: int = 0
+    video_seconds: float = 0.0
+    # Sum of per-call latencies (parallel calls overlap)
+    call_seconds: float = 0.0
+
+    def add(self, other: "UsageCounters") -> None:
+        for f in fields(self):
+            setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["video_seconds"] = round(data["video_seconds"], 2)
+        data["call_seconds"] = round(data["call_seconds"], 3)
+        return data
+
+
+# usageMetadata field -> counter; REST uses camelCase, the SDKs snake_case
+_USAGE_FIELDS = {
+    "prompt_tokens": ("promptTokenCount", "prompt_token_count"),
+    "output_tokens": ("candidatesTokenCount", "candidates_token_count"),
+    "thinking_tokens": ("thoughtsTokenCount", "thoughts_token_count"),
+    "cached_tokens": ("cachedContentTokenCount", "cached_content_token_count"),
+}
+
+
+def usage_counters(usage: Any) -> Dict[str, int]:
+    """Token counts from a usageMetadata dict (REST) or usage_metadata object (SDKs)."""
+    counts: Dict[str, int] = {}
+    if not usage:
+        return counts
+    for name, keys in _USAGE_FIELDS.items():
+        for key in keys:
+            value = usage.get(key) if isinstance(usage, dict) else getattr(usage, key, None)
+            if value:
+                counts[name] = int(value)
+                break
+    return counts
+
+
+@dataclass
+class CallRecord(UsageCounters):
+    """One call in progress; track_call() adds it to the ledger on exit."""
+
+    calls: int = 1
+
+    def add_usage(self, usage: Any) -> None:
+        for name, value in usage_counters(usage).items():
+            setattr(self, name, getattr(self, name) + value)
+
+
+# ============================================================================
+# LEDGER
+# ============================================================================
+
+
+class CostLedger:
+    """Thread-safe counters keyed by (run, stage, model), plus stage wall times."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str, str], UsageCounters] = {}
+        self._stage_seconds: Dict[Tuple[str, str], float] = {}
+
+    def record(self, model: str, counters: UsageCounters) -> None:
+        key = (_run_id.get() or UNSCOPED_RUN, _stage.get() or DEFAULT_STAGE, model)
+        with self._lock:
+            self._entries.setdefault(key, UsageCounters()).add(counters)
+
+    def record_stage_time(self, run_id: str, stage: str, seconds: float) -> None:
+        with self._lock:
+            key = (run_id, stage)
+            self._stage_seconds[key] = self._stage_seconds.get(key, 0.0) + seconds
+
+    def has_run(self, run_id: str) -> bool:
+        with self._lock:
+            return any(key[0] == run_id for key in self._entries)
+
+    def totals(self, run_id: str) -> Dict[str, Any]:
+        """{"total": ..., "by_stage": {stage: ...}, "by_model": {model: ...}} for one run."""
+        total = UsageCounters()
+        by_stage: Dict[str, UsageCounters] = {}
+        by_model: Dict[str, UsageCounters] = {}
+        with self._lock:
+            for (run, stage, model), counters in self._entries.items():
+                if run != run_id:
+                    continue
+                total.add(counters)
+                by_stage.setdefault(stage, UsageCounters()).add(counters)
+                by_model.setdefault(model, UsageCounters()).add(counters)
+            stage_seconds = {
+                stage: seconds for (run, stage), seconds in self._stage_seconds.items() if run == run_id
+            }
+
+        stages: Dict[str, Dict[str, Any]] = {}
+        for stage in sorted(set(by_stage) | set(stage_seconds)):
+            stages[stage] = (by_stage.get(stage) or UsageCounters()).as_dict()
+            if stage in stage_seconds:
+                stages[stage]["wall_seconds"] = round(stage_seconds[stage], 3)
+        return {
+            "run_id": run_id,
+            "total": total.as_dict(),
+            "by_stage": stages,
+            "by_model": {model: counters.as_dict() for model, counters in sorted(by_model.items())},
+        }
+
+    def reset(self, run_id: str) -> None:
+        """Drop a run's counters, e.g. before regenerating it from scratch."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == run_id]:
+                del self._entries[key]
+            for key in [k for k in self._stage_seconds if k[0] == run_id]:
+                del self._stage_seconds[key]
+
+
+_ledger = CostLedger()
+
+
+def get_cost_ledger() -> CostLedger:
+    return _ledger
+
+
+# ============================================================================
+# SCOPES
+# ============================================================================
+
+
+@contextlib.contextmanager
+def cost_scope(run_id: str) -> Iterator[None]:
+    """Attribute every call inside the block to run_id."""
+    token = _run_id.set(run_id)
+    try:
+        yield
+    finally:
+        _run_id.reset(token)
+
+
+@contextlib.contextmanager
+def cost_stage(stage: str) -> Iterator[None]:
+    """Attribute calls to stage and record the block's wall time for it."""
+    token = _stage.set(stage)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+        _ledger.record_stage_time(_run_id.get() or UNSCOPED_RUN, stage, time.monotonic() - started)
+
+
+@contextlib.contextmanager
+def track_call(model: str) -> Iterator[CallRecord]:
+    """Time one external call; usage set on the yielded record is added to the ledger."""
+    record = CallRecord()
+    started = time.monotonic()
+    try:
+        yield record
+    except BaseException:
+        record.errors += 1
+        raise
+    finally:
+        record.call_seconds = time.monotonic() - started
+        _ledger.record(model, record)
+
+
+def record_usage(model: str, **counters: Any) -> None:
+    """Add counters outside a track_call block, e.g. record_usage(model, images=1) once an image is saved."""
+    _ledger.record(model, UsageCounters(**counters))
@@ -0,0 +1,200 @@
+"""
+Request deadlines and hedged calls for outbound model requests.
+
+- deadline(seconds): sets an absolute deadline for the current context (an API
+  handler, a script step); nested deadlines can only shorten it
+- request_timeout(default): per-call timeout = min(default, time left), raises
+  DeadlineExceeded once the deadline has passed
+- bind(fn): carries the deadline into ThreadPoolExecutor workers
+  (asyncio.to_thread already copies the context)
+- hedged(name, call): for short idempotent text calls, starts a duplicate
+  request once the first has run longer than the observed latency percentile
+  and returns whichever finishes first (HEDGE_REQUESTS=1 to enable)
+
+    with deadline(300):
+        generate_storyboard(run_id, research)
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# ============================================================================
+# DEADLINE CONTEXT
+# ============================================================================
+
+# Absolute time.monotonic() deadline of the current request, None when unbounded
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request deadline passed before (or while) an outbound call could run."""
+
+
+@contextlib.contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Bound everything inside the block to `seconds` from now (None: no new bound)."""
+    current = _deadline.get()
+    if seconds is None:
+        new = current
+    else:
+        new = time.monotonic() + seconds
+        if current is not None:
+            new = min(new, current)
+    token = _deadline.set(new)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None when there is none."""
+    current = _deadline.get()
+    if current is None:
+        return None
+    return current - time.monotonic()
+
+
+def check_deadline() -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+
+
+def request_timeout(default: Optional[float]) -> Optional[float]:
+    """Timeout for one outbound call: the smaller of `default` and the time left."""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return left if default is None else min(default, left)
+
+
+def bind(fn: Callable[..., T]) -> Callable[..., T]:
+    """Wrap fn so it runs with the caller's deadline, e.g. executor.submit(bind(fn), ...)."""
+    ctx = contextvars.copy_context()
+
+    def run(*args: Any, **kwargs: Any) -> T:
+        # A Context can only be entered by one thread at a time, so run in a copy
+        return ctx.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+# ============================================================================
+# HEDGED REQUESTS
+# ============================================================================
+
+
+@dataclass
+class HedgePolicy:
+    # Start the duplicate after this percentile of recent latencies
+    percentile: float = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+    # Delay used until enough latencies have been observed
+    initial_delay_seconds: float = float(os.getenv("HEDGE_INITIAL_DELAY", "20"))
+    min_delay_seconds: float = 1.0
+    min_samples: int = 10
+    window: int = 100
+
+
+class LatencyTracker:
+    """Sliding window of call latencies per call name."""
+
+    def __init__(self, window: int = 100) -> None:
+        self._window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self._window)).append(seconds)
+
+    def percentile(self, name: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            return len(self._samples.get(name, ()))
+
+
+_latencies = LatencyTracker()
+# Losing attempts cannot be cancelled mid-request; they finish here in the background
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+def hedging_enabled() -> bool:
+    return os.getenv("HEDGE_REQUESTS", "").lower() in ("1", "true", "yes")
+
+
+def hedge_delay(name: str, policy: HedgePolicy) -> float:
+    if _latencies.count(name) < policy.min_samples:
+        return policy.initial_delay_seconds
+    observed = _latencies.percentile(name, policy.percentile) or policy.initial_delay_seconds
+    return max(policy.min_delay_seconds, observed)
+
+
+def hedged(
+    name: str,
+    call: Callable[[], T],
+    *,
+    policy: Optional[HedgePolicy] = None,
+    enabled: Optional[bool] = None,
+) -> T:
+    """Run call(); if it is slower than the p-th percentile for `name`, race a duplicate.
+
+    The first successful result wins. If both attempts fail, the first error is
+    raised. Latencies of successful attempts feed the percentile estimate, so
+    this also records latencies while hedging is disabled.
+    """
+    policy = policy or HedgePolicy()
+
+    def timed() -> T:
+        started = time.monotonic()
+        result = call()
+        _latencies.record(name, time.monotonic() - started)
+        return result
+
+    if not (hedging_enabled() if enabled is None else enabled):
+        return timed()
+
+    check_deadline()
+    first: Future = _hedge_executor.submit(bind(timed))
+    delay = hedge_delay(name, policy)
+    left = remaining()
+    done, _ = wait([first], timeout=delay if left is None else min(delay, left))
+    if first in done:
+        # Fast failures are not hedged: a duplicate would most likely fail the same way
+        return first.result()
+
+    check_deadline()
+    print(f"[hedge] {name}: no answer after {delay:.1f}s, sending duplicate request")
+    pending = {first, _hedge_executor.submit(bind(timed))}
+    errors = []
+    while pending:
+        done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded(f"request deadline exceeded waiting for {name}")
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            errors.append(future.exception())
+    raise errors[0]
@@ -0,0 +1,520 @@
+"""
+Hash-deduplicated uploads to the Gemini File API.
+
+- Manifest: sha256 of the file content -> File API name / URI / expiry,
+  stored as JSON under backend/.cache/file_uploads.json
+- Before uploading, a manifest hit is checked with files.get(); an ACTIVE file
+  that is not about to expire is reused instead of uploading again
+- Manifest writes take an exclusive lock and replace the file atomically; a
+  per-hash lock keeps two processes from uploading the same file at once
+- With client=None uploads use the REST resumable protocol: the file is read
+  through mmap in chunks, progress is reported per chunk and a dropped
+  connection resumes from the last committed byte
+- PROCESSING is polled with backoff; aupload_file / aupload_files wait on
+  the event loop so several uploads process concurrently
+
+    uploaded = upload_file(None, Path("walkthrough.mp4"))
+    contents = [{"file_data": {"file_uri": uploaded.uri, ...}}]
+
+    uploads = await aupload_files([path_a, path_b, path_c])
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import mimetypes
+import mmap
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+
+import gemini_utils
+from deadlines import check_deadline, request_timeout
+from gemini_transport import GeminiTransport, get_transport
+from gemini_utils import get_api_key
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+DEFAULT_MANIFEST_PATH = Path(__file__).resolve().parent / ".cache" / "file_uploads.json"
+# Files live 48h; don't hand out one that may expire mid-request
+EXPIRY_MARGIN = timedelta(hours=1)
+# PROCESSING polls start fast and back off
+PROCESSING_POLL_SECONDS = 1.0
+PROCESSING_POLL_BACKOFF = 1.5
+PROCESSING_POLL_MAX_SECONDS = 20.0
+
+FILES_API_VERSION = "v1beta"
+# Resumable upload chunks must be multiples of 256 KiB (except the last)
+UPLOAD_GRANULARITY = 256 * 1024
+DEFAULT_CHUNK_SIZE = 32 * UPLOAD_GRANULARITY
+UPLOAD_RETRY_SECONDS = 1.0
+UPLOAD_RETRY_MAX_SECONDS = 30.0
+
+_thread_lock = threading.RLock()
+
+
+def file_sha256(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def _locked(lock_path: Path) -> Iterator[None]:
+    """Exclusive lock across threads and processes (flock on lock_path)."""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as handle:
+        if fcntl is None:
+            with _thread_lock:
+                yield
+            return
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _iso(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+# ============================================================================
+# MANIFEST
+# ============================================================================
+
+
+@dataclass
+class UploadedFile:
+    name: str
+    uri: str
+    sha256: str
+    mime_type: Optional[str] = None
+    size_bytes: int = 0
+    # ISO-8601, as reported by the File API
+    expiration_time: Optional[str] = None
+    source: Optional[str] = None
+    # True when the manifest entry was reused instead of uploading
+    reused: bool = False
+
+    def expires_soon(self, margin: timedelta = EXPIRY_MARGIN) -> bool:
+        if not self.expiration_time:
+            return False
+        try:
+            expires = datetime.fromisoformat(self.expiration_time.replace("Z", "+00:00"))
+        except ValueError:
+            return True
+        if expires.tzinfo is None:
+            expires = expires.replace(tzinfo=timezone.utc)
+        return expires - datetime.now(timezone.utc) < margin
+
+
+class UploadManifest:
+    """sha256 -> UploadedFile, shared by every process using the same path."""
+
+    def __init__(self, path: Path = DEFAULT_MANIFEST_PATH) -> None:
+        self.path = Path(path)
+
+    @property
+    def lock_path(self) -> Path:
+        return self.path.with_suffix(".lock")
+
+    def upload_lock(self, sha256: str) -> contextlib.AbstractContextManager:
+        """Held while one file is checked / uploaded, so concurrent runs upload it once."""
+        return _locked(self.path.parent / "file_upload_locks" / f"{sha256}.lock")
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exc:
+            print(f"[upload] Ignoring unreadable manifest {self.path}: {exc}")
+            return {}
+
+    def _write(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(entries, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def get(self, sha256: str) -> Optional[UploadedFile]:
+        entry = self._read().get(sha256)
+        if not entry:
+            return None
+        entry.pop("reused", None)
+        return UploadedFile(**entry)
+
+    def put(self, uploaded: UploadedFile) -> None:
+        entry = asdict(uploaded)
+        entry.pop("reused")
+        with _locked(self.lock_path):
+            entries = self._read()
+            entries[uploaded.sha256] = entry
+            self._write(entries)
+
+    def remove(self, sha256: str) -> None:
+        with _locked(self.lock_path):
+            entries = self._read()
+            if entries.pop(sha256, None) is not None:
+                self._write(entries)
+
+
+_manifest: Optional[UploadManifest] = None
+
+
+def get_upload_manifest() -> UploadManifest:
+    """Process-wide manifest; FILE_UPLOAD_MANIFEST overrides the path."""
+    global _manifest
+    if _manifest is None:
+        _manifest = UploadManifest(Path(os.getenv("FILE_UPLOAD_MANIFEST", str(DEFAULT_MANIFEST_PATH))))
+    return _manifest
+
+
+# ============================================================================
+# FILES BACKENDS
+# ============================================================================
+
+
+@dataclass
+class RemoteFile:
+    name: str
+    uri: str
+    state: str
+    mime_type: Optional[str] = None
+    expiration_time: Optional[str] = None
+
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def print_progress(sent: int, total: int) -> None:
+    """Default progress callback: one line per chunk."""
+    percent = 100.0 * sent / total if total else 100.0
+    print(f"[upload] {sent / 1024 / 1024:.1f} / {total / 1024 / 1024:.1f} MB ({percent:.0f}%)")
+
+
+class ResumableUpload:
+    """
+    File API resumable upload of one file, read through mmap in chunk_size pieces.
+
+    A dropped connection or 5xx asks the server how many bytes it has
+    (X-Goog-Upload-Command: query) and continues from there, up to max_retries
+    times in a row; an expired session starts over.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        mime_type: Optional[str] = None,
+        display_name: Optional[str] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        transport: Optional[GeminiTransport] = None,
+        progress: Optional[ProgressCallback] = None,
+        max_retries: int = 5,
+    ) -> None:
+        if chunk_size % UPLOAD_GRANULARITY:
+            raise ValueError(f"chunk_size must be a multiple of {UPLOAD_GRANULARITY} bytes")
+        self.path = Path(path)
+        self.mime_type = mime_type or mimetypes.guess_type(self.path.name)[0] or "application/octet-stream"
+        self.display_name = display_name or self.path.name
+        self.chunk_size = chunk_size
+        self.transport = transport
+        self.progress = progress
+        self.max_retries = max_retries
+        self.upload_url: Optional[str] = None
+
+    def _request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        return (self.transport or get_transport()).request(
+            method, url, timeout=request_timeout(gemini_utils.REQUEST_TIMEOUT_SECONDS), **kwargs
+        )
+
+    def start(self, size: int) -> str:
+        resp = self._request(
+            "POST",
+            f"{gemini_utils.GEMINI_API_BASE_URL}/upload/{FILES_API_VERSION}/files?key={get_api_key()}",
+            headers={
+                "X-Goog-Upload-Protocol": "resumable",
+                "X-Goog-Upload-Command": "start",
+                "X-Goog-Upload-Header-Content-Length": str(size),
+                "X-Goog-Upload-Header-Content-Type": self.mime_type,
+                "Content-Type": "application/json",
+            },
+            data=json.dumps({"file": {"display_name": self.display_name}}),
+        )
+        _raise_for_status(resp)
+        upload_url = resp.headers.get("X-Goog-Upload-URL")
+        if not upload_url:
+            raise RuntimeError("File API did not return an upload URL")
+        self.upload_url = upload_url
+        return upload_url
+
+    def query_offset(self) -> int:
+        """Bytes the server has committed for the current session."""
+        resp = self._request("POST", self.upload_url, headers={"X-Goog-Upload-Command": "query"})
+        _raise_for_status(resp)
+        return int(resp.headers.get("X-Goog-Upload-Size-Received") or 0)
+
+    def run(self) -> Dict[str, Any]:
+        """Upload the whole file; returns the File API file resource."""
+        size = self.path.stat().st_size
+        with open(self.path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = 0
+            failures = 0
+            while True:
+                try:
+                    if self.upload_url is None:
+                        self.start(size)
+                        offset = 0
+                    end = min(offset + self.chunk_size, size)
+                    final = end >= size
+                    resp = self._request(
+                        "POST",
+                        self.upload_url,
+                        headers={
+                            "X-Goog-Upload-Command": "upload, finalize" if final else "upload",
+                            "X-Goog-Upload-Offset": str(offset),
+                            "Content-Length": str(end - offset),
+                        },
+                        # Only this chunk is copied out of the mapping
+                        data=data[offset:end],
+                    )
+                    if resp.status_code == 404:
+                        # Session expired: start a new one
+                        self.upload_url = None
+                        raise requests.ConnectionError("upload session expired")
+                    if resp.status_code >= 500:
+                        raise requests.ConnectionError(f"HTTP {resp.status_code}")
+                    _raise_for_status(resp)
+                    failures = 0
+                    offset = end
+                    if self.progress:
+                        self.progress(offset, size)
+                    if final:
+                        return resp.json()["file"]
+                except requests.RequestException as exc:
+                    failures += 1
+                    if failures > self.max_retries:
+                        raise RuntimeError(f"Upload of {self.path.name} failed: {exc}") from exc
+                    delay = min(UPLOAD_RETRY_MAX_SECONDS, UPLOAD_RETRY_SECONDS * 2 ** (failures - 1))
+                    print(f"[upload] {self.path.name}: {exc}; resuming in {delay:.1f}s")
+                    time.sleep(delay)
+                    if self.upload_url is not None:
+                        try:
+                            offset = self.query_offset()
+                        except requests.RequestException:
+                            pass
+
+
+def _raise_for_status(resp: Any) -> None:
+    if resp.ok:
+        return
+    try:
+        result = resp.json()
+    except ValueError:
+        result = {}
+    gemini_utils.raise_for_api_error(result, ok=False, status_code=resp.status_code)
+
+
+class RestFiles:
+    """File API over gemini_utils' pooled transport (resumable, chunked uploads)."""
+
+    def __init__(self, transport: Optional[GeminiTransport] = None, chunk_size: Optional[int] = None) -> None:
+        self.transport = transport
+        self.chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+
+    def get(self, name: str) -> RemoteFile:
+        resp = (self.transport or get_transport()).request(
+            "GET",
+            f"{gemini_utils.GEMINI_API_BASE_URL}/{FILES_API_VERSION}/{name}?key={get_api_key()}",
+            timeout=request_timeout(gemini_utils.REQUEST_TIMEOUT_SECONDS),
+        )
+        _raise_for_status(resp)
+        return _rest_remote(resp.json())
+
+    def upload(self, path: Path, mime_type: Optional[str], progress: Optional[ProgressCallback]) -> RemoteFile:
+        upload = ResumableUpload(
+            path, mime_type, transport=self.transport, chunk_size=self.chunk_size, progress=progress
+        )
+        return _rest_remote(upload.run())
+
+
+class SdkFiles:
+    """File API through a google-genai Client (client.files)."""
+
+    def __init__(self, client: Any) -> None:
+        self.client = client
+
+    def get(self, name: str) -> RemoteFile:
+        return _sdk_remote(self.client.files.get(name=name))
+
+    def upload(self, path: Path, mime_type: Optional[str], progress: Optional[ProgressCallback]) -> RemoteFile:
+        config = {"mime_type": mime_type} if mime_type else None
+        return _sdk_remote(self.client.files.upload(file=path, config=config))
+
+
+def _rest_remote(resource: Dict[str, Any]) -> RemoteFile:
+    return RemoteFile(
+        name=resource["name"],
+        uri=resource.get("uri", ""),
+        state=resource.get("state", ""),
+        mime_type=resource.get("mimeType"),
+        expiration_time=resource.get("expirationTime"),
+    )
+
+
+def _sdk_remote(remote: Any) -> RemoteFile:
+    state = getattr(remote, "state", None)
+    return RemoteFile(
+        name=remote.name,
+        uri=remote.uri,
+        state=str(getattr(state, "name", state) or ""),
+        mime_type=getattr(remote, "mime_type", None),
+        expiration_time=_iso(getattr(remote, "expiration_time", None)),
+    )
+
+
+def _files_backend(client: Any) -> Any:
+    return RestFiles() if client is None else SdkFiles(client)
+
+
+# ============================================================================
+# UPLOAD
+# ============================================================================
+
+
+def _poll_delays() -> Iterator[float]:
+    """PROCESSING poll intervals: PROCESSING_POLL_SECONDS growing to PROCESSING_POLL_MAX_SECONDS."""
+    delay = PROCESSING_POLL_SECONDS
+    while True:
+        yield delay
+        delay = min(PROCESSING_POLL_MAX_SECONDS, delay * PROCESSING_POLL_BACKOFF)
+
+
+def _upload_or_reuse(
+    files: Any,
+    path: Path,
+    mime_type: Optional[str],
+    manifest: UploadManifest,
+    progress: Optional[ProgressCallback],
+) -> Tuple[UploadedFile, str]:
+    """Reuse a manifest hit or upload; returns the entry and its current remote state."""
+    sha256 = file_sha256(path)
+    with manifest.upload_lock(sha256):
+        cached = manifest.get(sha256)
+        if cached is not None and not cached.expires_soon():
+            try:
+                remote = files.get(cached.name)
+            except Exception as exc:  # noqa: BLE001 - deleted / expired files 403 or 404
+                print(f"[upload] Cached file {cached.name} unavailable: {exc}")
+                remote = None
+            if remote is not None and remote.state in ("ACTIVE", "PROCESSING"):
+                print(f"[upload] ✓ Reusing {cached.name} for {path.name} (sha256 {sha256[:12]})")
+                cached.reused = True
+                cached.expiration_time = remote.expiration_time or cached.expiration_time
+                return cached, remote.state
+        if cached is not None:
+            manifest.remove(sha256)
+
+        size = path.stat().st_size
+        print(f"[upload] Uploading {path.name} ({size / 1024 / 1024:.1f} MB)")
+        remote = files.upload(path, mime_type, progress)
+        uploaded = UploadedFile(
+            name=remote.name,
+            uri=remote.uri,
+            sha256=sha256,
+            mime_type=remote.mime_type or mime_type,
+            size_bytes=size,
+            expiration_time=remote.expiration_time,
+            source=str(path),
+        )
+        # Recorded while still PROCESSING, so a concurrent run waits on this file
+        # instead of uploading it again
+        manifest.put(uploaded)
+        return uploaded, remote.state
+
+
+def _finish(uploaded: UploadedFile, remote: RemoteFile, manifest: UploadManifest) -> UploadedFile:
+    if remote.state != "ACTIVE":
+        manifest.remove(uploaded.sha256)
+        raise RuntimeError(f"File processing failed for {uploaded.source or uploaded.name}: {remote.state}")
+    uploaded.expiration_time = remote.expiration_time or uploaded.expiration_time
+    return uploaded
+
+
+def upload_file(
+    client: Any,
+    path: Path,
+    mime_type: Optional[str] = None,
+    manifest: Optional[UploadManifest] = None,
+    progress: Optional[ProgressCallback] = print_progress,
+) -> UploadedFile:
+    """
+    Upload path unless the same content is already on the File API, and wait until it is ACTIVE.
+
+    client: google-genai Client, or None for the REST path (resumable, chunked,
+    mmap-backed, with progress). PROCESSING is polled with backoff.
+    """
+    path = Path(path)
+    manifest = manifest or get_upload_manifest()
+    files = _files_backend(client)
+    uploaded, state = _upload_or_reuse(files, path, mime_type, manifest, progress)
+
+    remote = RemoteFile(uploaded.name, uploaded.uri, state, expiration_time=uploaded.expiration_time)
+    delays = _poll_delays()
+    while remote.state == "PROCESSING":
+        check_deadline()
+        time.sleep(next(delays))
+        remote = files.get(uploaded.name)
+    return _finish(uploaded, remote, manifest)
+
+
+async def aupload_file(
+    path: Path,
+    mime_type: Optional[str] = None,
+    manifest: Optional[UploadManifest] = None,
+    client: Any = None,
+    progress: Optional[ProgressCallback] = print_progress,
+) -> UploadedFile:
+    """upload_file for asyncio: bytes go up in a worker thread, PROCESSING is awaited on the loop."""
+    path = Path(path)
+    manifest = manifest or get_upload_manifest()
+    files = _files_backend(client)
+    uploaded, state = await asyncio.to_thread(_upload_or_reuse, files, path, mime_type, manifest, progress)
+
+    remote = RemoteFile(uploaded.name, uploaded.uri, state, expiration_time=uploaded.expiration_time)
+    delays = _poll_delays()
+    while remote.state == "PROCESSING":
+        check_deadline()
+        await asyncio.sleep(next(delays))
+        remote = await asyncio.to_thread(files.get, uploaded.name)
+    return _finish(uploaded, remote, manifest)
+
+
+async def aupload_files(
+    paths: Sequence[Path],
+    mime_type: Optional[str] = None,
+    manifest: Optional[UploadManifest] = None,
+    client: Any = None,
+) -> List[UploadedFile]:
+    """Upload and wait for several files at once; results keep the input order."""
+    return list(
+        await asyncio.gather(
+            *[aupload_file(path, mime_type, manifest, client, progress=None) for path in paths]
+        )
+    )
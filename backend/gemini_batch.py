@@ -0,0 +1,370 @@
+"""
+Gemini Batch API for overnight text / image generation.
+
+- BatchJob collects generateContent requests under caller-chosen keys and
+  writes them to a JSONL file ({"key": ..., "request": {...}} per line)
+- submit(): uploads the JSONL through the File API and creates the batch
+  (models/{model}:batchGenerateContent)
+- wait(): polls batches/{id} with backoff until a terminal state
+- results(): downloads the responses file and maps each line back to its key
+- Job state is saved next to the JSONL, so a rerun resumes polling instead
+  of submitting the same work twice
+
+    job = BatchJob("wildmatch-images", model="gemini-3-pro-image-preview")
+    job.add_image("frame_1", prompt)
+    job.submit()
+    job.wait()
+    write_image_results(job.results(), {"frame_1": dest_path})
+
+Batch requests bypass the live rate limiter; they are billed and scheduled
+by the batch service. GEMINI_API_BASE_URL (gemini_utils) also points this
+module at a local stand-in for tests.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import gemini_utils
+from gemini_transport import GeminiTransport, get_transport
+from gemini_utils import GeminiCallResult, GeminiResponse, get_api_key, parse_gemini_response
+from image_cache import write_image
+from image_engine import persist_image, sniff_image_type
+
+DEFAULT_WORK_DIR = Path(__file__).resolve().parent / ".cache" / "batches"
+BATCH_API_VERSION = "v1beta"
+
+BATCH_TERMINAL_STATES = (
+    "BATCH_STATE_SUCCEEDED",
+    "BATCH_STATE_FAILED",
+    "BATCH_STATE_CANCELLED",
+    "BATCH_STATE_EXPIRED",
+)
+
+
+class BatchError(RuntimeError):
+    """A batch job could not be submitted or did not succeed."""
+
+
+# ============================================================================
+# REQUEST BUILDERS
+# ============================================================================
+
+
+def text_request(
+    prompt: str,
+    *,
+    system_prompt: Optional[str] = None,
+    response_mime_type: Optional[str] = None,
+    temperature: Optional[float] = None,
+) -> Dict[str, Any]:
+    """generateContent body for a plain text prompt."""
+    request: Dict[str, Any] = {
+        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+    }
+    generation_config: Dict[str, Any] = {}
+    if response_mime_type:
+        generation_config["responseMimeType"] = response_mime_type
+    if temperature is not None:
+        generation_config["temperature"] = temperature
+    if generation_config:
+        request["generationConfig"] = generation_config
+    if system_prompt:
+        request["systemInstruction"] = {"parts": [{"text": system_prompt}]}
+    return request
+
+
+def image_request(prompt: str) -> Dict[str, Any]:
+    """generateContent body matching storyboard.images.generate_image."""
+    return {
+        "contents": [{"role": "user", "parts": [{"text": f"Generate an image: {prompt}"}]}],
+        "generationConfig": {"responseModalities": ["IMAGE", "TEXT"]},
+    }
+
+
+# ============================================================================
+# RESULT HELPERS
+# ============================================================================
+
+
+def text_result(response: GeminiResponse) -> GeminiCallResult:
+    """Parse one batch response like a live call; raises RuntimeError on per-request errors."""
+    return parse_gemini_response(response, ok="error" not in response)
+
+
+def image_bytes(response: GeminiResponse) -> Optional[bytes]:
+    """First inline image of a batch response, decoded."""
+    for candidate in response.get("candidates") or []:
+        for part in (candidate.get("content") or {}).get("parts") or []:
+            inline = part.get("inlineData") or part.get("inline_data")
+            if inline and str(inline.get("mimeType", inline.get("mime_type", ""))).startswith("image/"):
+                return base64.b64decode(inline["data"])
+    return None
+
+
+def write_image_results(
+    results: Dict[str, GeminiResponse],
+    destinations: Dict[str, Path],
+) -> Dict[str, Optional[Path]]:
+    """
+    Write each key's image to its destination; None for keys without an image.
+
+    Like live images, dest is replaced (never written through, it may be a
+    hardlink into the image cache) and its extension follows the real image
+    type, so the returned path can differ from the one passed in.
+    """
+    written: Dict[str, Optional[Path]] = {}
+    for key, dest in destinations.items():
+        data = image_bytes(results.get(key) or {})
+        if data is not None and sniff_image_type(data[:16]) is None:
+            print(f"[batch] {key}: response is not a PNG, JPEG, WebP or GIF image")
+            data = None
+        if data is None:
+            written[key] = None
+            continue
+        write_image(data, dest)
+        written[key], _ = persist_image(Path(dest))
+    return written
+
+
+# ============================================================================
+# BATCH JOB
+# ============================================================================
+
+
+@dataclass
+class BatchJob:
+    display_name: str
+    model: str
+    work_dir: Path = DEFAULT_WORK_DIR
+    transport: Optional[GeminiTransport] = None
+    requests: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # Filled in by submit() / wait(); persisted in state_path
+    input_file: Optional[str] = None
+    batch_name: Optional[str] = None
+    state: Optional[str] = None
+    responses_file: Optional[str] = None
+    # sha256 of the submitted requests; a changed job is resubmitted, not resumed
+    submitted_digest: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        self.work_dir = Path(self.work_dir)
+        self._load_state()
+
+    # ---- files -------------------------------------------------------------
+
+    @property
+    def jsonl_path(self) -> Path:
+        return self.work_dir / f"{self.display_name}.jsonl"
+
+    @property
+    def state_path(self) -> Path:
+        return self.work_dir / f"{self.display_name}.batch.json"
+
+    def _load_state(self) -> None:
+        if not self.state_path.exists():
+            return
+        saved = json.loads(self.state_path.read_text(encoding="utf-8"))
+        if saved.get("model") != self.model:
+            return
+        self.input_file = saved.get("input_file")
+        self.batch_name = saved.get("batch_name")
+        self.state = saved.get("state")
+        self.responses_file = saved.get("responses_file")
+        self.submitted_digest = saved.get("requests_sha256")
+
+    def _save_state(self) -> None:
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.state_path.write_text(
+            json.dumps(
+                {
+                    "display_name": self.display_name,
+                    "model": self.model,
+                    "input_file": self.input_file,
+                    "batch_name": self.batch_name,
+                    "state": self.state,
+                    "responses_file": self.responses_file,
+                    "requests_sha256": self.submitted_digest,
+                },
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+
+    def reset(self) -> None:
+        """Forget a previous submission so the next submit() starts a new batch."""
+        self.input_file = self.batch_name = self.state = self.responses_file = None
+        self.submitted_digest = None
+        self.state_path.unlink(missing_ok=True)
+
+    # ---- requests ----------------------------------------------------------
+
+    def add(self, key: str, request: Dict[str, Any]) -> None:
+        if key in self.requests:
+            raise ValueError(f"Duplicate batch key: {key}")
+        self.requests[key] = request
+
+    def add_text(self, key: str, prompt: str, **kwargs: Any) -> None:
+        self.add(key, text_request(prompt, **kwargs))
+
+    def add_image(self, key: str, prompt: str) -> None:
+        self.add(key, image_request(prompt))
+
+    def requests_digest(self) -> str:
+        canonical = json.dumps(self.requests, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def write_jsonl(self) -> Path:
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        with self.jsonl_path.open("w", encoding="utf-8") as f:
+            for key, request in self.requests.items():
+                f.write(json.dumps({"key": key, "request": request}, ensure_ascii=False) + "\n")
+        return self.jsonl_path
+
+    # ---- API ---------------------------------------------------------------
+
+    def _url(self, path: str, query: str = "") -> str:
+        return f"{gemini_utils.GEMINI_API_BASE_URL}/{path}?{query}key={get_api_key()}"
+
+    def _call(self, method: str, url: str, **kwargs: Any) -> Any:
+        resp = (self.transport or get_transport()).request(
+            method, url, timeout=gemini_utils.REQUEST_TIMEOUT_SECONDS, **kwargs
+        )
+        if not resp.ok:
+            try:
+                result = resp.json()
+            except ValueError:
+                result = {}
+            gemini_utils.raise_for_api_error(result, ok=False, status_code=resp.status_code)
+        return resp
+
+    def _upload_input(self, path: Path) -> str:
+        """Upload the JSONL via the File API resumable protocol; returns files/..."""
+        data = path.read_bytes()
+        start = self._call(
+            "POST",
+            self._url(f"upload/{BATCH_API_VERSION}/files"),
+            headers={
+                "X-Goog-Upload-Protocol": "resumable",
+                "X-Goog-Upload-Command": "start",
+                "X-Goog-Upload-Header-Content-Length": str(len(data)),
+                "X-Goog-Upload-Header-Content-Type": "application/jsonl",
+                "Content-Type": "application/json",
+            },
+            data=json.dumps({"file": {"display_name": self.display_name}}),
+        )
+        upload_url = start.headers.get("X-Goog-Upload-URL")
+        if not upload_url:
+            raise BatchError("File API did not return an upload URL")
+        done = self._call(
+            "POST",
+            upload_url,
+            headers={
+                "X-Goog-Upload-Command": "upload, finalize",
+                "X-Goog-Upload-Offset": "0",
+                "Content-Length": str(len(data)),
+            },
+            data=data,
+        )
+        return done.json()["file"]["name"]
+
+    def submit(self) -> str:
+        """Write, upload and create the batch; a job already submitted is not resubmitted."""
+        if self.batch_name:
+            unchanged = self.submitted_digest == self.requests_digest()
+            if unchanged and self.state not in BATCH_TERMINAL_STATES[1:]:
+                print(f"[batch] {self.display_name}: resuming {self.batch_name}")
+                return self.batch_name
+            self.reset()
+        if not self.requests:
+            raise BatchError(f"Batch {self.display_name} has no requests")
+
+        self.input_file = self._upload_input(self.write_jsonl())
+        resp = self._call(
+            "POST",
+            self._url(f"{BATCH_API_VERSION}/models/{self.model}:batchGenerateContent"),
+            headers={"Content-Type": "application/json"},
+            data=json.dumps(
+                {
+                    "batch": {
+                        "display_name": self.display_name,
+                        "input_config": {"file_name": self.input_file},
+                    }
+                }
+            ),
+        )
+        self.batch_name = resp.json()["name"]
+        self.state = "BATCH_STATE_PENDING"
+        self.responses_file = None
+        self.submitted_digest = self.requests_digest()
+        self._save_state()
+        print(f"[batch] {self.display_name}: submitted {len(self.requests)} requests as {self.batch_name}")
+        return self.batch_name
+
+    def refresh(self) -> str:
+        """Fetch the batch state once."""
+        if not self.batch_name:
+            raise BatchError(f"Batch {self.display_name} has not been submitted")
+        operation = self._call("GET", self._url(f"{BATCH_API_VERSION}/{self.batch_name}")).json()
+        metadata = operation.get("metadata") or {}
+        self.state = metadata.get("state") or operation.get("state") or self.state
+        output = operation.get("response") or metadata.get("output") or {}
+        self.responses_file = output.get("responsesFile") or self.responses_file
+        self._save_state()
+        return self.state
+
+    def wait(
+        self,
+        *,
+        poll_interval: float = 30.0,
+        max_poll_interval: float = 300.0,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Poll until the batch reaches a terminal state; raises BatchError unless it succeeded."""
+        started = time.monotonic()
+        interval = poll_interval
+        while self.refresh() not in BATCH_TERMINAL_STATES:
+            if timeout is not None and time.monotonic() - started + interval > timeout:
+                raise BatchError(f"Batch {self.batch_name} still {self.state} after {timeout:.0f}s")
+            print(f"[batch] {self.display_name}: {self.state}, next check in {interval:.0f}s")
+            time.sleep(interval)
+            interval = min(max_poll_interval, interval * 1.5)
+
+        if self.state != "BATCH_STATE_SUCCEEDED":
+            raise BatchError(f"Batch {self.batch_name} ended in {self.state}")
+        return self.state
+
+    def results(self) -> Dict[str, GeminiResponse]:
+        """Download the responses file; key -> raw response (or {"error": ...})."""
+        if not self.responses_file:
+            raise BatchError(f"Batch {self.batch_name} has no responses file (state {self.state})")
+        resp = self._call(
+            "GET",
+            self._url(f"download/{BATCH_API_VERSION}/{self.responses_file}:download", "alt=media&"),
+        )
+        results: Dict[str, GeminiResponse] = {}
+        for line in resp.text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            key = entry.get("key") or (entry.get("metadata") or {}).get("key")
+            if "error" in entry:
+                results[key] = {"error": entry["error"]}
+            else:
+                results[key] = entry.get("response") or {}
+        missing: List[str] = [key for key in self.requests if key not in results]
+        if missing:
+            print(f"[batch] {self.display_name}: no response for {len(missing)} keys: {missing[:5]}")
+        return results
+
+    def run(self, **wait_kwargs: Any) -> Dict[str, GeminiResponse]:
+        """submit() + wait() + results()."""
+        self.submit()
+        self.wait(**wait_kwargs)
+        return self.results()
@@ -0,0 +1,286 @@
+"""
+Content-addressed response cache for Gemini text calls.
+
+- Key: sha256 of the model name plus the full generateContent request body
+  (system prompt, contents, tools, generationConfig, safety settings)
+- DiskResponseCache: one JSON file per key, TTL expiry, LRU eviction by total size
+- Single-flight: identical calls in flight at the same time share one upstream request
+- Hit / miss / coalesced / bypass counters
+
+gemini_utils.call_gemini and acall_gemini go through get_response_cache().
+By default only deterministic calls (temperature 0) are cached, so a creative
+call regenerates every time; pass use_cache=True to cache a call anyway (the
+walkthrough analysis does), use_cache=False to skip the cache, or set
+GEMINI_RESPONSE_CACHE=0 to turn it off for the process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "gemini_responses"
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def cache_key(model: str, request_body: Dict[str, Any]) -> str:
+    """Stable hash of a generateContent call."""
+    canonical = json.dumps(
+        {"model": model, "request": request_body},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+
+class ResponseCacheBackend(ABC):
+    """Storage interface; get() returns None on miss or expiry."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        ...
+
+
+class DiskResponseCache(ResponseCacheBackend):
+    """JSON files under `directory`, expired after `ttl_seconds`, LRU-evicted above `max_bytes`."""
+
+    def __init__(
+        self,
+        directory: Path = DEFAULT_CACHE_DIR,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> (size, last_used); rebuilt from disk on startup
+        self._index: Dict[str, Tuple[int, float]] = {}
+        self._total_bytes = 0
+        self._load_index()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _load_index(self) -> None:
+        if not self.directory.exists():
+            return
+        for path in self.directory.glob("*/*.json"):
+            stat = path.stat()
+            self._index[path.stem] = (stat.st_size, stat.st_mtime)
+            self._total_bytes += stat.st_size
+
+    def _drop(self, key: str) -> None:
+        size, _ = self._index.pop(key, (0, 0.0))
+        self._total_bytes -= size
+        self._path(key).unlink(missing_ok=True)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        with self._lock:
+            if key not in self._index:
+                return None
+            try:
+                entry = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                self._drop(key)
+                return None
+            if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+                self._drop(key)
+                return None
+            now = time.time()
+            self._index[key] = (self._index[key][0], now)
+            os.utime(path, (now, now))
+            return entry["value"]
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        path = self._path(key)
+        payload = json.dumps(
+            {"created_at": time.time(), "value": value}, ensure_ascii=False
+        ).encode("utf-8")
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(payload)
+            os.replace(tmp_path, path)
+            self._drop_index_only(key)
+            self._index[key] = (len(payload), time.time())
+            self._total_bytes += len(payload)
+            self._evict()
+
+    def _drop_index_only(self, key: str) -> None:
+        size, _ = self._index.pop(key, (0, 0.0))
+        self._total_bytes -= size
+
+    def _evict(self) -> None:
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._drop(key)
+            self.evictions += 1
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+
+# ============================================================================
+# CACHE + SINGLE-FLIGHT
+# ============================================================================
+
+
+class ResponseCache:
+    """Cache front-end with single-flight coalescing and counters."""
+
+    def __init__(self, backend: ResponseCacheBackend) -> None:
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._ainflight: Dict[str, asyncio.Future] = {}
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["evictions"] = getattr(self.backend, "evictions", 0)
+        return stats
+
+    @staticmethod
+    def _cacheable(result: Dict[str, Any]) -> bool:
+        return not result.get("was_filtered")
+
+    def get_or_call(
+        self,
+        key: str,
+        call: Callable[[], Dict[str, Any]],
+        *,
+        bypass: bool = False,
+    ) -> Dict[str, Any]:
+        """Return the cached result for key, or run call() once for all concurrent callers."""
+        if bypass:
+            self._count("bypassed")
+            return call()
+
+        cached = self.backend.get(key)
+        if cached is not None:
+            self._count("hits")
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self._counters["misses"] += 1
+            else:
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = call()
+            if self._cacheable(result):
+                self.backend.set(key, result)
+            future.set_result(result)
+            return result
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def aget_or_call(
+        self,
+        key: str,
+        call: Callable[[], Awaitable[Dict[str, Any]]],
+        *,
+        bypass: bool = False,
+    ) -> Dict[str, Any]:
+        """asyncio counterpart of get_or_call; coalesces within the running event loop."""
+        if bypass:
+            self._count("bypassed")
+            return await call()
+
+        cached = self.backend.get(key)
+        if cached is not None:
+            self._count("hits")
+            return cached
+
+        future = self._ainflight.get(key)
+        if future is not None and not future.done():
+            self._count("coalesced")
+            return await asyncio.shield(future)
+
+        self._count("misses")
+        future = asyncio.get_running_loop().create_future()
+        self._ainflight[key] = future
+        try:
+            result = await call()
+            if self._cacheable(result):
+                self.backend.set(key, result)
+            future.set_result(result)
+            return result
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark retrieved so waiterless failures do not log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            if self._ainflight.get(key) is future:
+                del self._ainflight[key]
+
+
+_cache: Optional[ResponseCache] = None
+_cache_configured = False
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Process-wide cache, or None when disabled (GEMINI_RESPONSE_CACHE=0)."""
+    global _cache, _cache_configured
+    if os.getenv("GEMINI_RESPONSE_CACHE", "1").lower() in ("0", "false", "no"):
+        return None
+    if not _cache_configured:
+        with _cache_lock:
+            if not _cache_configured:
+                directory = Path(os.getenv("GEMINI_RESPONSE_CACHE_DIR", str(DEFAULT_CACHE_DIR)))
+                _cache = ResponseCache(DiskResponseCache(directory))
+                _cache_configured = True
+    return _cache
+
+
+def configure_response_cache(cache: Optional[ResponseCache]) -> None:
+    """Install a different process-wide cache, or None to disable caching."""
+    global _cache, _cache_configured
+    with _cache_lock:
+        _cache = cache
+        _cache_configured = True
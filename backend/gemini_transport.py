@@ -0,0 +1,272 @@
+"""
+Pooled HTTP transport for Gemini REST calls.
+
+- One process-wide requests.Session with keep-alive connection pools
+- Configurable pool count, per-host pool size and per-host overrides
+- Connection counters, so we can see how often a TCP+TLS handshake is reused
+- An httpx.AsyncClient counterpart (one per event loop) for the async API
+
+gemini_utils.call_gemini / call_gemini_with_video use get_transport() by default,
+acall_gemini / acall_gemini_with_video use get_async_transport().
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Dict, Mapping, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# ============================================================================
+# CONFIG
+# ============================================================================
+
+DEFAULT_POOL_CONNECTIONS = int(os.getenv("GEMINI_HTTP_POOL_CONNECTIONS", "4"))
+DEFAULT_POOL_MAXSIZE = int(os.getenv("GEMINI_HTTP_POOL_MAXSIZE", "16"))
+
+
+@dataclass
+class TransportConfig:
+    # Number of per-host connection pools kept alive
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS
+    # Max keep-alive connections per host
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE
+    # Block when a host's pool is exhausted instead of opening throwaway connections
+    pool_block: bool = False
+    # Per-host pool size overrides, e.g. {"generativelanguage.googleapis.com": 32}
+    host_limits: Dict[str, int] = field(default_factory=dict)
+
+
+# ============================================================================
+# STATS
+# ============================================================================
+
+
+class TransportStats:
+    """Thread-safe request / connection counters, total and per host."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._requests: Dict[str, int] = {}
+        self._connections: Dict[str, int] = {}
+
+    def record_request(self, host: str) -> None:
+        with self._lock:
+            self._requests[host] = self._requests.get(host, 0) + 1
+
+    def record_connection(self, host: str) -> None:
+        with self._lock:
+            self._connections[host] = self._connections.get(host, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            hosts = sorted(set(self._requests) | set(self._connections))
+            per_host = {
+                host: {
+                    "requests": self._requests.get(host, 0),
+                    "connections_opened": self._connections.get(host, 0),
+                    "connections_reused": max(
+                        self._requests.get(host, 0) - self._connections.get(host, 0), 0
+                    ),
+                }
+                for host in hosts
+            }
+        return {
+            "requests": sum(h["requests"] for h in per_host.values()),
+            "connections_opened": sum(h["connections_opened"] for h in per_host.values()),
+            "connections_reused": sum(h["connections_reused"] for h in per_host.values()),
+            "hosts": per_host,
+        }
+
+
+def _counting_pool_classes(stats: TransportStats) -> Dict[str, type]:
+    """urllib3 pool classes that report every newly opened connection to stats."""
+
+    class _CountingHTTPConnectionPool(HTTPConnectionPool):
+        def _new_conn(self):  # type: ignore[override]
+            stats.record_connection(self.host)
+            return super()._new_conn()
+
+    class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+        def _new_conn(self):  # type: ignore[override]
+            stats.record_connection(self.host)
+            return super()._new_conn()
+
+    return {"http": _CountingHTTPConnectionPool, "https": _CountingHTTPSConnectionPool}
+
+
+class _CountingAdapter(HTTPAdapter):
+    def __init__(self, stats: TransportStats, **kwargs: Any) -> None:
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _counting_pool_classes(self._stats)
+
+
+# ============================================================================
+# TRANSPORT
+# ============================================================================
+
+
+class GeminiTransport:
+    """Keep-alive HTTP transport shared by all Gemini REST calls in the process."""
+
+    def __init__(self, config: Optional[TransportConfig] = None) -> None:
+        self.config = config or TransportConfig()
+        self.stats = TransportStats()
+        self.session = requests.Session()
+
+        default_adapter = self._make_adapter(self.config.pool_maxsize)
+        self.session.mount("https://", default_adapter)
+        self.session.mount("http://", default_adapter)
+        for host, maxsize in self.config.host_limits.items():
+            adapter = self._make_adapter(maxsize)
+            self.session.mount(f"https://{host}", adapter)
+            self.session.mount(f"http://{host}", adapter)
+
+    def _make_adapter(self, pool_maxsize: int) -> HTTPAdapter:
+        return _CountingAdapter(
+            self.stats,
+            pool_connections=self.config.pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=self.config.pool_block,
+        )
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        self.stats.record_request(requests.utils.urlparse(url).hostname or "")
+        return self.session.request(method, url, timeout=timeout, **kwargs)
+
+    def post(
+        self,
+        url: str,
+        *,
+        data: Any = None,
+        headers: Optional[Mapping[str, str]] = None,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        return self.request("POST", url, data=data, headers=headers, timeout=timeout, **kwargs)
+
+    def get(
+        self,
+        url: str,
+        *,
+        headers: Optional[Mapping[str, str]] = None,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        return self.request("GET", url, headers=headers, timeout=timeout, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_transport: Optional[GeminiTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> GeminiTransport:
+    """Return the process-wide transport, creating it on first use."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = GeminiTransport()
+    return _transport
+
+
+def configure_transport(config: Optional[TransportConfig] = None, **overrides: Any) -> GeminiTransport:
+    """Replace the process-wide transport, e.g. configure_transport(pool_maxsize=32)."""
+    global _transport
+    config = config or TransportConfig(**overrides)
+    with _transport_lock:
+        old, _transport = _transport, GeminiTransport(config)
+    if old is not None:
+        old.close()
+    return _transport
+
+
+def transport_stats() -> Dict[str, Any]:
+    """Counters of the process-wide transport."""
+    return get_transport().stats.snapshot()
+
+
+# ============================================================================
+# ASYNC TRANSPORT
+# ============================================================================
+
+
+class AsyncGeminiTransport:
+    """httpx.AsyncClient with the same pool limits and counters as GeminiTransport.
+
+    httpx connection pools are bound to the event loop that created them, so use
+    get_async_transport() to get the instance for the running loop.
+    """
+
+    def __init__(self, config: Optional[TransportConfig] = None) -> None:
+        self.config = config or TransportConfig()
+        self.stats = TransportStats()
+        # httpx limits are per client, so the largest per-host override bounds the pool
+        max_per_host = max([self.config.pool_maxsize, *self.config.host_limits.values()])
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_per_host * self.config.pool_connections,
+                max_keepalive_connections=max_per_host,
+            ),
+        )
+
+    def _trace_for(self, host: str):
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                self.stats.record_connection(host)
+
+        return trace
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        host = httpx.URL(url).host
+        self.stats.record_request(host)
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions.setdefault("trace", self._trace_for(host))
+        return await self.client.request(method, url, extensions=extensions, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+_async_transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncGeminiTransport]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_transport() -> AsyncGeminiTransport:
+    """Return the async transport bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _transport_lock:
+        transport = _async_transports.get(loop)
+        if transport is None:
+            config = _transport.config if _transport is not None else None
+            transport = AsyncGeminiTransport(config)
+            _async_transports[loop] = transport
+    return transport
@@ -5,6 +5,14 @@ Shared Gemini API utilities in Python
 - 支持 thinkingConfig
 - 支持视频分辨率设置
 - 解析文本输出与 tool call
+- 通过 gemini_transport 复用 keep-alive 连接池
+- 支持 asyncio 与 streamGenerateContent 流式调用
+- 相同请求走 gemini_cache 本地响应缓存 (默认只缓存 temperature=0 的调用, use_cache 可覆盖)
+- 多轮追问时 system prompt + 视频走服务端 cachedContents
+- 所有请求按 model 经过 rate_limiter 的 RPM / 并发限制
+- 超时服从 deadlines 传下来的请求截止时间
+- usageMetadata 解析进 result["usage"], 并记入 cost_ledger
+- 视频可以换成带时间戳的关键帧图片 (video_frames, 见 keyframes.py)
 
 可以作为 walkthrough analysis 模块的基础, analyze_walkthrough_for_ads 的输出
 可以直接喂给后续的 ads research agent。
@@ -14,10 +22,36 @@ from __future__ import annotations
 
 import os
 import json
+import asyncio
+import base64
+import hashlib
 import logging
-from typing import Any, Dict, List, Literal, Optional, TypedDict
-
-import requests
+import threading
+import time
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    TypedDict,
+)
+
+from cost_ledger import track_call, usage_counters
+from deadlines import request_timeout
+from gemini_cache import cache_key, get_response_cache
+from gemini_transport import (
+    AsyncGeminiTransport,
+    GeminiTransport,
+    get_async_transport,
+    get_transport,
+)
+from json_sections import JsonSectionParser
+from rate_limiter import get_rate_limiter
 
 # ============================================================================
 # TYPES
@@ -25,6 +59,8 @@ import requests
 
 ThinkingLevel = Literal["none", "low", "high"]
 MediaResolution = Literal["low", "medium", "high"]
+# (start_sec, end_sec) 视频片段
+VideoClip = Tuple[float, float]
 
 
 class ToolCall(TypedDict):
@@ -39,6 +75,26 @@ class GeminiCallResult(TypedDict, total=False):
     finish_reason: Optional[str]
     was_filtered: bool
     filter_reason: Optional[str]
+    # prompt_tokens / output_tokens / thinking_tokens / cached_tokens (usageMetadata)
+    usage: Dict[str, int]
+
+
+class GeminiStreamEvent(TypedDict, total=False):
+    type: Literal["text", "tool_call", "thought_signature", "section", "done"]
+    text: str
+    tool_call: ToolCall
+    thought_signature: str
+    section: str
+    value: Any
+    result: GeminiCallResult
+
+
+class VideoFrame(TypedDict):
+    """视频里的一帧 (关键帧模式), 代替 fileData 视频 part 发送"""
+
+    timestamp_sec: float
+    mime_type: str
+    data: bytes
 
 
 GeminiResponse = Dict[str, Any]
@@ -55,6 +111,17 @@ PERMISSIVE_SAFETY_SETTINGS: List[Dict[str, str]] = [
     {"category": "HARM_CATEGORY_CIVIC_INTEGRITY", "threshold": "BLOCK_NONE"},
 ]
 
+TOOL_CONFIG_AUTO: Dict[str, Any] = {
+    "functionCallingConfig": {"mode": "AUTO"},
+}
+
+GEMINI_API_BASE_URL = os.getenv(
+    "GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com"
+)
+
+# 单次请求超时上限; 外层 deadlines.deadline() 剩余时间更短时以剩余时间为准
+REQUEST_TIMEOUT_SECONDS = 120
+
 logger = logging.getLogger(__name__)
 
 # ============================================================================
@@ -97,19 +164,46 @@ def build_video_part(
     video_uri: str,
     model: str,
     media_resolution: MediaResolution = "low",
+    video_clip: Optional[VideoClip] = None,
 ) -> Dict[str, Any]:
- 
+    """video_clip: (start_sec, end_sec), 只让模型看这一段 (videoMetadata offsets)"""
     video_part: Dict[str, Any] = {
         "fileData": {
             "mimeType": "video/mp4",
             "fileUri": video_uri,
         }
     }
+    if video_clip is not None:
+        start, end = video_clip
+        video_part["videoMetadata"] = {"startOffset": f"{start:g}s", "endOffset": f"{end:g}s"}
     if is_gemini3_model(model):
         video_part["mediaResolution"] = {"level": map_media_resolution(media_resolution)}
     return video_part
 
 
+def build_frame_parts(frames: List[VideoFrame]) -> List[Dict[str, Any]]:
+    """关键帧 -> inlineData 图片 part, 每帧前面一个时间戳文本 part"""
+    parts: List[Dict[str, Any]] = [
+        {
+            "text": (
+                f"The walkthrough video is given as {len(frames)} keyframes in order, "
+                "each preceded by its timestamp in the video."
+            )
+        }
+    ]
+    for frame in frames:
+        parts.append({"text": f"[t={frame['timestamp_sec']:.1f}s]"})
+        parts.append(
+            {
+                "inlineData": {
+                    "mimeType": frame["mime_type"],
+                    "data": base64.b64encode(frame["data"]).decode("ascii"),
+                }
+            }
+        )
+    return parts
+
+
 def build_generation_config(
     model: str,
     temperature: float = 0.7,
@@ -137,7 +231,7 @@ def build_generation_config(
 # ============================================================================
 
 
-def call_gemini(
+def build_request_body(
     *,
     system_prompt: str,
     contents: List[Dict[str, Any]],
@@ -147,15 +241,9 @@ def call_gemini(
     thinking_level: ThinkingLevel = "low",
     temperature: float = 0.7,
     max_output_tokens: int = 8192,
-) -> GeminiCallResult:
-
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise RuntimeError("Environment variable GOOGLE_API_KEY is not set")
-
-    api_version = get_api_version(model)
-    logger.info("Calling Gemini model %s (%s)", model, api_version)
-
+    cached_content: Optional[str] = None,
+) -> Dict[str, Any]:
+    """构建 generateContent 请求体"""
     request_body: Dict[str, Any] = {
         "systemInstruction": {
             "parts": [{"text": system_prompt}],
@@ -171,38 +259,71 @@ def call_gemini(
         "safetySettings": PERMISSIVE_SAFETY_SETTINGS,
     }
 
+    if cached_content:
+        # systemInstruction / tools 已在 cachedContent 中, 请求里不能再带
+        del request_body["systemInstruction"]
+        request_body["cachedContent"] = cached_content
+        return request_body
+
     if tools:
         request_body["tools"] = tools
-        request_body["toolConfig"] = {
-            "functionCallingConfig": {"mode": "AUTO"},
-        }
+        request_body["toolConfig"] = TOOL_CONFIG_AUTO
 
-    url = (
-        f"https://generativelanguage.googleapis.com/"
-        f"{api_version}/models/{model}:generateContent?key={api_key}"
-    )
+    return request_body
+
+
+def get_api_key() -> str:
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise RuntimeError("Environment variable GOOGLE_API_KEY is not set")
+    return api_key
+
+
+def _use_response_cache(use_cache: Optional[bool], temperature: float) -> bool:
+    """use_cache=None: 只缓存 temperature=0 的确定性调用; 有随机性的创作调用每次都重新生成"""
+    if use_cache is None:
+        return temperature == 0
+    return use_cache
+
+
+def build_model_url(model: str, method: str = "generateContent") -> str:
+    """构建模型方法的 URL (带 API key)"""
+    api_key = get_api_key()
 
-    resp = requests.post(
-        url,
-        headers={"Content-Type": "application/json"},
-        data=json.dumps(request_body),
-        timeout=120,
+    api_version = get_api_version(model)
+    logger.info("Calling Gemini model %s (%s)", model, api_version)
+
+    return (
+        f"{GEMINI_API_BASE_URL}/"
+        f"{api_version}/models/{model}:{method}?key={api_key}"
     )
 
-    try:
-        result: GeminiResponse = resp.json()
-    except Exception as exc:  # noqa: BLE001
-        logger.error("Gemini API response is not valid JSON: %s", exc)
-        raise RuntimeError(f"Invalid JSON from Gemini: {resp.text[:500]}") from exc
-
-    if not resp.ok or "error" in result:
-        logger.error("Gemini API error: %s", result.get("error") or resp.status_code)
-        message = (
-            result.get("error", {}).get("message")
-            if isinstance(result.get("error"), dict)
-            else None
-        )
-        raise RuntimeError(message or f"Gemini API error: {resp.status_code}")
+
+def raise_for_api_error(
+    result: GeminiResponse,
+    *,
+    ok: bool = True,
+    status_code: int = 200,
+) -> None:
+    """响应为错误时抛出 RuntimeError (带 API 返回的 message 与 status_code)"""
+    if not ok or "error" in result:
+        logger.error("Gemini API error: %s", result.get("error") or status_code)
+        error = result.get("error") if isinstance(result.get("error"), dict) else {}
+        exc = RuntimeError(error.get("message") or f"Gemini API error: {status_code}")
+        # rate_limiter 靠 status_code == 429 识别限流
+        exc.status_code = error.get("code") or status_code  # type: ignore[attr-defined]
+        raise exc
+
+
+def parse_gemini_response(
+    result: GeminiResponse,
+    *,
+    ok: bool = True,
+    status_code: int = 200,
+) -> GeminiCallResult:
+    """把 generateContent 的 JSON 响应解析为 GeminiCallResult"""
+    raise_for_api_error(result, ok=ok, status_code=status_code)
+    usage = usage_counters(result.get("usageMetadata"))
 
     prompt_feedback = result.get("promptFeedback") or {}
     block_reason = prompt_feedback.get("blockReason")
@@ -213,6 +334,7 @@ def call_gemini(
             tool_calls=[],
             was_filtered=True,
             filter_reason=block_reason,
+            usage=usage,
         )
 
     candidates = result.get("candidates") or []
@@ -232,6 +354,7 @@ def call_gemini(
             was_filtered=True,
             filter_reason="SAFETY",
             finish_reason="SAFETY",
+            usage=usage,
         )
 
     text_parts: List[str] = []
@@ -268,35 +391,98 @@ def call_gemini(
         tool_calls=tool_calls,
         thought_signature=thought_signature,
         finish_reason=candidate.get("finishReason"),
+        usage=usage,
     )
 
 
-def call_gemini_with_video(
+def _decode_json_response(raw_text: str, json_fn: Any) -> GeminiResponse:
+    try:
+        return json_fn()
+    except Exception as exc:  # noqa: BLE001
+        logger.error("Gemini API response is not valid JSON: %s", exc)
+        raise RuntimeError(f"Invalid JSON from Gemini: {raw_text[:500]}") from exc
+
+
+def call_gemini(
     *,
-    video_uri: str,
     system_prompt: str,
-    user_message: str,
+    contents: List[Dict[str, Any]],
     model: str,
     tools: Optional[List[Dict[str, Any]]] = None,
     media_resolution: MediaResolution = "low",
     thinking_level: ThinkingLevel = "low",
-    previous_messages: Optional[List[Dict[str, Optional[str]]]] = None,
+    temperature: float = 0.7,
+    max_output_tokens: int = 8192,
+    transport: Optional[GeminiTransport] = None,
+    use_cache: Optional[bool] = None,
+    cached_content: Optional[str] = None,
 ) -> GeminiCallResult:
+    """
+    use_cache: 是否走 gemini_cache 响应缓存。None (默认) 表示只缓存 temperature=0
+        的调用; 分析类调用传 True, 想重新生成时传 False。
+    """
+
+    url = build_model_url(model)
+    request_body = build_request_body(
+        system_prompt=system_prompt,
+        contents=contents,
+        model=model,
+        tools=tools,
+        media_resolution=media_resolution,
+        thinking_level=thinking_level,
+        temperature=temperature,
+        max_output_tokens=max_output_tokens,
+        cached_content=cached_content,
+    )
+
+    def _post() -> GeminiCallResult:
+        with get_rate_limiter().slot(model), track_call(model) as call:
+            resp = (transport or get_transport()).post(
+                url,
+                headers={"Content-Type": "application/json"},
+                data=json.dumps(request_body),
+                timeout=request_timeout(REQUEST_TIMEOUT_SECONDS),
+            )
+
+            result = _decode_json_response(resp.text, resp.json)
+            call.add_usage(result.get("usageMetadata"))
+            return parse_gemini_response(result, ok=resp.ok, status_code=resp.status_code)
+
+    cache = get_response_cache()
+    if cache is None:
+        return _post()
+    return cache.get_or_call(
+        cache_key(model, request_body), _post, bypass=not _use_response_cache(use_cache, temperature)
+    )
 
+
+def build_video_contents(
+    *,
+    video_uri: str,
+    user_message: str,
+    model: str,
+    media_resolution: MediaResolution = "low",
+    previous_messages: Optional[List[Dict[str, Optional[str]]]] = None,
+    include_video: bool = True,
+    video_clip: Optional[VideoClip] = None,
+    video_frames: Optional[List[VideoFrame]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    构建 视频 + 用户消息 + 历史对话 的 contents。
+    include_video=False 时视频已在 cachedContent 中, 第一轮只带文本。
+    video_frames 不为空时发送关键帧图片, 不发送 fileData 视频。
+    """
     if previous_messages is None:
         previous_messages = []
 
     contents: List[Dict[str, Any]] = []
 
-    contents.append(
-        {
-            "role": "user",
-            "parts": [
-                build_video_part(video_uri, model, media_resolution),
-                {"text": user_message},
-            ],
-        }
-    )
+    first_parts: List[Dict[str, Any]] = [{"text": user_message}]
+    if video_frames:
+        first_parts = build_frame_parts(video_frames) + first_parts
+    elif include_video:
+        first_parts.insert(0, build_video_part(video_uri, model, media_resolution, video_clip))
+    contents.append({"role": "user", "parts": first_parts})
 
     for msg in previous_messages:
         role = msg.get("role", "user")
@@ -309,6 +495,61 @@ def call_gemini_with_video(
 
         contents.append({"role": role, "parts": parts})
 
+    return contents
+
+
+def call_gemini_with_video(
+    *,
+    video_uri: str,
+    system_prompt: str,
+    user_message: str,
+    model: str,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    media_resolution: MediaResolution = "low",
+    thinking_level: ThinkingLevel = "low",
+    previous_messages: Optional[List[Dict[str, Optional[str]]]] = None,
+    transport: Optional[GeminiTransport] = None,
+    use_cache: Optional[bool] = None,
+    use_context_cache: Optional[bool] = None,
+    video_clip: Optional[VideoClip] = None,
+    video_frames: Optional[List[VideoFrame]] = None,
+) -> GeminiCallResult:
+    """
+    use_cache: 同 call_gemini; 这里 temperature 固定为默认值, 所以 None 表示不缓存。
+    use_context_cache: 是否把 system prompt + 视频放进服务端 cachedContent。
+        None (默认) 表示只在多轮追问 (previous_messages 非空) 时使用。
+    video_clip: (start_sec, end_sec), 只分析视频的这一段; 不走 cachedContent
+    video_frames: 关键帧模式, 用带时间戳的图片代替视频 (video_uri 可以为空); 不走 cachedContent
+    """
+
+    if use_context_cache is None:
+        use_context_cache = bool(previous_messages)
+    if video_clip is not None or video_frames:
+        # cachedContent 里是整段视频
+        use_context_cache = False
+
+    cached_content = None
+    if use_context_cache:
+        cached_content = _try_context_cache(
+            get_context_cache_manager().get_or_create,
+            video_uri=video_uri,
+            system_prompt=system_prompt,
+            model=model,
+            tools=tools,
+            media_resolution=media_resolution,
+        )
+
+    contents = build_video_contents(
+        video_uri=video_uri,
+        user_message=user_message,
+        model=model,
+        media_resolution=media_resolution,
+        previous_messages=previous_messages,
+        include_video=cached_content is None,
+        video_clip=video_clip,
+        video_frames=video_frames,
+    )
+
     return call_gemini(
         system_prompt=system_prompt,
         contents=contents,
@@ -316,8 +557,573 @@ def call_gemini_with_video(
         model=model,
         media_resolution=media_resolution,
         thinking_level=thinking_level,
+        transport=transport,
+        use_cache=use_cache,
+        cached_content=cached_content,
+    )
+
+
+# ============================================================================
+# ASYNC API CALLS
+# ============================================================================
+
+
+async def acall_gemini(
+    *,
+    system_prompt: str,
+    contents: List[Dict[str, Any]],
+    model: str,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    media_resolution: MediaResolution = "low",
+    thinking_level: ThinkingLevel = "low",
+    temperature: float = 0.7,
+    max_output_tokens: int = 8192,
+    transport: Optional[AsyncGeminiTransport] = None,
+    use_cache: Optional[bool] = None,
+    cached_content: Optional[str] = None,
+) -> GeminiCallResult:
+    """call_gemini 的 asyncio 版本, 不占用线程"""
+
+    url = build_model_url(model)
+    request_body = build_request_body(
+        system_prompt=system_prompt,
+        contents=contents,
+        model=model,
+        tools=tools,
+        media_resolution=media_resolution,
+        thinking_level=thinking_level,
+        temperature=temperature,
+        max_output_tokens=max_output_tokens,
+        cached_content=cached_content,
+    )
+
+    async def _post() -> GeminiCallResult:
+        async with get_rate_limiter().aslot(model):
+            with track_call(model) as call:
+                resp = await (transport or get_async_transport()).post(
+                    url,
+                    headers={"Content-Type": "application/json"},
+                    content=json.dumps(request_body),
+                    timeout=request_timeout(REQUEST_TIMEOUT_SECONDS),
+                )
+                result = _decode_json_response(resp.text, resp.json)
+                call.add_usage(result.get("usageMetadata"))
+                return parse_gemini_response(
+                    result, ok=resp.is_success, status_code=resp.status_code
+                )
+
+    cache = get_response_cache()
+    if cache is None:
+        return await _post()
+    return await cache.aget_or_call(
+        cache_key(model, request_body), _post, bypass=not _use_response_cache(use_cache, temperature)
+    )
+
+
+async def acall_gemini_with_video(
+    *,
+    video_uri: str,
+    system_prompt: str,
+    user_message: str,
+    model: str,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    media_resolution: MediaResolution = "low",
+    thinking_level: ThinkingLevel = "low",
+    previous_messages: Optional[List[Dict[str, Optional[str]]]] = None,
+    transport: Optional[AsyncGeminiTransport] = None,
+    use_cache: Optional[bool] = None,
+    use_context_cache: Optional[bool] = None,
+    video_clip: Optional[VideoClip] = None,
+    video_frames: Optional[List[VideoFrame]] = None,
+) -> GeminiCallResult:
+    """call_gemini_with_video 的 asyncio 版本"""
+
+    if use_context_cache is None:
+        use_context_cache = bool(previous_messages)
+    if video_clip is not None or video_frames:
+        use_context_cache = False
+
+    cached_content = None
+    if use_context_cache:
+        # cachedContent 每次上传只注册一次, 复用同步的 manager 即可
+        cached_content = await asyncio.to_thread(
+            _try_context_cache,
+            get_context_cache_manager().get_or_create,
+            video_uri=video_uri,
+            system_prompt=system_prompt,
+            model=model,
+            tools=tools,
+            media_resolution=media_resolution,
+        )
+
+    contents = build_video_contents(
+        video_uri=video_uri,
+        user_message=user_message,
+        model=model,
+        media_resolution=media_resolution,
+        previous_messages=previous_messages,
+        include_video=cached_content is None,
+        video_clip=video_clip,
+        video_frames=video_frames,
+    )
+
+    return await acall_gemini(
+        system_prompt=system_prompt,
+        contents=contents,
+        tools=tools,
+        model=model,
+        media_resolution=media_resolution,
+        thinking_level=thinking_level,
+        transport=transport,
+        use_cache=use_cache,
+        cached_content=cached_content,
+    )
+
+
+# ============================================================================
+# CONTEXT CACHING (cachedContents)
+# ============================================================================
+
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+# 剩余寿命低于该值时续期
+CONTEXT_CACHE_RENEW_MARGIN_SECONDS = 300
+
+
+@dataclass
+class CachedContentHandle:
+    name: str
+    model: str
+    expires_at: float
+
+
+class ContextCacheManager:
+    """
+    管理服务端 cachedContents: 每个 (模型, 视频, system prompt, tools) 只注册一次,
+    快过期时通过 PATCH ttl 续期, 过期后重新创建。寿命在本地按 ttl 计算。
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS,
+        renew_margin_seconds: int = CONTEXT_CACHE_RENEW_MARGIN_SECONDS,
+        transport: Optional[GeminiTransport] = None,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.renew_margin_seconds = renew_margin_seconds
+        self.transport = transport
+        self._handles: Dict[str, CachedContentHandle] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def _key(
+        model: str,
+        video_uri: str,
+        system_prompt: str,
+        tools: Optional[List[Dict[str, Any]]],
+        media_resolution: MediaResolution,
+    ) -> str:
+        raw = json.dumps(
+            [model, video_uri, system_prompt, tools, media_resolution], sort_keys=True
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _url(self, model: str, path: str, query: str = "") -> str:
+        return (
+            f"{GEMINI_API_BASE_URL}/{get_api_version(model)}/{path}"
+            f"?{query}key={get_api_key()}"
+        )
+
+    def _request(self, method: str, url: str, body: Optional[Dict[str, Any]] = None) -> GeminiResponse:
+        resp = (self.transport or get_transport()).request(
+            method,
+            url,
+            headers={"Content-Type": "application/json"},
+            data=json.dumps(body) if body is not None else None,
+            timeout=request_timeout(REQUEST_TIMEOUT_SECONDS),
+        )
+        result = _decode_json_response(resp.text, resp.json) if resp.text else {}
+        raise_for_api_error(result, ok=resp.ok, status_code=resp.status_code)
+        return result
+
+    def get_or_create(
+        self,
+        *,
+        video_uri: str,
+        system_prompt: str,
+        model: str,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        media_resolution: MediaResolution = "low",
+    ) -> str:
+        """返回可用的 cachedContent 名称 (cachedContents/...)"""
+        key = self._key(model, video_uri, system_prompt, tools, media_resolution)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            handle = self._handles.get(key)
+            now = time.time()
+            if handle is not None and handle.expires_at - now > self.renew_margin_seconds:
+                return handle.name
+
+            if handle is not None and handle.expires_at > now:
+                try:
+                    self._renew(handle)
+                    return handle.name
+                except RuntimeError as exc:
+                    logger.warning("Renewing %s failed, recreating: %s", handle.name, exc)
+
+            handle = self._create(
+                video_uri=video_uri,
+                system_prompt=system_prompt,
+                model=model,
+                tools=tools,
+                media_resolution=media_resolution,
+            )
+            self._handles[key] = handle
+            return handle.name
+
+    def _create(
+        self,
+        *,
+        video_uri: str,
+        system_prompt: str,
+        model: str,
+        tools: Optional[List[Dict[str, Any]]],
+        media_resolution: MediaResolution,
+    ) -> CachedContentHandle:
+        body: Dict[str, Any] = {
+            "model": f"models/{model}",
+            "systemInstruction": {"parts": [{"text": system_prompt}]},
+            "contents": [
+                {
+                    "role": "user",
+                    "parts": [build_video_part(video_uri, model, media_resolution)],
+                }
+            ],
+            "ttl": f"{self.ttl_seconds}s",
+        }
+        if tools:
+            body["tools"] = tools
+            body["toolConfig"] = TOOL_CONFIG_AUTO
+
+        result = self._request("POST", self._url(model, "cachedContents"), body)
+        logger.info("Created Gemini cached content %s for %s", result["name"], video_uri)
+        return CachedContentHandle(
+            name=result["name"],
+            model=model,
+            expires_at=time.time() + self.ttl_seconds,
+        )
+
+    def _renew(self, handle: CachedContentHandle) -> None:
+        self._request(
+            "PATCH",
+            self._url(handle.model, handle.name, "updateMask=ttl&"),
+            {"ttl": f"{self.ttl_seconds}s"},
+        )
+        handle.expires_at = time.time() + self.ttl_seconds
+        logger.info("Renewed Gemini cached content %s", handle.name)
+
+    def release_all(self) -> None:
+        """删除本进程注册的所有 cachedContents (不再追问时调用, 停止存储计费)"""
+        with self._lock:
+            handles, self._handles = list(self._handles.values()), {}
+        for handle in handles:
+            if handle.expires_at <= time.time():
+                continue
+            try:
+                self._request("DELETE", self._url(handle.model, handle.name))
+            except RuntimeError as exc:
+                logger.warning("Deleting %s failed: %s", handle.name, exc)
+
+
+_context_cache_manager: Optional[ContextCacheManager] = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache_manager() -> ContextCacheManager:
+    """进程级 ContextCacheManager"""
+    global _context_cache_manager
+    with _context_cache_lock:
+        if _context_cache_manager is None:
+            _context_cache_manager = ContextCacheManager()
+    return _context_cache_manager
+
+
+def _try_context_cache(get_or_create: Any, **kwargs: Any) -> Optional[str]:
+    """注册 cachedContent; 失败时 (如 token 数不够最小值) 退回普通请求"""
+    try:
+        return get_or_create(**kwargs)
+    except RuntimeError as exc:
+        logger.warning("Gemini context caching unavailable, sending full request: %s", exc)
+        return None
+
+
+# ============================================================================
+# STREAMING API CALLS
+# ============================================================================
+
+
+class GeminiStreamAccumulator:
+    """
+    逐个 chunk 消费 streamGenerateContent 的 SSE 响应,
+    产出增量事件, 并在结束时拼出与 call_gemini 相同的 GeminiCallResult。
+    """
+
+    def __init__(self) -> None:
+        self.text_parts: List[str] = []
+        self.tool_calls: List[ToolCall] = []
+        self.thought_signature: Optional[str] = None
+        self.finish_reason: Optional[str] = None
+        self.block_reason: Optional[str] = None
+        self.saw_candidate = False
+        # 每个 chunk 都带累计的 usageMetadata, 保留最后一个
+        self.usage_metadata: Dict[str, Any] = {}
+        self.usage: Dict[str, int] = {}
+
+    def feed(self, chunk: GeminiResponse) -> List[GeminiStreamEvent]:
+        if "error" in chunk:
+            parse_gemini_response(chunk)
+
+        events: List[GeminiStreamEvent] = []
+        if chunk.get("usageMetadata"):
+            self.usage_metadata = chunk["usageMetadata"]
+            self.usage = usage_counters(self.usage_metadata)
+        block_reason = (chunk.get("promptFeedback") or {}).get("blockReason")
+        if block_reason:
+            logger.warning("Gemini API prompt blocked: %s", block_reason)
+            self.block_reason = block_reason
+
+        candidates = chunk.get("candidates") or []
+        if not candidates:
+            return events
+        self.saw_candidate = True
+
+        candidate = candidates[0]
+        if candidate.get("finishReason"):
+            self.finish_reason = candidate["finishReason"]
+
+        for part in (candidate.get("content") or {}).get("parts") or []:
+            if part.get("text") and not part.get("thought"):
+                self.text_parts.append(part["text"])
+                events.append(GeminiStreamEvent(type="text", text=part["text"]))
+
+            if part.get("functionCall"):
+                fn = part["functionCall"]
+                if fn.get("name"):
+                    logger.info("Gemini API function call: %s", fn["name"])
+                    call = ToolCall(name=fn["name"], args=fn.get("args") or {})
+                    self.tool_calls.append(call)
+                    events.append(GeminiStreamEvent(type="tool_call", tool_call=call))
+
+            if part.get("thoughtSignature"):
+                self.thought_signature = part["thoughtSignature"]
+                events.append(
+                    GeminiStreamEvent(
+                        type="thought_signature",
+                        thought_signature=part["thoughtSignature"],
+                    )
+                )
+
+        return events
+
+    def result(self) -> GeminiCallResult:
+        if self.block_reason:
+            return GeminiCallResult(
+                text="",
+                tool_calls=[],
+                was_filtered=True,
+                filter_reason=self.block_reason,
+                usage=self.usage,
+            )
+
+        if not self.saw_candidate:
+            logger.error("Gemini API returned no candidates")
+            raise RuntimeError(
+                "No response from Gemini. Try a shorter video. lower quality. "
+                "or simplify your request."
+            )
+
+        if self.finish_reason == "SAFETY":
+            logger.warning("Gemini API response filtered for safety")
+            return GeminiCallResult(
+                text="",
+                tool_calls=[],
+                was_filtered=True,
+                filter_reason="SAFETY",
+                finish_reason="SAFETY",
+                usage=self.usage,
+            )
+
+        full_text = "".join(self.text_parts)
+        logger.info(
+            "Gemini API stream finished. text length=%d. tool calls=%d",
+            len(full_text),
+            len(self.tool_calls),
+        )
+        return GeminiCallResult(
+            text=full_text,
+            tool_calls=self.tool_calls,
+            thought_signature=self.thought_signature,
+            finish_reason=self.finish_reason,
+            usage=self.usage,
+        )
+
+
+def _parse_sse_line(line: str) -> Optional[GeminiResponse]:
+    """解析一行 SSE, 只处理 data: 行"""
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data:
+        return None
+    try:
+        return json.loads(data)
+    except json.JSONDecodeError as exc:
+        logger.error("Gemini API stream chunk is not valid JSON: %s", exc)
+        raise RuntimeError(f"Invalid JSON from Gemini stream: {data[:500]}") from exc
+
+
+def stream_gemini(
+    *,
+    system_prompt: str,
+    contents: List[Dict[str, Any]],
+    model: str,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    media_resolution: MediaResolution = "low",
+    thinking_level: ThinkingLevel = "low",
+    temperature: float = 0.7,
+    max_output_tokens: int = 8192,
+    transport: Optional[GeminiTransport] = None,
+) -> Iterator[GeminiStreamEvent]:
+    """
+    call_gemini 的流式版本 (streamGenerateContent + SSE)。
+
+    依次 yield "text" / "tool_call" / "thought_signature" 事件,
+    最后 yield 一个 "done" 事件, 其 result 与 call_gemini 的返回值相同。
+    """
+
+    url = build_model_url(model, "streamGenerateContent") + "&alt=sse"
+    request_body = build_request_body(
+        system_prompt=system_prompt,
+        contents=contents,
+        model=model,
+        tools=tools,
+        media_resolution=media_resolution,
+        thinking_level=thinking_level,
+        temperature=temperature,
+        max_output_tokens=max_output_tokens,
+    )
+
+    # 流式请求在整个读取期间都占用 rate limiter 的并发名额
+    with get_rate_limiter().slot(model), track_call(model) as call:
+        resp = (transport or get_transport()).post(
+            url,
+            headers={"Content-Type": "application/json"},
+            data=json.dumps(request_body),
+            timeout=request_timeout(REQUEST_TIMEOUT_SECONDS),
+            stream=True,
+        )
+
+        with resp:
+            if not resp.ok:
+                result = _decode_json_response(resp.text, resp.json)
+                parse_gemini_response(result, ok=False, status_code=resp.status_code)
+
+            acc = GeminiStreamAccumulator()
+            for line in resp.iter_lines(decode_unicode=True):
+                chunk = _parse_sse_line(line or "")
+                if chunk is not None:
+                    yield from acc.feed(chunk)
+        call.add_usage(acc.usage_metadata)
+
+    yield GeminiStreamEvent(type="done", result=acc.result())
+
+
+def stream_gemini_with_video(
+    *,
+    video_uri: str,
+    system_prompt: str,
+    user_message: str,
+    model: str,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    media_resolution: MediaResolution = "low",
+    thinking_level: ThinkingLevel = "low",
+    previous_messages: Optional[List[Dict[str, Optional[str]]]] = None,
+    transport: Optional[GeminiTransport] = None,
+) -> Iterator[GeminiStreamEvent]:
+    """call_gemini_with_video 的流式版本"""
+
+    contents = build_video_contents(
+        video_uri=video_uri,
+        user_message=user_message,
+        model=model,
+        media_resolution=media_resolution,
+        previous_messages=previous_messages,
+    )
+
+    yield from stream_gemini(
+        system_prompt=system_prompt,
+        contents=contents,
+        tools=tools,
+        model=model,
+        media_resolution=media_resolution,
+        thinking_level=thinking_level,
+        transport=transport,
+    )
+
+
+async def astream_gemini(
+    *,
+    system_prompt: str,
+    contents: List[Dict[str, Any]],
+    model: str,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    media_resolution: MediaResolution = "low",
+    thinking_level: ThinkingLevel = "low",
+    temperature: float = 0.7,
+    max_output_tokens: int = 8192,
+    transport: Optional[AsyncGeminiTransport] = None,
+) -> AsyncIterator[GeminiStreamEvent]:
+    """stream_gemini 的 asyncio 版本"""
+
+    url = build_model_url(model, "streamGenerateContent") + "&alt=sse"
+    request_body = build_request_body(
+        system_prompt=system_prompt,
+        contents=contents,
+        model=model,
+        tools=tools,
+        media_resolution=media_resolution,
+        thinking_level=thinking_level,
+        temperature=temperature,
+        max_output_tokens=max_output_tokens,
     )
 
+    client = (transport or get_async_transport()).client
+    async with get_rate_limiter().aslot(model):
+        with track_call(model) as call:
+            async with client.stream(
+                "POST",
+                url,
+                headers={"Content-Type": "application/json"},
+                content=json.dumps(request_body),
+                timeout=request_timeout(REQUEST_TIMEOUT_SECONDS),
+            ) as resp:
+                if not resp.is_success:
+                    await resp.aread()
+                    result = _decode_json_response(resp.text, resp.json)
+                    parse_gemini_response(result, ok=False, status_code=resp.status_code)
+
+                acc = GeminiStreamAccumulator()
+                async for line in resp.aiter_lines():
+                    chunk = _parse_sse_line(line)
+                    if chunk is not None:
+                        for event in acc.feed(chunk):
+                            yield event
+            call.add_usage(acc.usage_metadata)
+
+    yield GeminiStreamEvent(type="done", result=acc.result())
+
 
 # ============================================================================
 # TOOL DEFINITIONS
@@ -514,6 +1320,19 @@ Use this exact JSON schema for your output:
 # ============================================================================
 
 
+def build_walkthrough_user_message(product_context: str = "") -> str:
+    """构建 walkthrough 分析的用户消息"""
+    if not product_context:
+        return (
+            "Here is a raw product walkthrough video. "
+            "Analyze it according to the system instructions and output the JSON."
+        )
+    return (
+        f"Here is a raw product walkthrough video for {product_context}. "
+        "Analyze it according to the system instructions and output the JSON."
+    )
+
+
 def analyze_walkthrough_for_ads(
     *,
     video_uri: str,
@@ -521,6 +1340,7 @@ def analyze_walkthrough_for_ads(
     product_context: str = "",
     media_resolution: MediaResolution = "medium",
     thinking_level: ThinkingLevel = "high",
+    video_frames: Optional[List[VideoFrame]] = None,
 ) -> GeminiCallResult:
     """
     高层入口: 分析一个 walkthrough 视频, 输出下游 research agent 可用的 JSON 文本。
@@ -533,26 +1353,117 @@ def analyze_walkthrough_for_ads(
             "AI-native co-reading app for parents and kids"
         media_resolution: 视频分辨率偏好
         thinking_level: 思考级别
+        video_frames: 关键帧模式 (keyframes.extract_keyframes), 代替视频发送; 此时 video_uri 可为空
     返回:
         GeminiCallResult, 其中 result["text"] 是 walkthrough 的结构化 JSON 分析
     """
-    if not product_context:
-        user_message = (
-            "Here is a raw product walkthrough video. "
-            "Analyze it according to the system instructions and output the JSON."
-        )
-    else:
-        user_message = (
-            f"Here is a raw product walkthrough video for {product_context}. "
-            "Analyze it according to the system instructions and output the JSON."
-        )
-
     return call_gemini_with_video(
         video_uri=video_uri,
         system_prompt=WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT,
-        user_message=user_message,
+        user_message=build_walkthrough_user_message(product_context),
+        model=model,
+        tools=None,
+        media_resolution=media_resolution,
+        thinking_level=thinking_level,
+        video_frames=video_frames,
+        # 同一个视频的分析结果可以复用
+        use_cache=True,
+    )
+
+
+async def aanalyze_walkthrough_for_ads(
+    *,
+    video_uri: str,
+    model: str,
+    product_context: str = "",
+    media_resolution: MediaResolution = "medium",
+    thinking_level: ThinkingLevel = "high",
+    video_frames: Optional[List[VideoFrame]] = None,
+) -> GeminiCallResult:
+    """analyze_walkthrough_for_ads 的 asyncio 版本, 参数和返回值相同"""
+    return await acall_gemini_with_video(
+        video_uri=video_uri,
+        system_prompt=WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT,
+        user_message=build_walkthrough_user_message(product_context),
+        model=model,
+        tools=None,
+        media_resolution=media_resolution,
+        thinking_level=thinking_level,
+        video_frames=video_frames,
+        # 同一个视频的分析结果可以复用
+        use_cache=True,
+    )
+
+
+def _feed_sections(parser: JsonSectionParser, text: str) -> List[GeminiStreamEvent]:
+    """喂入文本增量, 返回新闭合的 section 事件; JSON 损坏时停止增量解析"""
+    if parser.done:
+        return []
+    try:
+        return [
+            GeminiStreamEvent(type="section", section=key, value=value)
+            for key, value in parser.feed(text)
+        ]
+    except json.JSONDecodeError as exc:
+        logger.warning("Walkthrough section is not valid JSON, stop emitting sections: %s", exc)
+        parser.done = True
+        return []
+
+
+def stream_walkthrough_sections(
+    *,
+    video_uri: str,
+    model: str,
+    product_context: str = "",
+    media_resolution: MediaResolution = "medium",
+    thinking_level: ThinkingLevel = "high",
+) -> Iterator[GeminiStreamEvent]:
+    """
+    analyze_walkthrough_for_ads 的流式版本: 每当 JSON 的一个顶层字段
+    (product_overview, target_users, ...) 闭合, 就 yield 一个 "section" 事件,
+    最后 yield "done" 事件 (result 与 analyze_walkthrough_for_ads 相同)。
+    """
+    parser = JsonSectionParser()
+    for event in stream_gemini_with_video(
+        video_uri=video_uri,
+        system_prompt=WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT,
+        user_message=build_walkthrough_user_message(product_context),
         model=model,
-        tools=None,  
+        tools=None,
         media_resolution=media_resolution,
         thinking_level=thinking_level,
+    ):
+        if event["type"] == "text":
+            yield from _feed_sections(parser, event["text"])
+        elif event["type"] == "done":
+            yield event
+
+
+async def astream_walkthrough_sections(
+    *,
+    video_uri: str,
+    model: str,
+    product_context: str = "",
+    media_resolution: MediaResolution = "medium",
+    thinking_level: ThinkingLevel = "high",
+) -> AsyncIterator[GeminiStreamEvent]:
+    """stream_walkthrough_sections 的 asyncio 版本"""
+    parser = JsonSectionParser()
+    contents = build_video_contents(
+        video_uri=video_uri,
+        user_message=build_walkthrough_user_message(product_context),
+        model=model,
+        media_resolution=media_resolution,
     )
+    async for event in astream_gemini(
+        system_prompt=WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT,
+        contents=contents,
+        model=model,
+        media_resolution=media_resolution,
+        thinking_level=thinking_level,
+    ):
+        if event["type"] == "text":
+            for section_event in _feed_sections(parser, event["text"]):
+                yield section_event
+        elif event["type"] == "done":
+            yield event
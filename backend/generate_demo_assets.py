@@ -6,6 +6,7 @@ Uses the Capybara's Chill script with absurd/funny visuals.
 Usage:
     cd backend
     python generate_demo_assets.py
+    python generate_demo_assets.py --batch   # one Batch API job, missing images retried live
 """
 import json
 import os
@@ -19,6 +20,8 @@ load_dotenv()
 if os.getenv("GOOGLE_API_KEY") and not os.getenv("GEMINI_API_KEY"):
     os.environ["GEMINI_API_KEY"] = os.getenv("GOOGLE_API_KEY")
 
+from gemini_batch import BatchJob, write_image_results
+from image_engine import IMAGE_MODEL
 from storyboard.images import generate_image
 
 # Paths
@@ -37,8 +40,38 @@ for d in (CHAR_DIR, OBJ_DIR, ENV_DIR, FRAME_DIR):
     d.mkdir(parents=True, exist_ok=True)
 
 
-def generate_asset(prompt: str, dest: Path, name: str) -> str:
+def public_url(dest: Path) -> str:
+    return "/" + "/".join(dest.parts[dest.parts.index("public") + 1:])
+
+
+def prefetch_batch(assets: dict) -> dict:
+    """Generate every asset image in one Batch API job; returns {dest: public URL} for the ones that came back."""
+    destinations = {
+        "characters": CHAR_DIR,
+        "objects": OBJ_DIR,
+        "environments": ENV_DIR,
+        "frames": FRAME_DIR,
+    }
+    job = BatchJob("demo-assets-first", model=IMAGE_MODEL)
+    dests = {}
+    for group, directory in destinations.items():
+        for item in assets[group]:
+            key = f"{group}/{item['id']}"
+            job.add_image(key, item["prompt"])
+            dests[key] = directory / f"{item['id']}.png"
+
+    print(f"\n📦 Submitting {len(dests)} images as a batch job...")
+    written = write_image_results(job.run(), dests)
+    # Keyed by the requested path; the written one may have a different extension
+    return {dests[key]: public_url(path) for key, path in written.items() if path is not None}
+
+
+def generate_asset(prompt: str, dest: Path, name: str, prefetched: dict = None) -> str:
     """Generate a single asset and return its public URL."""
+    if prefetched and dest in prefetched:
+        print(f"✅ {name}: from batch → {prefetched[dest]}")
+        return prefetched[dest]
+
     print(f"\n{'='*60}")
     print(f"🎨 Generating: {name}")
     print(f"📝 Prompt: {prompt[:80]}...")
@@ -132,6 +165,8 @@ def main():
         ],
     }
 
+    prefetched = prefetch_batch(assets) if "--batch" in sys.argv[1:] else {}
+
     # Track generated assets
     generated = {"characters": [], "objects": [], "environments": []}
     frames = []
@@ -142,7 +177,7 @@ def main():
     print("🐹"*20)
     for char in assets["characters"]:
         dest = CHAR_DIR / f"{char['id']}.png"
-        url = generate_asset(char["prompt"], dest, char["name"])
+        url = generate_asset(char["prompt"], dest, char["name"], prefetched)
         generated["characters"].append({
             "id": char["id"],
             "name": char["name"],
@@ -156,7 +191,7 @@ def main():
     print("📱"*20)
     for obj in assets["objects"]:
         dest = OBJ_DIR / f"{obj['id']}.png"
-        url = generate_asset(obj["prompt"], dest, obj["name"])
+        url = generate_asset(obj["prompt"], dest, obj["name"], prefetched)
         generated["objects"].append({
             "id": obj["id"],
             "name": obj["name"],
@@ -170,7 +205,7 @@ def main():
     print("🏠"*20)
     for env in assets["environments"]:
         dest = ENV_DIR / f"{env['id']}.png"
-        url = generate_asset(env["prompt"], dest, env["name"])
+        url = generate_asset(env["prompt"], dest, env["name"], prefetched)
         generated["environments"].append({
             "id": env["id"],
             "name": env["name"],
@@ -184,7 +219,7 @@ def main():
     print("🎬"*20)
     for idx, frame in enumerate(assets["frames"], start=1):
         dest = FRAME_DIR / f"{frame['id']}.png"
-        url = generate_asset(frame["prompt"], dest, f"Scene {frame['scene_id']}: {frame['description'][:30]}...")
+        url = generate_asset(frame["prompt"], dest, f"Scene {frame['scene_id']}: {frame['description'][:30]}...", prefetched)
         frames.append({
             "frame_id": idx,
             "scene_id": frame["scene_id"],
@@ -6,6 +6,9 @@ This analyzes the video, generates 3 script concepts, and saves them for cached
 Usage:
     cd backend
     python generate_research_from_video.py
+    python generate_research_from_video.py --batch   # Batch API jobs for analysis + scripts
+    python generate_research_from_video.py --transcode [--drop-audio]   # ffmpeg-shrink before upload
+    python generate_research_from_video.py --segmented   # analyze long videos in parallel windows
 
 Make sure GEMINI_API_KEY is set.
 """
@@ -13,7 +16,7 @@ import json
 import os
 import re
 import sys
-import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -26,7 +29,20 @@ if os.getenv("GOOGLE_API_KEY") and not os.getenv("GEMINI_API_KEY"):
 
 from google import genai
 
-from gemini_utils import analyze_walkthrough_for_ads
+from cost_ledger import cost_scope, get_cost_ledger, track_call
+from deadlines import bind
+from file_uploads import upload_file
+from gemini_batch import BatchJob, text_result
+from gemini_utils import (
+    WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT,
+    build_request_body,
+    build_video_contents,
+    build_walkthrough_user_message,
+    stream_walkthrough_sections,
+)
+from rate_limiter import get_rate_limiter
+from video_preprocess import prepare_video, probe_duration
+from walkthrough_segments import MIN_SEGMENTED_SECONDS, analyze_walkthrough_segmented
 
 # Paths
 ROOT_DIR = Path(__file__).resolve().parents[1]
@@ -37,42 +53,39 @@ SAMPLE_INPUTS_DIR = PUBLIC_DIR / "sample-inputs"
 # Video to analyze
 VIDEO_PATH = SAMPLE_INPUTS_DIR / "Boards App Walkthrough.mp4"
 
+ANALYSIS_MODEL = "gemini-2.5-flash"
+PRODUCT_CONTEXT = "Visual project management / kanban board app"
+ANALYSIS_MEDIA_RESOLUTION = "medium"
 
-def upload_video_to_gemini(video_path: Path) -> str:
-    """Upload video to Gemini File API and return the URI."""
-    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-    if not api_key:
+# Analysis sections generate_scripts_from_analysis reads; scripts start once these land
+SCRIPT_INPUT_SECTIONS = ("product_overview", "target_users", "core_value_props", "ad_angle_ideas")
+
+
+def upload_video_to_gemini(video_path: Path, transcode: bool = False, drop_audio: bool = False) -> str:
+    """Upload video to Gemini File API and return the URI.
+
+    transcode: first shrink the video to what ANALYSIS_MEDIA_RESOLUTION can use (ffmpeg)
+    drop_audio: with transcode, also strip the audio track
+    """
+    if not os.getenv("GOOGLE_API_KEY") and os.getenv("GEMINI_API_KEY"):
+        # The REST upload path reads GOOGLE_API_KEY
+        os.environ["GOOGLE_API_KEY"] = os.environ["GEMINI_API_KEY"]
+    if not os.getenv("GOOGLE_API_KEY"):
         raise RuntimeError("GEMINI_API_KEY not set")
 
-    client = genai.Client(api_key=api_key)
-    
-    print(f"[upload] Uploading video: {video_path.name}")
-    print(f"[upload] Size: {video_path.stat().st_size / 1024 / 1024:.1f} MB")
-    
-    # Upload the file
-    uploaded_file = client.files.upload(file=video_path)
-    
-    print(f"[upload] Upload started, URI: {uploaded_file.uri}")
-    print(f"[upload] State: {uploaded_file.state}")
-    
-    # Wait for processing to complete
-    while uploaded_file.state.name == "PROCESSING":
-        print("[upload] Processing video...")
-        time.sleep(5)
-        uploaded_file = client.files.get(name=uploaded_file.name)
-    
-    if uploaded_file.state.name == "FAILED":
-        raise RuntimeError(f"Video processing failed: {uploaded_file.state}")
-    
-    print(f"[upload] ✓ Video ready: {uploaded_file.uri}")
-    return uploaded_file.uri
+    if transcode:
+        video_path = prepare_video(video_path, ANALYSIS_MEDIA_RESOLUTION, drop_audio=drop_audio)
 
+    # Skips the upload when the same video is still ACTIVE from an earlier run;
+    # otherwise a resumable chunked upload with progress
+    uploaded = upload_file(None, video_path)
 
-def generate_scripts_from_analysis(analysis: dict) -> list:
-    """Generate 3 script concepts from the walkthrough analysis."""
-    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-    client = genai.Client(api_key=api_key)
-    
+    print(f"[upload] ✓ Video ready: {uploaded.uri}")
+    return uploaded.uri
+
+
+def build_scripts_prompt(analysis: dict) -> str:
+    """Prompt for 3 script concepts from the walkthrough analysis."""
     # Simplify analysis to reduce token count
     simplified_analysis = {
         "product": analysis.get("product_overview", {}),
@@ -113,21 +126,35 @@ For EACH script include:
 - scenes: array of 3 {{scene_id, visual, audio, assets}}
 
 Return valid JSON only. No markdown. No explanation."""
+    return prompt
+
+
+def generate_scripts_from_analysis(analysis: dict) -> list:
+    """Generate 3 script concepts from the walkthrough analysis."""
+    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    client = genai.Client(api_key=api_key)
+    prompt = build_scripts_prompt(analysis)
 
     print("[scripts] Generating 3 script concepts...")
     
     from google.genai.types import GenerateContentConfig
     
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-        config=GenerateContentConfig(
-            response_mime_type="application/json",
-            temperature=0.8,
-        ),
-    )
-    
-    response_text = response.text
+    with get_rate_limiter().slot("gemini-2.5-flash"), track_call("gemini-2.5-flash") as call:
+        response = client.models.generate_content(
+            model="gemini-2.5-flash",
+            contents=prompt,
+            config=GenerateContentConfig(
+                response_mime_type="application/json",
+                temperature=0.8,
+            ),
+        )
+        call.add_usage(response.usage_metadata)
+    
+    return parse_scripts_response(response.text)
+
+
+def parse_scripts_response(response_text: str) -> list:
+    """Parse the script generation response into a list of scripts."""
     print(f"[scripts] Response length: {len(response_text)} chars")
     
     # Extract JSON from response if wrapped in markdown
@@ -152,6 +179,41 @@ Return valid JSON only. No markdown. No explanation."""
         raise
 
 
+def analyze_walkthrough_batch(video_uri: str) -> dict:
+    """Walkthrough analysis as a Batch API job; returns the same GeminiCallResult as the live call."""
+    job = BatchJob("research-first-analysis", model=ANALYSIS_MODEL)
+    job.add(
+        "analysis",
+        build_request_body(
+            system_prompt=WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT,
+            contents=build_video_contents(
+                video_uri=video_uri,
+                user_message=build_walkthrough_user_message(PRODUCT_CONTEXT),
+                model=ANALYSIS_MODEL,
+                media_resolution=ANALYSIS_MEDIA_RESOLUTION,
+                previous_messages=None,
+            ),
+            model=ANALYSIS_MODEL,
+            media_resolution=ANALYSIS_MEDIA_RESOLUTION,
+            thinking_level="high",
+        ),
+    )
+    return text_result(job.run()["analysis"])
+
+
+def generate_scripts_batch(analysis: dict) -> list:
+    """generate_scripts_from_analysis as a Batch API job."""
+    job = BatchJob("research-first-scripts", model=ANALYSIS_MODEL)
+    job.add_text(
+        "scripts",
+        build_scripts_prompt(analysis),
+        response_mime_type="application/json",
+        temperature=0.8,
+    )
+    print("[scripts] Generating 3 script concepts (batch)...")
+    return parse_scripts_response(text_result(job.run()["scripts"])["text"])
+
+
 def select_best_script(scripts: list) -> dict:
     """Select the script with the highest viral score."""
     if not scripts:
@@ -163,6 +225,15 @@ def select_best_script(scripts: list) -> dict:
 
 
 def main():
+    # --batch: run analysis and script generation as Batch API jobs instead of live calls
+    use_batch = "--batch" in sys.argv[1:]
+    # --transcode: downscale the walkthrough to the analysis media resolution before upload
+    # --drop-audio: with --transcode, strip the audio track as well
+    transcode = "--transcode" in sys.argv[1:]
+    drop_audio = "--drop-audio" in sys.argv[1:]
+    # --segmented: analyze overlapping windows concurrently (long walkthroughs)
+    segmented = "--segmented" in sys.argv[1:]
+
     print("\n" + "=" * 60)
     print("RESEARCH GENERATION FROM VIDEO")
     print("=" * 60)
@@ -182,59 +253,90 @@ def main():
     print("\n" + "-" * 40)
     print("STEP 1: Upload Video to Gemini")
     print("-" * 40)
-    video_uri = upload_video_to_gemini(VIDEO_PATH)
+    video_uri = upload_video_to_gemini(VIDEO_PATH, transcode=transcode, drop_audio=drop_audio)
     
-    # Step 2: Analyze walkthrough
+    # Step 2: Analyze walkthrough (streamed, section by section)
     print("\n" + "-" * 40)
     print("STEP 2: Analyze Video Walkthrough")
     print("-" * 40)
     print("[analyze] Running walkthrough analysis...")
-    
-    result = analyze_walkthrough_for_ads(
-        video_uri=video_uri,
-        model="gemini-2.5-flash",
-        product_context="Visual project management / kanban board app",
-        media_resolution="medium",
-        thinking_level="high",
-    )
-    
-    if result.get("was_filtered"):
-        print(f"[analyze] ✗ Response filtered: {result.get('filter_reason')}")
-        sys.exit(1)
-    
-    analysis_text = result.get("text", "")
-    print(f"[analyze] Response length: {len(analysis_text)} chars")
-    
-    # Parse analysis JSON
-    try:
-        # Try to extract JSON from potential markdown
-        json_match = re.search(r'```(?:json)?\s*([\s\S]*?)```', analysis_text)
-        if json_match:
-            analysis_text = json_match.group(1).strip()
-        analysis = json.loads(analysis_text)
-        print("[analyze] ✓ Analysis parsed successfully")
-    except json.JSONDecodeError as e:
-        print(f"[analyze] Failed to parse analysis JSON: {e}")
-        print(f"[analyze] Raw response: {analysis_text[:1000]}...")
-        # Save raw response for debugging
-        (RUNS_DIR / "analysis_raw.txt").write_text(analysis_text)
-        sys.exit(1)
-    
-    # Save intermediate analysis
-    intermediate_path = RUNS_DIR / "example_2_research_intermediate.json"
-    with open(intermediate_path, "w") as f:
-        json.dump({
-            "source_video": f"/sample-inputs/{VIDEO_PATH.name}",
-            "walkthrough_analysis": analysis,
-        }, f, indent=2)
-    print(f"[analyze] ✓ Saved intermediate to {intermediate_path}")
-    
-    # Step 3: Generate scripts
-    print("\n" + "-" * 40)
-    print("STEP 3: Generate Script Concepts")
-    print("-" * 40)
-    scripts = generate_scripts_from_analysis(analysis)
-    
+
+    sections: dict = {}
+    result = None
+    scripts_future = None
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        duration = probe_duration(VIDEO_PATH) if segmented else None
+        if use_batch:
+            result = analyze_walkthrough_batch(video_uri)
+        elif duration and duration > MIN_SEGMENTED_SECONDS:
+            result = analyze_walkthrough_segmented(
+                video_uri=video_uri,
+                model=ANALYSIS_MODEL,
+                duration_seconds=duration,
+                product_context=PRODUCT_CONTEXT,
+                media_resolution=ANALYSIS_MEDIA_RESOLUTION,
+                thinking_level="high",
+            )
+        else:
+            for event in stream_walkthrough_sections(
+                video_uri=video_uri,
+                model=ANALYSIS_MODEL,
+                product_context=PRODUCT_CONTEXT,
+                media_resolution=ANALYSIS_MEDIA_RESOLUTION,
+                thinking_level="high",
+            ):
+                if event["type"] == "section":
+                    sections[event["section"]] = event["value"]
+                    print(f"[analyze] ✓ Section ready: {event['section']}")
+                    # Script generation only needs a few sections; start it early
+                    if scripts_future is None and all(k in sections for k in SCRIPT_INPUT_SECTIONS):
+                        print("[scripts] Inputs ready, generating scripts while analysis continues...")
+                        scripts_future = executor.submit(bind(generate_scripts_from_analysis), dict(sections))
+                elif event["type"] == "done":
+                    result = event["result"]
+
+        if result.get("was_filtered"):
+            print(f"[analyze] ✗ Response filtered: {result.get('filter_reason')}")
+            sys.exit(1)
+
+        analysis_text = result.get("text", "")
+        print(f"[analyze] Response length: {len(analysis_text)} chars")
+
+        # Parse the full analysis JSON; streamed sections only serve the early start
+        try:
+            # Try to extract JSON from potential markdown
+            json_match = re.search(r'```(?:json)?\s*([\s\S]*?)```', analysis_text)
+            if json_match:
+                analysis_text = json_match.group(1).strip()
+            analysis = json.loads(analysis_text)
+            print("[analyze] ✓ Analysis parsed successfully")
+        except json.JSONDecodeError as e:
+            print(f"[analyze] Failed to parse analysis JSON: {e}")
+            print(f"[analyze] Raw response: {analysis_text[:1000]}...")
+            # Save raw response for debugging
+            (RUNS_DIR / "analysis_raw.txt").write_text(analysis_text)
+            sys.exit(1)
+
+        # Save intermediate analysis
+        intermediate_path = RUNS_DIR / "example_2_research_intermediate.json"
+        with open(intermediate_path, "w") as f:
+            json.dump({
+                "source_video": f"/sample-inputs/{VIDEO_PATH.name}",
+                "walkthrough_analysis": analysis,
+            }, f, indent=2)
+        print(f"[analyze] ✓ Saved intermediate to {intermediate_path}")
+
+        # Step 3: Generate scripts
+        print("\n" + "-" * 40)
+        print("STEP 3: Generate Script Concepts")
+        print("-" * 40)
+        if scripts_future is not None:
+            scripts = scripts_future.result()
+        elif use_batch:
+            scripts = generate_scripts_batch(analysis)
+        else:
+            scripts = generate_scripts_from_analysis(analysis)
+
     # Step 4: Select best script
     print("\n" + "-" * 40)
     print("STEP 4: Select Best Script")
@@ -317,5 +419,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with cost_scope(RUNS_DIR.name):
+        main()
+    print(f"\n[cost] {json.dumps(get_cost_ledger().totals(RUNS_DIR.name)['total'])}")
 
@@ -2,16 +2,22 @@
 """
 Generate storyboard images for the WildMatch dating app ad.
 Uses Gemini 2.0 Flash to generate all images in parallel.
+
+Usage:
+    python generate_wildmatch_storyboard.py           # live calls
+    python generate_wildmatch_storyboard.py --batch   # one Batch API job (cheaper, slower)
+    python generate_wildmatch_storyboard.py --fresh-images   # skip the image cache
 """
 
 import json
-import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
+from concurrent.futures import as_completed
 from pathlib import Path
 
 from dotenv import load_dotenv
-from google import genai
-from google.genai.types import GenerateContentConfig
+
+from gemini_batch import BatchJob, write_image_results
+from image_engine import get_image_engine
 
 load_dotenv()
 
@@ -26,52 +32,61 @@ RUN_DIR = RUNS_DIR / RUN_ID
 STYLE_PREFIX = "Colorful Pixar-style 3D animation, expressive cartoon animals with big eyes, warm lighting, cinematic composition, high quality render. IMPORTANT: Do not include any text, words, letters, or writing in the image. Single scene only, no split screens or multiple panels."
 
 
-def get_client():
-    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY or GOOGLE_API_KEY not set")
-    return genai.Client(api_key=api_key)
-
-
-def generate_image(client, prompt: str, dest_path: Path) -> str:
-    """Generate an image and save it to dest_path."""
-    full_prompt = f"{STYLE_PREFIX}. {prompt}"
-    print(f"  Generating: {dest_path.name}...")
-    
-    try:
-        response = client.models.generate_content(
-            model="gemini-3-pro-image-preview",
-            contents=f"Generate an image: {full_prompt}",
-            config=GenerateContentConfig(
-                response_modalities=["IMAGE", "TEXT"],
-            ),
-        )
-        
-        image_bytes = None
-        if response.candidates:
-            for part in response.candidates[0].content.parts:
-                if hasattr(part, "inline_data") and part.inline_data:
-                    if part.inline_data.mime_type and part.inline_data.mime_type.startswith("image/"):
-                        image_bytes = part.inline_data.data
-                        break
-        
-        if not image_bytes:
-            print(f"  ⚠ No image in response for {dest_path.name}")
-            return None
-        
-        dest_path.parent.mkdir(parents=True, exist_ok=True)
-        dest_path.write_bytes(image_bytes)
-        print(f"  ✓ Saved: {dest_path.name}")
-        
-        # Return URL path relative to public folder
-        return "/" + "/".join(dest_path.parts[dest_path.parts.index("public") + 1:])
-    
-    except Exception as e:
-        print(f"  ✗ Error generating {dest_path.name}: {e}")
-        return None
+def public_url(dest_path: Path) -> str:
+    return "/" + "/".join(dest_path.parts[dest_path.parts.index("public") + 1:])
+
+
+def generate_images_live(tasks: list, use_cache: bool = True) -> dict:
+    """Generate all task images with live calls in parallel on the shared image engine."""
+    engine = get_image_engine()
+    print(f"\n✓ Image engine ready ({engine.max_workers} workers)")
+
+    results = {}
+    future_to_task = {
+        engine.submit(f"{STYLE_PREFIX}. {task['prompt']}", task["dest"], use_cache): task
+        for task in tasks
+    }
+    for future in as_completed(future_to_task):
+        task = future_to_task[future]
+        task_key = f"{task['type']}_{task['id']}"
+        try:
+            written = future.result().dest
+            print(f"  ✓ Saved: {written.name}")
+            results[task_key] = {
+                "image_url": public_url(written),
+                "task": task,
+            }
+        except Exception as e:
+            print(f"  ✗ Failed {task_key}: {e}")
+            results[task_key] = {"image_url": None, "task": task}
+    print(f"  Image engine: {engine.stats()}")
+    return results
+
+
+def generate_images_batch(tasks: list) -> dict:
+    """Generate all task images as one Gemini Batch API job (resumes a pending job on rerun)."""
+    job = BatchJob(f"wildmatch-{RUN_ID}-images", model="gemini-3-pro-image-preview")
+    for task in tasks:
+        job.add_image(f"{task['type']}_{task['id']}", f"{STYLE_PREFIX}. {task['prompt']}")
+
+    written = write_image_results(
+        job.run(),
+        {f"{task['type']}_{task['id']}": task["dest"] for task in tasks},
+    )
+    results = {}
+    for task in tasks:
+        task_key = f"{task['type']}_{task['id']}"
+        dest = written.get(task_key)
+        print(f"  {'✓ Saved' if dest else '✗ No image for'}: {task['dest'].name}")
+        results[task_key] = {"image_url": public_url(dest) if dest else None, "task": task}
+    return results
 
 
 def main():
+    use_batch = "--batch" in sys.argv[1:]
+    # --fresh-images regenerates every image instead of reusing cached ones
+    use_cache = "--fresh-images" not in sys.argv[1:]
+
     print("=" * 60)
     print("WildMatch Storyboard Generator")
     print("=" * 60)
@@ -95,10 +110,6 @@ def main():
     print(f"Objects: {len(objects)}")
     print(f"Environments: {len(environments)}")
     
-    # Initialize client
-    client = get_client()
-    print("\n✓ Gemini client initialized")
-    
     # Prepare directories
     frame_dir = RUN_DIR / "frames"
     obj_dir = RUN_DIR / "objects"
@@ -149,29 +160,13 @@ def main():
             "dest": dest,
         })
     
-    print(f"\n🎨 Generating {len(tasks)} images in parallel...")
+    if use_batch:
+        print(f"\n🎨 Submitting {len(tasks)} images as a batch job...")
+    else:
+        print(f"\n🎨 Generating {len(tasks)} images in parallel...")
     print("-" * 40)
     
-    # Generate all images in parallel
-    results = {}
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        future_to_task = {
-            executor.submit(generate_image, client, task["prompt"], task["dest"]): task
-            for task in tasks
-        }
-        
-        for future in as_completed(future_to_task):
-            task = future_to_task[future]
-            task_key = f"{task['type']}_{task['id']}"
-            try:
-                image_url = future.result()
-                results[task_key] = {
-                    "image_url": image_url,
-                    "task": task,
-                }
-            except Exception as e:
-                print(f"  ✗ Failed {task_key}: {e}")
-                results[task_key] = {"image_url": None, "task": task}
+    results = generate_images_batch(tasks) if use_batch else generate_images_live(tasks, use_cache)
     
     print("-" * 40)
     
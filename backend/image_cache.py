@@ -0,0 +1,255 @@
+"""
+Content-addressed cache for generated images.
+
+Storyboard re-runs mostly ask for the same images again. Every generated
+image is kept once on disk and reused when the same request comes back:
+
+- Key: sha256 of the model, the fully expanded prompt (style prefixes and the
+  "Generate an image:" wrapper included) and the generation config
+- Bytes are stored once under blobs/, named by the sha256 of the image, so
+  identical images from different keys share storage
+- Run outputs (frontend/public/runs/...) are hardlinks to the read-only blob;
+  a copy is made only when the two are on different filesystems. Anything
+  else writing to a run output must replace the file (write_image), never
+  write into it
+- Blobs are evicted least-recently-used above max_bytes; keys whose blob was
+  evicted count as misses
+
+    wrote = cached_image(IMAGE_MODEL, contents, {"response_modalities": [...]},
+                         dest_path, generate=lambda: call_the_api(contents))
+
+Pass use_cache=False for a fresh take: the image is regenerated and replaces
+the cached one. IMAGE_CACHE=0 turns the cache off for the process.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "images"
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+
+def image_cache_key(model: str, prompt: str, config: Optional[Dict[str, Any]] = None) -> str:
+    """Stable hash of one image request."""
+    canonical = json.dumps(
+        {"model": model, "prompt": prompt, "config": config or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _replace_with(dest: Path, write: Callable[[Path], None]) -> None:
+    """write() a temporary sibling of dest, then atomically move it into place."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, dest)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def write_image(data: bytes, dest: Path) -> None:
+    """Atomic write; also replaces (rather than writes through) a hardlinked dest."""
+    _replace_with(Path(dest), lambda tmp: tmp.write_bytes(data))
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+
+class ImageCache:
+    """keys/<key>.json -> blobs/<sha256 of bytes>; LRU-evicted above max_bytes."""
+
+    def __init__(self, directory: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # blob digest -> (size, last_used); rebuilt from disk on startup
+        self._blobs: Dict[str, Tuple[int, float]] = {}
+        self._total_bytes = 0
+        self._counters = {"hits": 0, "misses": 0, "refreshed": 0, "evictions": 0, "copies": 0}
+        self._load_index()
+
+    def _key_path(self, key: str) -> Path:
+        return self.directory / "keys" / key[:2] / f"{key}.json"
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.directory / "blobs" / digest[:2] / digest
+
+    def _load_index(self) -> None:
+        # Recency is tracked in memory only (bumping a blob's mtime would also bump
+        # every run file hardlinked to it), so after a restart blobs age by creation time
+        for path in (self.directory / "blobs").glob("*/*"):
+            if path.name.endswith(".tmp"):
+                continue
+            stat = path.stat()
+            self._blobs[path.name] = (stat.st_size, stat.st_mtime)
+            self._total_bytes += stat.st_size
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "blobs": len(self._blobs), "total_bytes": self._total_bytes}
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    # ------------------------------------------------------------------------
+
+    def _materialize(self, blob: Path, dest: Path) -> None:
+        def link(tmp: Path) -> None:
+            try:
+                os.link(blob, tmp)
+            except OSError:
+                # Different filesystem (or no hardlink support): fall back to a copy
+                shutil.copyfile(blob, tmp)
+                self._count("copies")
+
+        _replace_with(dest, link)
+
+    def get(self, key: str, dest: Path) -> bool:
+        """Materialize the cached image for key at dest; False on miss."""
+        hit = self._get(key, Path(dest))
+        self._count("hits" if hit else "misses")
+        return hit
+
+    def _get(self, key: str, dest: Path) -> bool:
+        try:
+            digest = json.loads(self._key_path(key).read_text(encoding="utf-8"))["blob"]
+        except (OSError, ValueError, KeyError):
+            return False
+        blob = self._blob_path(digest)
+        with self._lock:
+            if digest not in self._blobs or not blob.exists():
+                # Evicted (possibly by another process): the key is stale
+                self._key_path(key).unlink(missing_ok=True)
+                return False
+            self._blobs[digest] = (self._blobs[digest][0], time.time())
+        try:
+            self._materialize(blob, dest)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key: str, data: bytes, dest: Optional[Path] = None, *, refresh: bool = False) -> str:
+        """
+        Store data under key (and materialize it at dest); returns the blob digest.
+
+        refresh=True marks a fresh take that replaces whatever the key held.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        blob = self._blob_path(digest)
+        with self._lock:
+            if refresh:
+                self._counters["refreshed"] += 1
+            if digest not in self._blobs or not blob.exists():
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                _replace_with(blob, lambda tmp: tmp.write_bytes(data))
+                # Read-only: writing through a hardlinked run file must not change the blob
+                os.chmod(blob, 0o444)
+                self._total_bytes -= self._blobs.pop(digest, (0, 0.0))[0]
+                self._total_bytes += len(data)
+            self._blobs[digest] = (len(data), time.time())
+            _replace_with(
+                self._key_path(key),
+                lambda tmp: tmp.write_text(json.dumps({"blob": digest, "created_at": time.time()})),
+            )
+            self._evict(keep=digest)
+        if dest is not None:
+            self._materialize(blob, Path(dest))
+        return digest
+
+    def _evict(self, keep: str) -> None:
+        if self._total_bytes <= self.max_bytes:
+            return
+        for digest, _ in sorted(self._blobs.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            size, _ = self._blobs.pop(digest)
+            self._total_bytes -= size
+            # Run outputs linked to the blob keep their own directory entry
+            self._blob_path(digest).unlink(missing_ok=True)
+            self._counters["evictions"] += 1
+
+
+_cache: Optional[ImageCache] = None
+_cache_configured = False
+_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> Optional[ImageCache]:
+    """Process-wide cache, or None when disabled (IMAGE_CACHE=0)."""
+    global _cache, _cache_configured
+    if os.getenv("IMAGE_CACHE", "1").lower() in ("0", "false", "no"):
+        return None
+    if not _cache_configured:
+        with _cache_lock:
+            if not _cache_configured:
+                directory = Path(os.getenv("IMAGE_CACHE_DIR", str(DEFAULT_CACHE_DIR)))
+                max_bytes = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES)))
+                _cache = ImageCache(directory, max_bytes)
+                _cache_configured = True
+    return _cache
+
+
+def configure_image_cache(cache: Optional[ImageCache]) -> None:
+    """Install a different process-wide cache, or None to disable caching."""
+    global _cache, _cache_configured
+    with _cache_lock:
+        _cache = cache
+        _cache_configured = True
+
+
+# ============================================================================
+# CALL SITES
+# ============================================================================
+
+
+def cached_image(
+    model: str,
+    prompt: str,
+    config: Optional[Dict[str, Any]],
+    dest: Path,
+    generate: Callable[[], Optional[bytes]],
+    *,
+    use_cache: bool = True,
+) -> bool:
+    """
+    Write the image for (model, prompt, config) to dest, calling generate() only on a miss.
+
+    Returns False when generate() produced no image. With use_cache=False the
+    cache is not read, but the new image still replaces the cached one.
+    """
+    dest = Path(dest)
+    cache = get_image_cache()
+    key = image_cache_key(model, prompt, config)
+    if cache is not None and use_cache and cache.get(key, dest):
+        print(f"[image-cache] ✓ Reused {dest.name}")
+        return True
+
+    data = generate()
+    if not data:
+        return False
+    if cache is None:
+        write_image(data, dest)
+    else:
+        cache.put(key, data, dest, refresh=not use_cache)
+    return True
@@ -0,0 +1,161 @@
+"""
+Derivative images (thumbnail, preview, WebP) for generated storyboard images.
+
+Storyboard images are full-size images straight from the model (usually PNG).
+As soon as an image is written, DerivativePipeline.submit() builds smaller
+variants next to it on a thread pool (Pillow releases the GIL while decoding,
+resizing and encoding; a forked process pool is not safe inside the threaded
+server):
+
+    runs/first/frames/scene-1.png
+    runs/first/frames/scene-1.thumb.webp     320px, for lists and posters
+    runs/first/frames/scene-1.preview.webp   960px, for the storyboard view
+    runs/first/frames/scene-1.webp           full size, WebP
+
+    future = get_derivative_pipeline().submit(dest)
+    asset.variants = variant_urls(image_url, future.result())
+
+- Decoding happens once per image; each variant is resized from the previous one
+- Variants are reused while the source bytes are unchanged (their sha256 is kept
+  in a hidden .<stem>.variants file), so re-runs only pay for new images. Not
+  mtimes: relinking an older cached image over dest keeps that blob's old mtime
+- A source that already is WebP is its own "webp" variant; it is never re-encoded
+- Writes are atomic (tmp file + os.replace)
+- IMAGE_DERIVATIVES=0 turns the pipeline off; callers then keep image_url only
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from PIL import Image
+
+
+@dataclass(frozen=True)
+class DerivativeSpec:
+    name: str
+    # Longest edge in pixels; None keeps the original size
+    max_edge: Optional[int]
+    quality: int
+    suffix: str
+
+
+# Largest first: each variant is resized from the one before it
+DERIVATIVES: Sequence[DerivativeSpec] = (
+    DerivativeSpec(name="webp", max_edge=None, quality=85, suffix=".webp"),
+    DerivativeSpec(name="preview", max_edge=960, quality=80, suffix=".preview.webp"),
+    DerivativeSpec(name="thumbnail", max_edge=320, quality=75, suffix=".thumb.webp"),
+)
+
+
+def derivative_path(source: Path, spec: DerivativeSpec) -> Path:
+    return Path(source).with_name(Path(source).stem + spec.suffix)
+
+
+def _fingerprint_path(source: Path) -> Path:
+    return Path(source).with_name(f".{Path(source).stem}.variants")
+
+
+def _source_digest(source: Path) -> str:
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_atomic(dest: Path, write: Callable[[Path], Any]) -> None:
+    tmp_path = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, dest)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def variant_urls(image_url: str, variants: Dict[str, str]) -> Dict[str, str]:
+    """Public URLs of the variant files, next to image_url ("/runs/first/frames/x.png")."""
+    base = image_url.rsplit("/", 1)[0]
+    return {name: f"{base}/{filename}" for name, filename in variants.items()}
+
+
+def build_derivatives(source: Path, specs: Sequence[DerivativeSpec] = DERIVATIVES) -> Dict[str, str]:
+    """Write the variants of source; returns {variant name: file name}. Runs on a pipeline thread."""
+    source = Path(source)
+    digest = _source_digest(source)
+    fingerprint = _fingerprint_path(source)
+    outputs = {spec.name: derivative_path(source, spec) for spec in specs}
+    # scene-1.webp from the model: the full-size WebP variant would be the source itself
+    specs = [spec for spec in specs if outputs[spec.name] != source]
+    fresh = (
+        fingerprint.exists()
+        and fingerprint.read_text(encoding="utf-8").strip() == digest
+        and all(path.exists() for path in outputs.values())
+    )
+    if fresh:
+        return {name: path.name for name, path in outputs.items()}
+
+    with Image.open(source) as opened:
+        image = opened.convert("RGBA" if "A" in opened.getbands() else "RGB")
+    for spec in specs:
+        if spec.max_edge is not None and max(image.size) > spec.max_edge:
+            image = image.copy()
+            image.thumbnail((spec.max_edge, spec.max_edge), Image.LANCZOS)
+        _write_atomic(
+            outputs[spec.name],
+            lambda tmp_path: image.save(tmp_path, format="WEBP", quality=spec.quality, method=4),
+        )
+    # Written last: an interrupted build is redone on the next call
+    _write_atomic(fingerprint, lambda tmp_path: tmp_path.write_text(digest, encoding="utf-8"))
+    return {name: path.name for name, path in outputs.items()}
+
+
+# ============================================================================
+# PIPELINE
+# ============================================================================
+
+
+class DerivativePipeline:
+    """Thread pool for build_derivatives(), started on first use."""
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def submit(self, source: Path) -> "Future[Dict[str, str]]":
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="derivatives"
+                )
+            return self._executor.submit(build_derivatives, Path(source))
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+_pipeline: Optional[DerivativePipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_derivative_pipeline() -> Optional[DerivativePipeline]:
+    """Process-wide pipeline, or None when disabled (IMAGE_DERIVATIVES=0)."""
+    global _pipeline
+    if os.getenv("IMAGE_DERIVATIVES", "1").lower() in ("0", "false", "no"):
+        return None
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                workers = os.getenv("IMAGE_DERIVATIVE_WORKERS")
+                _pipeline = DerivativePipeline(int(workers) if workers else None)
+    return _pipeline
@@ -0,0 +1,387 @@
+"""
+One image generation engine behind every image call site.
+
+storyboard.images.generate_image and ImageAgent.generate_image are thin
+adapters over get_image_engine(), and the WildMatch script submits to it
+directly. The engine owns
+
+- one shared genai.Client for the process
+- a bounded worker pool (IMAGE_ENGINE_WORKERS, default: the image model's
+  max_concurrency in rate_limiter)
+- rate-limit-aware retries: 429 / RESOURCE_EXHAUSTED, 5xx and connection
+  errors are retried with exponential backoff and full jitter, within the
+  request deadline; everything else fails on the first attempt
+- the image cache (image_cache.cached_image) and the cost ledger
+- persistence: the returned bytes are written as-is (atomic rename, or a
+  hardlink into the image cache), the type is sniffed from the magic bytes and
+  the extension follows it; images are only decoded for an explicit convert_to
+- per-request latency / size metrics (ImageResult, stats())
+
+    engine = get_image_engine()
+    result = engine.generate(prompt, dest)                  # caller's thread
+    future = engine.submit(prompt, dest)                    # concurrent.futures.Future
+    result = await engine.asubmit(prompt, dest)             # asyncio.Future
+
+Failures raise ImageGenerationError; each adapter keeps its own contract
+(HTTPException, None) on top of that.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import io
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import httpx
+from google import genai
+from google.genai import types
+from PIL import Image
+
+from cost_ledger import record_usage, track_call
+from deadlines import DeadlineExceeded, bind, remaining, request_timeout
+from image_cache import cached_image, write_image
+from rate_limiter import get_rate_limiter, is_rate_limit_error
+
+IMAGE_MODEL = "gemini-3-pro-image-preview"
+# Everything that determines the image; request options such as the timeout are not part of it
+IMAGE_CONFIG = {"response_modalities": ["IMAGE", "TEXT"]}
+IMAGE_REQUEST_TIMEOUT_SECONDS = 180
+
+DEFAULT_MAX_ATTEMPTS = 4
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = (500, 502, 503, 504)
+
+# Accepted file extensions per image type; the first one is used when renaming
+MIME_EXTENSIONS = {
+    "image/png": (".png",),
+    "image/jpeg": (".jpg", ".jpeg"),
+    "image/webp": (".webp",),
+    "image/gif": (".gif",),
+}
+PIL_FORMATS = {"image/png": "PNG", "image/jpeg": "JPEG", "image/webp": "WEBP", "image/gif": "GIF"}
+# Latencies kept for the percentiles in stats()
+LATENCY_WINDOW = 512
+
+
+class ImageGenerationError(RuntimeError):
+    """An image could not be generated (after retries, where the error allowed them)."""
+
+
+@dataclass
+class ImageResult:
+    dest: Path
+    mime_type: str
+    size_bytes: int
+    # True when the image came from the image cache (no API call)
+    cached: bool
+    attempts: int
+    latency_seconds: float
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """Throttling, server-side and connection errors; never deadline or request errors."""
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if is_rate_limit_error(exc):
+        return True
+    for attr in ("code", "status_code"):
+        if getattr(exc, attr, None) in RETRYABLE_STATUS_CODES:
+            return True
+    # google-genai raises httpx errors (ConnectError, ReadTimeout, ...) for dropped
+    # connections and timeouts; they do not derive from the builtin ones
+    return isinstance(exc, (ConnectionError, TimeoutError, httpx.TransportError))
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """Image mime type from the file's magic bytes (needs the first 12 bytes)."""
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return None
+
+
+def persist_image(
+    dest: Path,
+    declared_mime_type: Optional[str] = None,
+    convert_to: Optional[str] = None,
+) -> Tuple[Path, str]:
+    """
+    Give the image written at dest the extension of its real type; (path, mime_type).
+
+    The bytes are written as returned by the API. Only when convert_to names a
+    different type is the image decoded and re-encoded (to a new file with that
+    type's extension).
+    """
+    with open(dest, "rb") as f:
+        actual = sniff_image_type(f.read(16))
+    if actual is None:
+        raise ImageGenerationError(f"{dest.name} is not a PNG, JPEG, WebP or GIF image")
+    if declared_mime_type and declared_mime_type != actual:
+        print(f"[image-engine] {dest.name}: API said {declared_mime_type}, bytes are {actual}")
+
+    if convert_to and convert_to != actual:
+        target = dest.with_suffix(MIME_EXTENSIONS[convert_to][0])
+        with Image.open(dest) as image:
+            if convert_to == "image/jpeg" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, format=PIL_FORMATS[convert_to])
+        write_image(buffer.getvalue(), target)
+        if target != dest:
+            dest.unlink(missing_ok=True)
+        return target, convert_to
+
+    if dest.suffix.lower() in MIME_EXTENSIONS[actual]:
+        return dest, actual
+    # A rename, not a copy; a hardlink into the image cache stays a hardlink
+    target = dest.with_suffix(MIME_EXTENSIONS[actual][0])
+    os.replace(dest, target)
+    return target, actual
+
+
+def extract_image(response: Any) -> Optional[Tuple[bytes, str]]:
+    """(bytes, mime_type) of the first image part of a generate_content response."""
+    for candidate in getattr(response, "candidates", None) or []:
+        content = getattr(candidate, "content", None)
+        for part in getattr(content, "parts", None) or []:
+            inline = getattr(part, "inline_data", None)
+            if not inline or not inline.data:
+                continue
+            mime_type = inline.mime_type or "image/png"
+            if not mime_type.startswith("image/"):
+                continue
+            data = inline.data
+            # Older SDK versions hand back base64 text
+            return (data if isinstance(data, bytes) else base64.b64decode(data)), mime_type
+    return None
+
+
+# ============================================================================
+# ENGINE
+# ============================================================================
+
+
+class ImageEngine:
+    """Shared client, bounded pool, retries and metrics for one image model."""
+
+    def __init__(
+        self,
+        model: str = IMAGE_MODEL,
+        max_workers: Optional[int] = None,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_base_seconds: float = RETRY_BASE_SECONDS,
+        retry_max_seconds: float = RETRY_MAX_SECONDS,
+        client: Any = None,
+    ) -> None:
+        self.model = model
+        self.max_workers = max_workers or get_rate_limiter().for_model(model).limits.max_concurrency
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._client = client
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {
+            "requests": 0,
+            "generated": 0,
+            "cache_hits": 0,
+            "failed": 0,
+            "retries": 0,
+            "bytes": 0,
+        }
+
+    # ------------------------------------------------------------------------
+
+    def _get_client(self) -> Any:
+        with self._lock:
+            if self._client is None:
+                api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+                if not api_key:
+                    raise ImageGenerationError("GEMINI_API_KEY not configured")
+                self._client = genai.Client(api_key=api_key)
+            return self._client
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                self._counters[name] += delta
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: spreads the retries of a throttled burst
+        return random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (attempt - 1)))
+
+    def _request(self, contents: str) -> Tuple[bytes, str, int]:
+        """(bytes, mime_type, attempts) from the API, retrying retryable errors."""
+        client = self._get_client()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with get_rate_limiter().slot(self.model), track_call(self.model) as call:
+                    response = client.models.generate_content(
+                        model=self.model,
+                        contents=contents,
+                        config=types.GenerateContentConfig(
+                            **IMAGE_CONFIG,
+                            # google-genai takes the timeout in milliseconds
+                            http_options=types.HttpOptions(
+                                timeout=int(request_timeout(IMAGE_REQUEST_TIMEOUT_SECONDS) * 1000)
+                            ),
+                        ),
+                    )
+                    call.add_usage(response.usage_metadata)
+            except DeadlineExceeded:
+                raise
+            except Exception as exc:
+                if attempt >= self.max_attempts or not is_retryable_error(exc):
+                    raise ImageGenerationError(f"Image generation failed: {exc}") from exc
+                delay = self._backoff(attempt)
+                left = remaining()
+                if left is not None and left <= delay:
+                    raise ImageGenerationError(f"Image generation failed: {exc}") from exc
+                print(f"[image-engine] Attempt {attempt} failed ({exc}), retrying in {delay:.1f}s")
+                self._count(retries=1)
+                time.sleep(delay)
+                continue
+
+            image = extract_image(response)
+            if image is None:
+                raise ImageGenerationError("Image generation returned no image data")
+            record_usage(self.model, images=1)
+            return image[0], image[1], attempt
+
+    def generate(
+        self,
+        prompt: str,
+        dest: Path,
+        use_cache: bool = True,
+        convert_to: Optional[str] = None,
+    ) -> ImageResult:
+        """
+        Generate the image for prompt into dest in the calling thread.
+
+        The extension of dest follows the type of the returned image (result.dest
+        is the final path); convert_to="image/png" etc. re-encodes instead.
+        """
+        dest = Path(dest)
+        contents = f"Generate an image: {prompt}"
+        started = time.monotonic()
+        fetched: Dict[str, Any] = {}
+
+        def fetch() -> bytes:
+            data, fetched["mime_type"], fetched["attempts"] = self._request(contents)
+            # Checked before the bytes reach the cache or dest
+            if sniff_image_type(data[:16]) is None:
+                raise ImageGenerationError(f"{dest.name}: response is not a PNG, JPEG, WebP or GIF image")
+            return data
+
+        self._count(requests=1)
+        try:
+            cached_image(self.model, contents, IMAGE_CONFIG, dest, fetch, use_cache=use_cache)
+            dest, mime_type = persist_image(dest, fetched.get("mime_type"), convert_to)
+        except Exception:
+            self._count(failed=1)
+            raise
+
+        latency = time.monotonic() - started
+        size = dest.stat().st_size
+        result = ImageResult(
+            dest=dest,
+            mime_type=mime_type,
+            size_bytes=size,
+            cached=not fetched,
+            attempts=fetched.get("attempts", 0),
+            latency_seconds=round(latency, 3),
+        )
+        with self._lock:
+            self._counters["cache_hits" if result.cached else "generated"] += 1
+            self._counters["bytes"] += size
+            if not result.cached:
+                self._latencies.append(latency)
+        return result
+
+    # ------------------------------------------------------------------------
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="image-engine"
+                )
+            return self._executor
+
+    def submit(
+        self,
+        prompt: str,
+        dest: Path,
+        use_cache: bool = True,
+        convert_to: Optional[str] = None,
+    ) -> "Future[ImageResult]":
+        """generate() on the engine's pool; runs with the caller's deadline and cost scope."""
+        return self._pool().submit(bind(self.generate), prompt, dest, use_cache, convert_to)
+
+    def asubmit(
+        self,
+        prompt: str,
+        dest: Path,
+        use_cache: bool = True,
+        convert_to: Optional[str] = None,
+    ) -> "asyncio.Future[ImageResult]":
+        """submit() as an awaitable future of the running event loop."""
+        return asyncio.wrap_future(self.submit(prompt, dest, use_cache, convert_to))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            latencies = sorted(self._latencies)
+        stats["max_workers"] = self.max_workers
+        if latencies:
+            stats["latency_p50_seconds"] = round(latencies[len(latencies) // 2], 3)
+            stats["latency_p95_seconds"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3)
+        return stats
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+_engine: Optional[ImageEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_image_engine() -> ImageEngine:
+    """Process-wide engine; IMAGE_ENGINE_WORKERS overrides the pool size."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                workers = os.getenv("IMAGE_ENGINE_WORKERS")
+                _engine = ImageEngine(max_workers=int(workers) if workers else None)
+    return _engine
+
+
+def configure_image_engine(engine: Optional[ImageEngine]) -> None:
+    """Install a different process-wide engine (None: rebuild from defaults on next use)."""
+    global _engine
+    with _engine_lock:
+        previous, _engine = _engine, engine
+    if previous is not None and previous is not engine:
+        previous.shutdown(wait=False)
@@ -0,0 +1,202 @@
+"""
+Background jobs for long-running API requests.
+
+POST handlers enqueue the work and return a job id straight away instead of
+holding the connection (and a server thread) for minutes:
+
+    job, created = get_job_queue().submit(f"storyboard:{run_id}", run_storyboard)
+    return get_job_queue().info(job.id)            # 202, client polls /jobs/<id>
+
+- A bounded worker pool runs the jobs in submission order (STORYBOARD_JOB_WORKERS)
+- At most max_queued jobs wait at once; submit() raises JobQueueFull beyond that
+  (STORYBOARD_JOB_QUEUE)
+- Jobs with the same key are deduplicated: while one is queued or running,
+  submitting again returns it instead of starting a second one
+- cancel() drops a queued job; a running one gets job.cancel_event set and
+  stops at its next checkpoint (it ends as "cancelled" if it raises CancelledError)
+- Finished jobs are kept for status lookups, the most recent `history` of them
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobQueueFull(RuntimeError):
+    """Too many jobs are already waiting for a worker."""
+
+
+@dataclass
+class Job:
+    id: str
+    key: str
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    result: Any = field(default=None, repr=False)
+    # Set by cancel(); long-running work checks it between steps
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+
+class JobQueue:
+    """Runs submitted jobs on a bounded thread pool, one per key at a time."""
+
+    def __init__(self, max_workers: int = 2, max_queued: int = 16, history: int = 100) -> None:
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.history = history
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        # key -> id of its queued or running job
+        self._active: Dict[str, str] = {}
+        # Ids of queued jobs, in the order the pool will start them
+        self._queue: Deque[str] = deque()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def submit(self, key: str, fn: Callable[[Job], Any]) -> Tuple[Job, bool]:
+        """Enqueue fn(job) under key; returns (job, created). created=False for a duplicate."""
+        with self._lock:
+            active = self._active.get(key)
+            if active is not None:
+                return self._jobs[active], False
+            if len(self._queue) >= self.max_queued:
+                raise JobQueueFull(f"{len(self._queue)} jobs already queued")
+            job = Job(id=uuid.uuid4().hex, key=key)
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+            self._queue.append(job.id)
+            self._prune()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+            self._executor.submit(self._run, job, fn)
+        print(f"[jobs] Queued {key} as {job.id} (position {len(self._queue)})")
+        return job, True
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]) -> None:
+        with self._lock:
+            if job.status == CANCELLED:
+                return
+            self._queue.remove(job.id)
+            job.status = RUNNING
+            job.started_at = time.time()
+        try:
+            result = fn(job)
+        except CancelledError:
+            status, error, result = CANCELLED, None, None
+        except Exception as exc:  # noqa: BLE001 - reported through the job status
+            status, error, result = FAILED, f"{type(exc).__name__}: {exc}", None
+        else:
+            status, error = DONE, None
+        with self._lock:
+            job.status, job.error, job.result = status, error, result
+            job.finished_at = time.time()
+            if self._active.get(job.key) == job.id:
+                del self._active[job.key]
+        print(f"[jobs] {job.key} ({job.id}) {status} after {job.finished_at - job.started_at:.1f}s")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based place in the queue, or None when the job is not waiting."""
+        with self._lock:
+            try:
+                return self._queue.index(job_id) + 1
+            except ValueError:
+                return None
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job now, or ask a running one to stop. None for unknown ids."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job.cancel_event.set()
+            if job.status == QUEUED:
+                self._queue.remove(job.id)
+                job.status = CANCELLED
+                job.finished_at = time.time()
+                del self._active[job.key]
+        return job
+
+    def info(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """JSON-friendly status of a job, including its queue position."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        return {
+            "job_id": job.id,
+            "key": job.key,
+            "status": job.status,
+            "queue_position": self.position(job.id),
+            "cancel_requested": job.cancel_event.is_set(),
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "error": job.error,
+        }
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+            return {"queued": len(self._queue), "running": running, "workers": self.max_workers}
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    # Called with self._lock held
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+
+# ============================================================================
+# SINGLETON
+# ============================================================================
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide job queue, sized from STORYBOARD_JOB_WORKERS / STORYBOARD_JOB_QUEUE."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue(
+                    max_workers=int(os.getenv("STORYBOARD_JOB_WORKERS", "2")),
+                    max_queued=int(os.getenv("STORYBOARD_JOB_QUEUE", "16")),
+                )
+    return _queue
+
+
+def configure_job_queue(queue: Optional[JobQueue]) -> None:
+    """Replace the process-wide queue (tests, custom sizing); None resets to defaults."""
+    global _queue
+    with _queue_lock:
+        _queue = queue
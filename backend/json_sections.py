@@ -0,0 +1,112 @@
+"""
+Incremental parser for streamed JSON objects.
+
+Feed it text deltas (e.g. from gemini_utils.stream_gemini) and it returns each
+top-level `key: value` pair of the object as soon as that value closes, so
+downstream steps can start on early sections while the model is still writing
+later ones.
+
+    parser = JsonSectionParser()
+    for delta in deltas:
+        for key, value in parser.feed(delta):
+            ...
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+_WHITESPACE = " \t\r\n"
+
+
+class JsonSectionParser:
+    """Emit top-level sections of a single JSON object as they complete.
+
+    Anything before the first "{" (e.g. a ```json fence) and after the closing
+    "}" is ignored. A section whose text is not valid JSON raises
+    json.JSONDecodeError from feed().
+    """
+
+    def __init__(self) -> None:
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self.started = False
+        self.done = False
+        self.sections: Dict[str, Any] = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a text delta; return the sections that closed within it."""
+        self._text += chunk
+        emitted: List[Tuple[str, Any]] = []
+
+        while self._pos < len(self._text) and not self.done:
+            i = self._pos
+            ch = self._text[i]
+            self._pos += 1
+
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        if self._key is None:
+                            self._key = json.loads(self._text[self._key_start : i + 1])
+                        elif self._value_start is not None:
+                            emitted.append(self._emit(i + 1))
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._key is None:
+                        self._key_start = i
+                    elif self._value_start is None:
+                        self._value_start = i
+            elif ch in "{[":
+                if self._depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    emitted.append(self._emit(i + 1))
+                elif self._depth == 0:
+                    if self._value_start is not None:
+                        # Trailing scalar value, e.g. {"a": 1}
+                        emitted.append(self._emit(i))
+                    self.done = True
+            elif self._depth == 1:
+                if ch == ",":
+                    if self._value_start is not None:
+                        emitted.append(self._emit(i))
+                elif ch not in _WHITESPACE and ch != ":":
+                    if self._key is not None and self._value_start is None:
+                        self._value_start = i
+
+        return emitted
+
+    def _emit(self, end: int) -> Tuple[str, Any]:
+        assert self._key is not None and self._value_start is not None
+        key = self._key
+        value = json.loads(self._text[self._value_start : end])
+        self.sections[key] = value
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        return key, value
@@ -0,0 +1,192 @@
+"""
+Scene-change keyframes as a cheaper alternative to full-video input.
+
+Screen-recorded walkthroughs are mostly static screens with hard cuts
+between them, so the distinct screens carry nearly all the information:
+
+- decode_frames(): ffmpeg decodes the video to small grayscale frames
+  (160x90 at sample_fps) straight into a NumPy array
+- scene_scores(): per-frame change score, the mean of the grayscale
+  histogram distance and the mean absolute pixel difference, vectorized
+- select_keyframes(): cuts where the score passes threshold (min_gap apart),
+  one representative frame from the middle of each scene, capped at max_frames
+- extract_keyframes(): the above, plus a JPEG of each representative frame
+
+    frames = [k.as_video_frame() for k in extract_keyframes(VIDEO_PATH)]
+    analyze_walkthrough_for_ads(video_uri="", model=..., video_frames=frames)
+
+benchmark_keyframes.py compares this against full-video analysis.
+"""
+
+from __future__ import annotations
+
+import shutil
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from gemini_utils import VideoFrame
+
+SCORE_WIDTH = 160
+SCORE_HEIGHT = 90
+HISTOGRAM_BINS = 32
+
+DEFAULT_SAMPLE_FPS = 1.0
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_MIN_GAP_SECONDS = 2.0
+DEFAULT_MAX_FRAMES = 24
+# Output JPEG height; the API downsamples larger images anyway
+DEFAULT_IMAGE_HEIGHT = 720
+
+FFMPEG_TIMEOUT_SECONDS = 600
+
+
+@dataclass
+class Keyframe:
+    timestamp_sec: float
+    scene_start_sec: float
+    scene_end_sec: float
+    # Change score of the cut that opened the scene (1.0 for the first scene)
+    score: float
+    image: bytes = b""
+    mime_type: str = "image/jpeg"
+
+    def as_video_frame(self) -> VideoFrame:
+        return VideoFrame(timestamp_sec=self.timestamp_sec, mime_type=self.mime_type, data=self.image)
+
+
+def _require_ffmpeg() -> None:
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg is required for keyframe extraction")
+
+
+# ============================================================================
+# DECODE
+# ============================================================================
+
+
+def decode_frames(
+    path: Path,
+    sample_fps: float = DEFAULT_SAMPLE_FPS,
+    width: int = SCORE_WIDTH,
+    height: int = SCORE_HEIGHT,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(frames uint8 [n, height, width], timestamps_sec [n]) of small grayscale frames."""
+    _require_ffmpeg()
+    completed = subprocess.run(
+        [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", str(path),
+            "-vf", f"fps={sample_fps:g},scale={width}:{height},format=gray",
+            "-f", "rawvideo", "-",
+        ],
+        capture_output=True,
+        timeout=FFMPEG_TIMEOUT_SECONDS,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"ffmpeg decode failed: {completed.stderr.decode(errors='replace')[-500:]}")
+    frame_size = width * height
+    count = len(completed.stdout) // frame_size
+    frames = np.frombuffer(completed.stdout[: count * frame_size], dtype=np.uint8).reshape(count, height, width)
+    return frames, np.arange(count, dtype=np.float64) / sample_fps
+
+
+def extract_frame_image(path: Path, timestamp_sec: float, height: int = DEFAULT_IMAGE_HEIGHT) -> bytes:
+    """JPEG bytes of the frame at timestamp_sec."""
+    _require_ffmpeg()
+    completed = subprocess.run(
+        [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-ss", f"{timestamp_sec:.3f}", "-i", str(path),
+            "-frames:v", "1", "-vf", f"scale=-2:'min({height},ih)'",
+            "-q:v", "3", "-f", "image2pipe", "-vcodec", "mjpeg", "-",
+        ],
+        capture_output=True,
+        timeout=FFMPEG_TIMEOUT_SECONDS,
+    )
+    if completed.returncode != 0 or not completed.stdout:
+        raise RuntimeError(f"ffmpeg could not extract frame at {timestamp_sec:.1f}s")
+    return completed.stdout
+
+
+# ============================================================================
+# SCORE / SELECT
+# ============================================================================
+
+
+def scene_scores(frames: np.ndarray, bins: int = HISTOGRAM_BINS) -> np.ndarray:
+    """Change score in [0, 1] between each frame and the previous one (score[0] = 1)."""
+    count = frames.shape[0]
+    if count == 0:
+        return np.zeros(0)
+    flat = frames.reshape(count, -1)
+
+    # All histograms in one bincount: offset each frame's bin ids by frame * bins
+    bin_ids = (flat.astype(np.int64) * bins) >> 8
+    bin_ids += np.arange(count, dtype=np.int64)[:, None] * bins
+    histograms = np.bincount(bin_ids.ravel(), minlength=count * bins).reshape(count, bins)
+    histograms = histograms / flat.shape[1]
+    histogram_distance = 0.5 * np.abs(np.diff(histograms, axis=0)).sum(axis=1)
+
+    pixel_distance = np.abs(np.diff(flat.astype(np.int16), axis=0)).mean(axis=1) / 255.0
+
+    scores = np.empty(count)
+    scores[0] = 1.0
+    scores[1:] = 0.5 * (histogram_distance + pixel_distance)
+    return scores
+
+
+def select_keyframes(
+    scores: np.ndarray,
+    timestamps: np.ndarray,
+    threshold: float = DEFAULT_THRESHOLD,
+    min_gap_seconds: float = DEFAULT_MIN_GAP_SECONDS,
+    max_frames: int = DEFAULT_MAX_FRAMES,
+) -> List[Keyframe]:
+    """One keyframe per scene, taken from the middle of the scene."""
+    if len(scores) == 0:
+        return []
+    candidates = np.flatnonzero(scores >= threshold)
+    cuts: List[int] = [0]
+    for index in candidates[1:] if candidates.size and candidates[0] == 0 else candidates:
+        if timestamps[index] - timestamps[cuts[-1]] >= min_gap_seconds:
+            cuts.append(int(index))
+    if len(cuts) > max_frames:
+        # Keep the strongest cuts (the first scene always stays)
+        strongest = sorted(cuts[1:], key=lambda i: scores[i], reverse=True)[: max_frames - 1]
+        cuts = [0] + sorted(strongest)
+
+    step = timestamps[1] - timestamps[0] if len(timestamps) > 1 else 1.0
+    keyframes: List[Keyframe] = []
+    for position, start in enumerate(cuts):
+        end = cuts[position + 1] if position + 1 < len(cuts) else len(scores)
+        middle = (start + end - 1) // 2
+        keyframes.append(
+            Keyframe(
+                timestamp_sec=float(timestamps[middle]),
+                scene_start_sec=float(timestamps[start]),
+                scene_end_sec=float(timestamps[end - 1] + step),
+                score=float(scores[start]),
+            )
+        )
+    return keyframes
+
+
+def extract_keyframes(
+    path: Path,
+    sample_fps: float = DEFAULT_SAMPLE_FPS,
+    threshold: float = DEFAULT_THRESHOLD,
+    min_gap_seconds: float = DEFAULT_MIN_GAP_SECONDS,
+    max_frames: int = DEFAULT_MAX_FRAMES,
+    image_height: int = DEFAULT_IMAGE_HEIGHT,
+) -> List[Keyframe]:
+    """Representative keyframes of path, with JPEG images attached."""
+    frames, timestamps = decode_frames(path, sample_fps)
+    keyframes = select_keyframes(scene_scores(frames), timestamps, threshold, min_gap_seconds, max_frames)
+    for keyframe in keyframes:
+        keyframe.image = extract_frame_image(path, keyframe.timestamp_sec, image_height)
+    print(f"[keyframes] {Path(path).name}: {len(frames)} sampled frames -> {len(keyframes)} keyframes")
+    return keyframes
@@ -1,11 +1,16 @@
 import json
 import os
+from concurrent.futures import CancelledError
+from functools import partial
 
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
+from cost_ledger import cost_scope, get_cost_ledger
+from deadlines import deadline
+from jobs import Job, JobQueueFull, get_job_queue
 from storyboard.schemas import Status, Storyboard
 from storyboard.storyboard_service import (
     choose_generator,
@@ -13,13 +18,18 @@ from storyboard.storyboard_service import (
     generate_storyboard,
     load_research,
     mock_generate_storyboard,
+    run_lock,
     storyboard_path,
     status_path,
     write_status,
+    write_storyboard,
 )
 
 load_dotenv()
 
+# Upper bound for one storyboard job, passed down to every outbound model call
+STORYBOARD_DEADLINE_SECONDS = float(os.getenv("STORYBOARD_DEADLINE_SECONDS", "600"))
+
 app = FastAPI(title="ViralLaunch Storyboard Service", version="0.1.0")
 
 # Configure CORS
@@ -32,48 +42,107 @@ app.add_middleware(
 )
 
 
-@app.post("/runs/{run_id}/storyboard", response_model=Storyboard)
-def create_storyboard(run_id: str) -> Storyboard:
-    # For now we operate on a single static run id.
-    run_id = "first"
-    research = load_research(run_id)
-    write_status(Status(run_id=run_id, status="processing", message="Generating storyboard..."))
+def _failed_assets(storyboard: Storyboard) -> int:
+    assets = [asset for group in storyboard.assets.values() for asset in group]
+    return sum(item.status == "failed" for item in [*assets, *storyboard.storyboard_frames])
 
-    try:
-        if choose_generator():
-            try:
-                configure_gemini_if_needed()
-                print("[storyboard] Using Gemini pipeline")
-                write_status(Status(run_id=run_id, status="processing", message="Generating with Gemini..."))
-                storyboard = generate_storyboard(run_id, research)
-            except Exception as exc:  # noqa: BLE001
-                # Fallback to mock if Gemini model is unavailable
-                print(f"[storyboard] Gemini failed, falling back to mock: {exc}")
-                write_status(
-                    Status(
-                        run_id=run_id,
-                        status="processing",
-                        message="Gemini unavailable, using mock",
+
+def _run_storyboard(run_id: str, fresh_images: bool, resume: bool, job: Job) -> None:
+    # One generation per run at a time, also across server processes; other runs proceed
+    with run_lock(run_id):
+        research = load_research(run_id)
+        # Costs are per generation, not cumulative across regenerations of the run
+        get_cost_ledger().reset(run_id)
+        write_status(Status(run_id=run_id, status="processing", message="Generating storyboard..."))
+
+        try:
+            if choose_generator():
+                try:
+                    configure_gemini_if_needed()
+                    print("[storyboard] Using Gemini pipeline")
+                    write_status(Status(run_id=run_id, status="processing", message="Generating with Gemini..."))
+                    with deadline(STORYBOARD_DEADLINE_SECONDS), cost_scope(run_id):
+                        storyboard = generate_storyboard(
+                            run_id, research, fresh_images=fresh_images, resume=resume, cancel=job.cancel_event
+                        )
+                except CancelledError:
+                    raise
+                except Exception as exc:  # noqa: BLE001
+                    # Fallback to mock if Gemini model is unavailable
+                    print(f"[storyboard] Gemini failed, falling back to mock: {exc}")
+                    write_status(
+                        Status(
+                            run_id=run_id,
+                            status="processing",
+                            message="Gemini unavailable, using mock",
+                        )
                     )
-                )
+                    storyboard = mock_generate_storyboard(run_id, research)
+            else:
+                print("[storyboard] Gemini key not set, using mock generator")
                 storyboard = mock_generate_storyboard(run_id, research)
-        else:
-            print("[storyboard] Gemini key not set, using mock generator")
-            storyboard = mock_generate_storyboard(run_id, research)
 
-        path = storyboard_path(run_id)
-        path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_text(json.dumps(storyboard.model_dump(), ensure_ascii=False, indent=2), encoding="utf-8")
-        write_status(Status(run_id=run_id, status="done", message="Storyboard ready"))
-        return storyboard
-    except Exception as exc:  # noqa: BLE001
-        write_status(Status(run_id=run_id, status="error", message=str(exc)))
-        raise
+            write_storyboard(run_id, storyboard)
+            failed = _failed_assets(storyboard)
+            message = f"Storyboard ready ({failed} images failed, regenerate to retry them)" if failed else "Storyboard ready"
+            write_status(Status(run_id=run_id, status="done", message=message))
+        except CancelledError:
+            write_status(Status(run_id=run_id, status="cancelled", message="Storyboard generation cancelled"))
+            raise
+        except Exception as exc:  # noqa: BLE001
+            write_status(Status(run_id=run_id, status="error", message=str(exc)))
+            raise
+
+
+@app.post("/runs/{run_id}/storyboard", status_code=202)
+def create_storyboard(run_id: str, fresh_images: bool = False, resume: bool = True) -> dict:
+    # Runs in the background; poll GET /jobs/{job_id}, then GET /runs/{run_id}/storyboard
+    # ?fresh_images=true skips the image cache for a fresh take on every image
+    # Only what changed in research_output.json (or failed last time) is regenerated;
+    # ?resume=false rebuilds everything
+    # Fail fast on a missing research_output.json instead of in the job
+    load_research(run_id)
+    queue = get_job_queue()
+    try:
+        # A storyboard already queued or running for the run is returned as-is
+        job, created = queue.submit(
+            f"storyboard:{run_id}", partial(_run_storyboard, run_id, fresh_images, resume)
+        )
+    except JobQueueFull as exc:
+        raise HTTPException(status_code=503, detail=f"Storyboard queue is full: {exc}") from exc
+    if created:
+        write_status(Status(run_id=run_id, status="queued", message="Waiting for a storyboard worker"))
+    return {"run_id": run_id, **queue.info(job.id)}
+
+
+def _job_info(job_id: str) -> dict:
+    info = get_job_queue().info(job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return info
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str) -> dict:
+    return _job_info(job_id)
+
+
+@app.get("/jobs/{job_id}/position")
+def get_job_position(job_id: str) -> dict:
+    # None once the job has left the queue
+    info = _job_info(job_id)
+    return {"job_id": job_id, "status": info["status"], "queue_position": info["queue_position"]}
+
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str) -> dict:
+    # Queued jobs are dropped; running ones stop before their next task
+    get_job_queue().cancel(job_id)
+    return _job_info(job_id)
 
 
 @app.get("/runs/{run_id}/storyboard", response_model=Storyboard)
 def get_storyboard(run_id: str) -> Storyboard:
-    run_id = "first"
     path = storyboard_path(run_id)
     if not path.exists():
         raise HTTPException(status_code=404, detail="storyboard.json not found for run")
@@ -82,13 +151,26 @@ def get_storyboard(run_id: str) -> Storyboard:
 
 @app.get("/runs/{run_id}/status", response_model=Status)
 def get_status(run_id: str) -> Status:
-    run_id = "first"
     path = status_path(run_id)
     if not path.exists():
         return Status(run_id=run_id, status="queued", message="Waiting to start")
     return Status.model_validate(json.loads(path.read_text(encoding="utf-8")))
 
 
+@app.get("/runs/{run_id}/cost")
+def get_cost(run_id: str) -> dict:
+    ledger = get_cost_ledger()
+    if ledger.has_run(run_id):
+        return ledger.totals(run_id)
+    # After a restart only the totals persisted in status.json remain
+    path = status_path(run_id)
+    if path.exists():
+        status = Status.model_validate(json.loads(path.read_text(encoding="utf-8")))
+        if status.cost is not None:
+            return status.cost
+    raise HTTPException(status_code=404, detail="no cost recorded for run")
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
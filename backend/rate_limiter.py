@@ -0,0 +1,257 @@
+"""
+Process-wide rate limiter and adaptive concurrency governor, keyed by model.
+
+Every outbound Gemini / Veo call acquires a slot for its model before it runs:
+
+    with get_rate_limiter().slot("gemini-3-pro-image-preview"):
+        client.models.generate_content(...)
+
+    async with get_rate_limiter().aslot("gemini-3-pro-preview"):
+        await acall_gemini(...)
+
+Per model this enforces
+- a token bucket refilled at the model's RPM
+- a cap on calls in flight, adjusted with AIMD: +1/limit per successful call,
+  halved on a 429 / RESOURCE_EXHAUSTED, x0.9 when latency exceeds the target
+
+so call sites no longer need their own fixed worker counts or sleeps. Waiting
+for a slot stops with deadlines.DeadlineExceeded once the request deadline passes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from deadlines import check_deadline, remaining
+
+# ============================================================================
+# LIMITS
+# ============================================================================
+
+
+@dataclass
+class ModelLimits:
+    # Requests per minute (token bucket refill rate)
+    rpm: float
+    # Upper bound for calls in flight; AIMD moves between min and max
+    max_concurrency: int
+    min_concurrency: int = 1
+    # Successful calls slower than this shrink concurrency; None disables
+    target_latency_seconds: Optional[float] = None
+
+
+DEFAULT_MODEL_LIMITS: Dict[str, ModelLimits] = {
+    "gemini-3-pro-preview": ModelLimits(rpm=60, max_concurrency=8, target_latency_seconds=90),
+    "gemini-3-pro-image-preview": ModelLimits(rpm=20, max_concurrency=10, target_latency_seconds=60),
+    "veo-3.1-generate-preview": ModelLimits(rpm=10, max_concurrency=4),
+}
+FALLBACK_MODEL_LIMITS = ModelLimits(rpm=60, max_concurrency=8)
+
+THROTTLE_DECREASE = 0.5
+SLOW_DECREASE = 0.9
+
+
+def _model_key(model: str) -> str:
+    # "models/gemini-3-pro-preview" and "gemini-3-pro-preview" share a limiter
+    return model.split("/", 1)[1] if model.startswith("models/") else model
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    """True for 429 / quota errors from google-genai, google-generativeai or gemini_utils."""
+    for attr in ("code", "status_code"):
+        if getattr(exc, attr, None) == 429:
+            return True
+    message = str(exc).lower()
+    return any(
+        marker in message
+        for marker in ("429", "resource_exhausted", "resource has been exhausted", "rate limit")
+    )
+
+
+# ============================================================================
+# PER-MODEL LIMITER
+# ============================================================================
+
+
+class ModelLimiter:
+    """Token bucket + AIMD concurrency window for one model (thread-safe)."""
+
+    def __init__(self, model: str, limits: ModelLimits) -> None:
+        self.model = model
+        self.limits = limits
+        self._cond = threading.Condition()
+        self._tokens = float(limits.max_concurrency)
+        self._last_refill = time.monotonic()
+        self._limit = float(limits.max_concurrency)
+        self._in_flight = 0
+        self._counters = {"calls": 0, "throttled": 0, "slow": 0, "failed": 0}
+
+    @property
+    def concurrency_limit(self) -> int:
+        return max(self.limits.min_concurrency, int(self._limit))
+
+    def _refill(self, now: float) -> None:
+        rate = self.limits.rpm / 60.0
+        capacity = float(self.limits.max_concurrency)
+        self._tokens = min(capacity, self._tokens + (now - self._last_refill) * rate)
+        self._last_refill = now
+
+    def try_acquire(self) -> float:
+        """Take a slot if possible; return 0.0 on success, else seconds to wait before retrying."""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            if self._in_flight >= self.concurrency_limit:
+                return 0.05
+            if self._tokens < 1.0:
+                return (1.0 - self._tokens) / (self.limits.rpm / 60.0)
+            self._tokens -= 1.0
+            self._in_flight += 1
+            return 0.0
+
+    def acquire(self) -> None:
+        while True:
+            wait = self.try_acquire()
+            if wait == 0.0:
+                return
+            # Give up instead of queueing past the caller's request deadline
+            check_deadline()
+            left = remaining()
+            with self._cond:
+                # Woken early when a slot is released
+                self._cond.wait(timeout=wait if left is None else min(wait, left))
+
+    def release(self, *, latency: float, error: Optional[BaseException] = None) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._counters["calls"] += 1
+            limits = self.limits
+            if error is not None and is_rate_limit_error(error):
+                self._counters["throttled"] += 1
+                self._limit = max(limits.min_concurrency, self._limit * THROTTLE_DECREASE)
+                # Stop the burst: everyone waits for fresh tokens
+                self._tokens = 0.0
+            elif error is not None:
+                self._counters["failed"] += 1
+            elif limits.target_latency_seconds and latency > limits.target_latency_seconds:
+                self._counters["slow"] += 1
+                self._limit = max(limits.min_concurrency, self._limit * SLOW_DECREASE)
+            else:
+                self._limit = min(limits.max_concurrency, self._limit + 1.0 / self._limit)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "concurrency_limit": self.concurrency_limit,
+                "in_flight": self._in_flight,
+                "tokens": round(self._tokens, 2),
+                **self._counters,
+            }
+
+
+# ============================================================================
+# PROCESS-WIDE REGISTRY
+# ============================================================================
+
+
+class RateLimiter:
+    """Registry of ModelLimiter instances, one per model name."""
+
+    def __init__(self, limits: Optional[Dict[str, ModelLimits]] = None) -> None:
+        self._limits = dict(DEFAULT_MODEL_LIMITS if limits is None else limits)
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model: str) -> ModelLimiter:
+        key = _model_key(model)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = ModelLimiter(key, self._limits.get(key, FALLBACK_MODEL_LIMITS))
+                self._limiters[key] = limiter
+            return limiter
+
+    def configure(self, model: str, limits: ModelLimits) -> None:
+        """Set limits for a model; replaces its limiter (in-flight slots stay with the old one)."""
+        key = _model_key(model)
+        with self._lock:
+            self._limits[key] = limits
+            self._limiters.pop(key, None)
+
+    @contextlib.contextmanager
+    def slot(self, model: str) -> Iterator[None]:
+        limiter = self.for_model(model)
+        limiter.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as exc:
+            limiter.release(latency=time.monotonic() - started, error=exc)
+            raise
+        limiter.release(latency=time.monotonic() - started)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, model: str) -> AsyncIterator[None]:
+        limiter = self.for_model(model)
+        while True:
+            wait = limiter.try_acquire()
+            if wait == 0.0:
+                break
+            check_deadline()
+            left = remaining()
+            await asyncio.sleep(min(wait, 0.25) if left is None else max(0.0, min(wait, 0.25, left)))
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as exc:
+            limiter.release(latency=time.monotonic() - started, error=exc)
+            raise
+        limiter.release(latency=time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {model: limiter.stats() for model, limiter in limiters.items()}
+
+
+class _UnlimitedRateLimiter(RateLimiter):
+    """Used when RATE_LIMITER_DISABLED is set: every slot is granted immediately."""
+
+    @contextlib.contextmanager
+    def slot(self, model: str) -> Iterator[None]:
+        yield
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, model: str) -> AsyncIterator[None]:
+        yield
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide limiter; RATE_LIMITER_DISABLED=1 turns every slot into a no-op."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                if os.getenv("RATE_LIMITER_DISABLED", "").lower() in ("1", "true", "yes"):
+                    _rate_limiter = _UnlimitedRateLimiter()
+                else:
+                    _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+def configure_rate_limiter(limiter: Optional[RateLimiter]) -> None:
+    """Install a different process-wide limiter (None: rebuild from defaults on next use)."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = limiter
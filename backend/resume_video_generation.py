@@ -120,23 +120,19 @@ async def resume_generation(run_id: str):
     # Initialize Veo client with image_base_path for resolving relative URLs
     veo_client = VeoClient(api_key=api_key, image_base_path=str(PUBLIC_DIR))
     
-    # Generate videos one at a time to avoid rate limits
-    success_count = 0
-    for frame in pending_frames:
-        scene_id = int(frame["scene_id"])
-        image_url = frame["image_url"]  # e.g. "/runs/second/frames/scene-01.png"
-        
-        success = await generate_single_video(
-            veo_client, frame, image_url, videos_dir, scene_id
+    # Submit all remaining videos at once; VeoClient paces them through the
+    # shared per-model rate limiter instead of a fixed sleep between requests
+    results = await asyncio.gather(*[
+        generate_single_video(
+            veo_client,
+            frame,
+            frame["image_url"],  # e.g. "/runs/second/frames/scene-01.png"
+            videos_dir,
+            int(frame["scene_id"]),
         )
-        
-        if success:
-            success_count += 1
-        
-        # Small delay between requests to help with rate limits
-        if pending_frames.index(frame) < len(pending_frames) - 1:
-            print("  ⏳ Waiting 5s before next video...")
-            await asyncio.sleep(5)
+        for frame in pending_frames
+    ])
+    success_count = sum(1 for success in results if success)
     
     print("-" * 40)
     print(f"\n✅ Generated {success_count}/{len(pending_frames)} videos")
@@ -0,0 +1,253 @@
+"""
+Shotlist executor: cut update_shotlist tool calls out of the source video.
+
+call_gemini(..., tools=[SHOTLIST_TOOL]) returns update_shotlist calls with
+in / out timestamps and keep / mute audio per shot. execute_shotlist() turns
+them into clips of the real footage:
+
+    title, description, shots = shots_from_tool_calls(result["tool_calls"])
+    manifest = execute_shotlist(source_video, shots, run_dir, title=title)
+
+- Shots are cut in parallel (one ffmpeg process each)
+- A shot whose start is on (or within snap_seconds of) a keyframe is cut with
+  stream copy: no re-encode, finished in well under a second
+- Other shots are re-encoded, since a copied cut must start on a keyframe
+- Clips go to <run_dir>/shots/, the manifest to <run_dir>/shotlist.json
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+SHOTLIST_TOOL_NAME = "update_shotlist"
+SHOTS_DIRNAME = "shots"
+MANIFEST_FILENAME = "shotlist.json"
+
+# A copied cut may start this much before the requested in point
+DEFAULT_SNAP_SECONDS = 0.25
+FFMPEG_TIMEOUT_SECONDS = 300
+
+
+@dataclass
+class Shot:
+    id: str
+    start: float
+    end: float
+    description: str = ""
+    label: str = ""
+    audio: str = "keep"
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class CutPlan:
+    # "copy" (stream copy from a keyframe) or "encode"
+    mode: str
+    start: float
+    end: float
+
+
+# ============================================================================
+# TOOL CALLS
+# ============================================================================
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_-]+", "-", value).strip("-") or "shot"
+
+
+def shots_from_tool_calls(tool_calls: Sequence[Dict[str, Any]]) -> Tuple[str, str, List[Shot]]:
+    """(title, description, shots) from the last update_shotlist call; invalid shots are skipped."""
+    calls = [call for call in tool_calls if call.get("name") == SHOTLIST_TOOL_NAME]
+    if not calls:
+        return "", "", []
+    args = calls[-1].get("args") or {}
+
+    shots: List[Shot] = []
+    seen: set = set()
+    for index, raw in enumerate(args.get("shots") or [], start=1):
+        try:
+            start, end = max(0.0, float(raw["in"])), float(raw["out"])
+        except (KeyError, TypeError, ValueError):
+            print(f"[shotlist] Skipping shot {index}: missing in/out")
+            continue
+        if end <= start:
+            print(f"[shotlist] Skipping shot {index}: out {end} <= in {start}")
+            continue
+        shot_id = _slug(str(raw.get("id") or f"shot-{index}"))
+        if shot_id in seen:
+            shot_id = f"{shot_id}-{index}"
+        seen.add(shot_id)
+        shots.append(
+            Shot(
+                id=shot_id,
+                start=start,
+                end=end,
+                description=raw.get("description", ""),
+                label=raw.get("label", ""),
+                audio="mute" if raw.get("audio") == "mute" else "keep",
+            )
+        )
+    return args.get("title", ""), args.get("description", ""), shots
+
+
+# ============================================================================
+# PLANNING
+# ============================================================================
+
+
+def probe_keyframes(source: Path) -> List[float]:
+    """Sorted keyframe timestamps of the first video stream (ffprobe)."""
+    completed = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-select_streams", "v:0", "-skip_frame", "nokey",
+            "-show_entries", "frame=pts_time", "-of", "csv=p=0", str(source),
+        ],
+        capture_output=True,
+        text=True,
+        timeout=FFMPEG_TIMEOUT_SECONDS,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {completed.stderr.strip()[-500:]}")
+    times = []
+    for line in completed.stdout.splitlines():
+        try:
+            times.append(float(line.strip().rstrip(",")))
+        except ValueError:
+            continue
+    return sorted(times)
+
+
+def plan_cut(shot: Shot, keyframes: Sequence[float], snap_seconds: float = DEFAULT_SNAP_SECONDS) -> CutPlan:
+    """Stream copy when a keyframe sits at (or just before) the in point, else re-encode."""
+    # Last keyframe at or before the in point (with float slack)
+    index = bisect_left(keyframes, shot.start + 1e-3) - 1
+    if index >= 0 and shot.start - keyframes[index] <= snap_seconds:
+        return CutPlan(mode="copy", start=keyframes[index], end=shot.end)
+    return CutPlan(mode="encode", start=shot.start, end=shot.end)
+
+
+def build_cut_command(source: Path, dest: Path, plan: CutPlan, mute: bool) -> List[str]:
+    command = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-ss", f"{plan.start:.3f}", "-i", str(source), "-t", f"{plan.end - plan.start:.3f}",
+        "-map", "0:v:0",
+    ]
+    if not mute:
+        command += ["-map", "0:a:0?"]
+    if plan.mode == "copy":
+        command += ["-c", "copy", "-avoid_negative_ts", "make_zero"]
+    else:
+        command += ["-c:v", "libx264", "-preset", "veryfast", "-crf", "18"]
+        if not mute:
+            command += ["-c:a", "aac", "-b:a", "128k"]
+    if mute:
+        command.append("-an")
+    command += ["-movflags", "+faststart", str(dest)]
+    return command
+
+
+def _run_ffmpeg(command: List[str]) -> None:
+    completed = subprocess.run(command, capture_output=True, text=True, timeout=FFMPEG_TIMEOUT_SECONDS)
+    if completed.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({completed.returncode}): {completed.stderr.strip()[-500:]}")
+
+
+# ============================================================================
+# EXECUTION
+# ============================================================================
+
+
+def _cut(source: Path, shot: Shot, plan: CutPlan, dest: Path) -> Dict[str, Any]:
+    entry: Dict[str, Any] = {
+        **asdict(shot),
+        "file": f"{SHOTS_DIRNAME}/{dest.name}",
+        "mode": plan.mode,
+        "cut_in": round(plan.start, 3),
+        "cut_out": round(plan.end, 3),
+    }
+    started = time.monotonic()
+    tmp_path = dest.with_name(f"{dest.stem}.tmp{dest.suffix}")
+    try:
+        _run_ffmpeg(build_cut_command(source, tmp_path, plan, mute=shot.audio == "mute"))
+        os.replace(tmp_path, dest)
+        entry["status"] = "done"
+    except Exception as exc:  # noqa: BLE001 - one bad shot should not sink the rest
+        print(f"[shotlist] ✗ {shot.id}: {exc}")
+        entry["status"] = "error"
+        entry["error"] = str(exc)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    entry["seconds"] = round(time.monotonic() - started, 3)
+    return entry
+
+
+def execute_shotlist(
+    source: Path,
+    shots: Sequence[Shot],
+    run_dir: Path,
+    title: str = "",
+    description: str = "",
+    max_workers: Optional[int] = None,
+    snap_seconds: float = DEFAULT_SNAP_SECONDS,
+) -> Dict[str, Any]:
+    """Cut every shot from source into run_dir/shots and write run_dir/shotlist.json."""
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg is required to cut the shotlist")
+    source = Path(source)
+    shots_dir = Path(run_dir) / SHOTS_DIRNAME
+    shots_dir.mkdir(parents=True, exist_ok=True)
+
+    keyframes = probe_keyframes(source)
+    plans = [plan_cut(shot, keyframes, snap_seconds) for shot in shots]
+    started = time.monotonic()
+    workers = max_workers or min(len(shots), os.cpu_count() or 1) or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_cut, source, shot, plan, shots_dir / f"{index:02d}-{shot.id}.mp4")
+            for index, (shot, plan) in enumerate(zip(shots, plans), start=1)
+        ]
+        entries = [future.result() for future in futures]
+
+    manifest = {
+        "source": source.name,
+        "title": title,
+        "description": description,
+        "shots": entries,
+        "stream_copied": sum(1 for e in entries if e["mode"] == "copy"),
+        "reencoded": sum(1 for e in entries if e["mode"] == "encode"),
+        "seconds": round(time.monotonic() - started, 3),
+    }
+    manifest_path = Path(run_dir) / MANIFEST_FILENAME
+    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(
+        f"[shotlist] {len(entries)} shots in {manifest['seconds']:.1f}s "
+        f"({manifest['stream_copied']} stream copy, {manifest['reencoded']} re-encoded) -> {manifest_path}"
+    )
+    return manifest
+
+
+def execute_tool_calls(
+    source: Path,
+    tool_calls: Sequence[Dict[str, Any]],
+    run_dir: Path,
+    **kwargs: Any,
+) -> Optional[Dict[str, Any]]:
+    """execute_shotlist for the update_shotlist call in a GeminiCallResult's tool_calls, if any."""
+    title, description, shots = shots_from_tool_calls(tool_calls)
+    if not shots:
+        return None
+    return execute_shotlist(source, shots, run_dir, title=title, description=description, **kwargs)
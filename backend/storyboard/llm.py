@@ -8,8 +8,15 @@ from typing import List
 import google.generativeai as genai
 from fastapi import HTTPException
 
+from cost_ledger import track_call
+from deadlines import hedged, request_timeout
+from rate_limiter import get_rate_limiter
+
 from .schemas import Research
 
+TEXT_MODEL = "gemini-3-pro-preview"
+TEXT_REQUEST_TIMEOUT_SECONDS = 120
+
 
 class LLMCharacter:
     def __init__(self, id: str, name: str, role: str, description: str) -> None:
@@ -36,7 +43,23 @@ def configure_gemini() -> None:
 
 def _text_model():
     configure_gemini()
-    return genai.GenerativeModel("models/gemini-3-pro-preview")
+    return genai.GenerativeModel(f"models/{TEXT_MODEL}")
+
+
+def _generate_text(name: str, prompt: str) -> str:
+    """Run a short text prompt within the request deadline, hedged when HEDGE_REQUESTS is set."""
+    model = _text_model()
+
+    def call() -> str:
+        with get_rate_limiter().slot(TEXT_MODEL), track_call(TEXT_MODEL) as record:
+            response = model.generate_content(
+                prompt,
+                request_options={"timeout": request_timeout(TEXT_REQUEST_TIMEOUT_SECONDS)},
+            )
+            record.add_usage(response.usage_metadata)
+        return response.text or response.candidates[0].content.parts[0].text
+
+    return hedged(name, call)
 
 
 def _extract_json(response_text: str) -> dict:
@@ -54,11 +77,10 @@ def _extract_json(response_text: str) -> dict:
         raise HTTPException(status_code=500, detail=f"LLM returned invalid JSON: {exc}\nResponse: {response_text[:500]}") from exc
 
 
-def generate_characters(research: Research) -> List[LLMCharacter]:
-    model = _text_model()
+def characters_prompt(research: Research) -> str:
     script = research.selected_script
     hooks = [script.hook]
-    prompt = f"""You are generating cast for a viral short-form video storyboard.
+    return f"""You are generating cast for a viral short-form video storyboard.
 Story: {script.title}
 Tone: {script.tone}
 Hooks: {", ".join(hooks)}
@@ -67,8 +89,11 @@ Existing character references: {[c.name for c in script.assets.characters]}
 Return ONLY valid JSON (no markdown, no explanation) with this exact structure:
 {{"characters": [{{"id": "char_01", "name": "Character Name", "role": "their role", "description": "visual description for image generation"}}]}}
 """
-    response = model.generate_content(prompt)
-    response_text = response.text or response.candidates[0].content.parts[0].text
+
+
+def generate_characters(research: Research) -> List[LLMCharacter]:
+    prompt = characters_prompt(research)
+    response_text = _generate_text("storyboard.characters", prompt)
     print(f"[llm] Characters response: {response_text[:200]}...")
     data = _extract_json(response_text)
     characters = data.get("characters", [])
@@ -77,10 +102,9 @@ Return ONLY valid JSON (no markdown, no explanation) with this exact structure:
     return [LLMCharacter(id=char["id"], name=char["name"], role=char["role"], description=char["description"]) for char in characters]
 
 
-def generate_environments(research: Research) -> List[LLMEnvironment]:
-    model = _text_model()
+def environments_prompt(research: Research) -> str:
     script = research.selected_script
-    prompt = f"""Suggest 2-4 environments for the storyboard based on:
+    return f"""Suggest 2-4 environments for the storyboard based on:
 - Story: {script.title}
 - Tone: {script.tone}
 - Provided environments: {[env.name for env in script.assets.environments]}
@@ -88,8 +112,11 @@ def generate_environments(research: Research) -> List[LLMEnvironment]:
 Return ONLY valid JSON (no markdown, no explanation) with this exact structure:
 {{"environments": [{{"id": "env_01", "name": "Environment Name", "description": "visual description for image generation"}}]}}
 """
-    response = model.generate_content(prompt)
-    response_text = response.text or response.candidates[0].content.parts[0].text
+
+
+def generate_environments(research: Research) -> List[LLMEnvironment]:
+    prompt = environments_prompt(research)
+    response_text = _generate_text("storyboard.environments", prompt)
     print(f"[llm] Environments response: {response_text[:200]}...")
     data = _extract_json(response_text)
     environments = data.get("environments", [])
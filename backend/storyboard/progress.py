@@ -0,0 +1,109 @@
+"""
+Per-run progress manifest for storyboard generation.
+
+Every storyboard task (LLM calls and images) is checkpointed in
+runs/<id>/storyboard_progress.json as it changes state, together with the
+inputs it was produced from (prompt text, model, upstream results):
+
+    {
+      "tasks": {
+        "frame_1": {
+          "inputs": {"prompt": "Storyboard frame for scene 1: ...", "model": "...", "upstream": {}},
+          "inputs_hash": "3f2a...", "output": ".../frames/scene-1.png",
+          "state": "done", "attempts": 1, "error": null, "updated_at": 1733...
+        },
+        "characters": {"inputs": {...}, "inputs_hash": "...", "state": "done", "result": [...]},
+        "character_char_01": {"inputs": {..., "upstream": {"characters": "<hash of char_01>"}}, ...}
+      }
+    }
+
+On regeneration, generate_storyboard reuses every task that is "done" with the
+same inputs hash and (for images) an output file that still exists, so editing
+one scene only reruns that scene's frame.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def content_hash(value: Any) -> str:
+    """Stable short hash of a JSON-serializable value."""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def task_inputs(prompt: str, model: str, upstream: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """What a task's output depends on; upstream maps task ids to hashes of the results it used."""
+    return {"prompt": prompt, "model": model, "upstream": dict(upstream or {})}
+
+
+class ProgressManifest:
+    """Thread-safe task states, rewritten atomically on every change."""
+
+    def __init__(self, path: Path, tasks: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Dict[str, Any]] = dict(tasks or {})
+
+    @classmethod
+    def load(cls, path: Path) -> "ProgressManifest":
+        """The manifest at path, or an empty one when it is missing or unreadable."""
+        try:
+            tasks = json.loads(Path(path).read_text(encoding="utf-8")).get("tasks", {})
+        except (OSError, ValueError):
+            tasks = {}
+        return cls(path, tasks)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            return dict(entry) if entry else None
+
+    def completed(self, task_id: str, inputs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The entry of a task that finished for the same inputs (and whose output still exists)."""
+        entry = self.get(task_id)
+        if not entry or entry.get("state") != DONE or entry.get("inputs_hash") != content_hash(inputs):
+            return None
+        output = entry.get("output")
+        if output and not Path(output).exists():
+            return None
+        return entry
+
+    def update(self, task_id: str, inputs: Dict[str, Any], state: str, **fields: Any) -> None:
+        with self._lock:
+            entry = self._tasks.setdefault(task_id, {"attempts": 0})
+            entry.update(fields)
+            entry["inputs"] = inputs
+            entry["inputs_hash"] = content_hash(inputs)
+            entry["state"] = state
+            entry["updated_at"] = time.time()
+            if state == RUNNING:
+                entry["attempts"] = entry.get("attempts", 0) + 1
+                entry["error"] = None
+            self._save()
+
+    def summary(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for entry in self._tasks.values():
+                counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+            return counts
+
+    # Called with self._lock held
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps({"tasks": self._tasks}, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.path)
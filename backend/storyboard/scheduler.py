@@ -0,0 +1,252 @@
+"""
+Small dependency-aware task scheduler for the storyboard pipeline.
+
+Tasks are zero-argument callables with the names of the tasks they wait for.
+Each task starts as soon as all of its dependencies have finished, instead
+of phase by phase:
+
+    scheduler = TaskScheduler(max_workers=12)
+    scheduler.add("characters", lambda: generate_characters(research), stage="characters")
+    scheduler.add("frame_1", lambda: render(frame_1))                # starts right away
+    scheduler.add("character_images", spawn_images, deps=("characters",))
+    results = scheduler.run()                                        # {name: return value}
+
+- A running task may add() more tasks (e.g. one image task per generated character)
+- Tasks run with the caller's deadline and cost scope (deadlines.bind); stage
+  books their model calls under a cost_ledger stage
+- attempts > 1 retries a failing task with exponential backoff and jitter
+  (within the request deadline); only for calls that do not retry themselves,
+  e.g. not ImageEngine.generate(), which has its own retry loop
+- A failed required task stops new tasks from starting and is re-raised by
+  run() once the tasks already running have finished; a failed optional task
+  (required=False) only skips the tasks that depend on it
+- cancel (a threading.Event) stops new tasks from starting once set; run()
+  then raises concurrent.futures.CancelledError after the running ones finish
+- timings() / critical_path() show when each task ran and which chain of
+  tasks decided the wall time
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from cost_ledger import cost_stage
+from deadlines import bind, remaining
+
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 30.0
+
+
+@dataclass
+class TaskTiming:
+    name: str
+    deps: List[str] = field(default_factory=list)
+    # Seconds since run() started
+    ready_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # "pending", "running", "done", "failed" or "skipped"
+    status: str = "pending"
+    attempts: int = 0
+    error: Optional[str] = None
+
+    @property
+    def seconds(self) -> Optional[float]:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        for key in ("ready_at", "started_at", "finished_at"):
+            if data[key] is not None:
+                data[key] = round(data[key], 3)
+        data["seconds"] = None if self.seconds is None else round(self.seconds, 3)
+        return data
+
+
+@dataclass
+class _Task:
+    name: str
+    fn: Callable[[], Any]
+    deps: List[str]
+    stage: Optional[str]
+    attempts: int = 1
+    required: bool = True
+    waiting_on: int = 0
+
+
+class TaskScheduler:
+    """Runs a DAG of tasks on a thread pool, each as soon as its dependencies are done."""
+
+    def __init__(
+        self,
+        max_workers: int,
+        retry_base_seconds: float = RETRY_BASE_SECONDS,
+        cancel: Optional[threading.Event] = None,
+    ) -> None:
+        self.max_workers = max_workers
+        self.retry_base_seconds = retry_base_seconds
+        self.cancel = cancel
+        self._cond = threading.Condition()
+        self._tasks: Dict[str, _Task] = {}
+        self._dependents: Dict[str, List[str]] = {}
+        self._results: Dict[str, Any] = {}
+        self._timings: Dict[str, TaskTiming] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._started = 0.0
+        self._running = 0
+        self._error: Optional[BaseException] = None
+
+    def _now(self) -> float:
+        return time.monotonic() - self._started
+
+    def _cancelled(self) -> bool:
+        return self.cancel is not None and self.cancel.is_set()
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[[], Any],
+        deps: Sequence[str] = (),
+        stage: Optional[str] = None,
+        attempts: int = 1,
+        required: bool = True,
+    ) -> str:
+        """Register a task; dependencies must already be registered. Returns name."""
+        with self._cond:
+            if name in self._tasks:
+                raise ValueError(f"Duplicate task {name!r}")
+            unknown = [dep for dep in deps if dep not in self._tasks]
+            if unknown:
+                raise ValueError(f"Task {name!r} depends on unknown tasks {unknown}")
+            task = _Task(
+                name=name, fn=fn, deps=list(deps), stage=stage, attempts=attempts, required=required
+            )
+            task.waiting_on = sum(1 for dep in deps if self._timings[dep].status != "done")
+            self._tasks[name] = task
+            self._timings[name] = TaskTiming(name=name, deps=list(deps))
+            for dep in deps:
+                self._dependents.setdefault(dep, []).append(name)
+            if self._executor is not None and task.waiting_on == 0:
+                self._submit(task)
+        return name
+
+    # Called with self._cond held
+    def _submit(self, task: _Task) -> None:
+        timing = self._timings[task.name]
+        timing.ready_at = self._now()
+        if self._error is not None or self._cancelled():
+            timing.status = "skipped"
+            return
+        timing.status = "running"
+        self._running += 1
+        self._executor.submit(bind(self._run_task), task)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0.5, 1.0) * min(RETRY_MAX_SECONDS, self.retry_base_seconds * 2 ** (attempt - 1))
+
+    def _call(self, task: _Task) -> Any:
+        if task.stage:
+            with cost_stage(task.stage):
+                return task.fn()
+        return task.fn()
+
+    def _run_task(self, task: _Task) -> None:
+        timing = self._timings[task.name]
+        timing.started_at = self._now()
+        while True:
+            timing.attempts += 1
+            try:
+                result = self._call(task)
+                break
+            except BaseException as exc:  # noqa: BLE001 - retried, or re-raised from run()
+                delay = self._backoff(timing.attempts)
+                left = remaining()
+                retry = (
+                    isinstance(exc, Exception)
+                    and timing.attempts < task.attempts
+                    and self._error is None
+                    and not self._cancelled()
+                    and (left is None or left > delay)
+                )
+                if retry:
+                    print(
+                        f"[scheduler] {task.name} attempt {timing.attempts} failed ({exc}), "
+                        f"retrying in {delay:.1f}s"
+                    )
+                    time.sleep(delay)
+                    continue
+                with self._cond:
+                    timing.finished_at = self._now()
+                    timing.status = "failed"
+                    timing.error = f"{type(exc).__name__}: {exc}"
+                    if task.required and self._error is None:
+                        self._error = exc
+                    self._running -= 1
+                    self._cond.notify_all()
+                return
+
+        with self._cond:
+            timing.finished_at = self._now()
+            timing.status = "done"
+            self._results[task.name] = result
+            for name in self._dependents.get(task.name, []):
+                dependent = self._tasks[name]
+                dependent.waiting_on -= 1
+                if dependent.waiting_on == 0:
+                    self._submit(dependent)
+            self._running -= 1
+            self._cond.notify_all()
+
+    def run(self) -> Dict[str, Any]:
+        """Run every task (including ones added while running); {name: result}."""
+        self._started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="storyboard") as executor:
+            with self._cond:
+                self._executor = executor
+                for task in list(self._tasks.values()):
+                    if task.waiting_on == 0 and self._timings[task.name].status == "pending":
+                        self._submit(task)
+                while self._running:
+                    self._cond.wait()
+                self._executor = None
+                for timing in self._timings.values():
+                    if timing.status == "pending":
+                        timing.status = "skipped"
+        if self._error is not None:
+            raise self._error
+        if self._cancelled():
+            raise CancelledError("cancelled")
+        return dict(self._results)
+
+    def result(self, name: str) -> Any:
+        return self._results[name]
+
+    def failed(self) -> Dict[str, str]:
+        """{task name: error} of tasks that gave up."""
+        return {t.name: t.error or "" for t in self._timings.values() if t.status == "failed"}
+
+    def timings(self) -> List[TaskTiming]:
+        """Per-task timings, in start order."""
+        return sorted(
+            self._timings.values(),
+            key=lambda t: (t.started_at is None, t.started_at or 0.0, t.name),
+        )
+
+    def critical_path(self) -> List[str]:
+        """The chain of tasks ending at the last one to finish, following the latest dependency."""
+        finished = [t for t in self._timings.values() if t.finished_at is not None]
+        if not finished:
+            return []
+        current = max(finished, key=lambda t: t.finished_at)
+        path = [current.name]
+        while current.deps:
+            current = max((self._timings[dep] for dep in current.deps), key=lambda t: t.finished_at or 0.0)
+            path.append(current.name)
+        return list(reversed(path))
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -43,6 +43,8 @@ class StoryboardAsset(BaseModel):
     name: str
     image_url: str
     status: str = "approved"
+    # Smaller renditions of image_url: {"thumbnail", "preview", "webp"} -> URL
+    variants: Dict[str, str] = Field(default_factory=dict)
 
 
 class StoryboardFrame(BaseModel):
@@ -51,6 +53,10 @@ class StoryboardFrame(BaseModel):
     description: str
     image_url: str
     audio_prompt: str
+    # "failed" when the image gave up after its retries (image_url is then empty)
+    status: str = "approved"
+    # Smaller renditions of image_url: {"thumbnail", "preview", "webp"} -> URL
+    variants: Dict[str, str] = Field(default_factory=dict)
 
 
 class Storyboard(BaseModel):
@@ -67,3 +73,5 @@ class Status(BaseModel):
     run_id: str
     status: str
     message: Optional[str] = None
+    # cost_ledger totals for the run (tokens, images, video seconds, wall time)
+    cost: Optional[Dict[str, Any]] = None
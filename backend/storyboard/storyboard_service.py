@@ -1,17 +1,40 @@
 from __future__ import annotations
 
+import contextlib
 import json
 import os
-import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import re
+import threading
+import time
+from concurrent.futures import Future
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Sequence
 
 import google.generativeai as genai
 from fastapi import HTTPException
 
-from .images import generate_image
-from .llm import LLMCharacter, LLMEnvironment, generate_characters, generate_environments
+from cost_ledger import cost_stage, get_cost_ledger
+from image_derivatives import get_derivative_pipeline, variant_urls
+from image_cache import write_image
+from image_engine import get_image_engine
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+from .images import public_path
+from .llm import (
+    TEXT_MODEL,
+    LLMCharacter,
+    LLMEnvironment,
+    characters_prompt,
+    environments_prompt,
+    generate_characters,
+    generate_environments,
+)
+from .progress import DONE, FAILED, RUNNING, ProgressManifest, content_hash, task_inputs
+from .scheduler import TaskScheduler
 from .schemas import (
     Research,
     Status,
@@ -28,6 +51,19 @@ PUBLIC_DIR = ROOT_DIR / "frontend" / "public"
 RUNS_DIR = PUBLIC_DIR / "runs"
 SAMPLE_INPUTS_DIR = PUBLIC_DIR / "sample-inputs"
 
+# Run ids become directory names under RUNS_DIR
+RUN_ID_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]{0,63}")
+_run_locks: Dict[str, threading.Lock] = {}
+_run_locks_guard = threading.Lock()
+
+# Retries live in exactly one layer per call: ImageEngine owns image retries
+# (429 / 5xx with backoff, up to its max_attempts), so image tasks run once in
+# the scheduler; the LLM steps have no retry of their own and get the scheduler's
+LLM_TASK_ATTEMPTS = 2
+
+# How long assembly waits for the last thumbnails / previews before going without them
+DERIVATIVE_WAIT_SECONDS = float(os.getenv("DERIVATIVE_WAIT_SECONDS", "30"))
+
 
 def _load_json(path: Path) -> Dict[str, Any]:
     with path.open("r", encoding="utf-8") as f:
@@ -35,22 +71,60 @@ def _load_json(path: Path) -> Dict[str, Any]:
 
 
 def _write_json(path: Path, payload: Dict[str, Any]) -> None:
+    # Atomic: status.json is polled while generation rewrites it
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as f:
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
         json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_dir(run_id: str) -> Path:
+    """Directory holding everything of one run; rejects ids that are not a plain name."""
+    if not RUN_ID_PATTERN.fullmatch(run_id):
+        raise HTTPException(status_code=400, detail=f"invalid run id {run_id!r}")
+    return RUNS_DIR / run_id
+
+
+@contextlib.contextmanager
+def run_lock(run_id: str) -> Iterator[None]:
+    """Exclusive lock on one run, across threads and (with flock) server processes."""
+    path = run_dir(run_id) / ".lock"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _run_locks_guard:
+        thread_lock = _run_locks.setdefault(run_id, threading.Lock())
+    with thread_lock, open(path, "a") as handle:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
 
 
 def status_path(run_id: str) -> Path:
-    return RUNS_DIR / run_id / "status.json"
+    return run_dir(run_id) / "status.json"
 
 
 def storyboard_path(run_id: str) -> Path:
-    return RUNS_DIR / run_id / "storyboard.json"
+    return run_dir(run_id) / "storyboard.json"
+
+
+def progress_path(run_id: str) -> Path:
+    # Task states of the last generation, read back by resume=True
+    return run_dir(run_id) / "storyboard_progress.json"
+
+
+def timings_path(run_id: str) -> Path:
+    # Per-task start / end times of the last generation
+    return run_dir(run_id) / "storyboard_timings.json"
 
 
 def research_path(run_id: str) -> Path:
     # Input snapshot produced by the Research step
-    return RUNS_DIR / run_id / "research_output.json"
+    return run_dir(run_id) / "research_output.json"
 
 
 def load_research(run_id: str) -> Research:
@@ -61,28 +135,36 @@ def load_research(run_id: str) -> Research:
 
 
 def write_status(status: Status) -> None:
+    ledger = get_cost_ledger()
+    if status.cost is None and ledger.has_run(status.run_id):
+        status.cost = ledger.totals(status.run_id)
     _write_json(status_path(status.run_id), status.model_dump())
 
 
+def write_storyboard(run_id: str, storyboard: Storyboard) -> None:
+    # Atomic like status.json: the frontend polls it while jobs run
+    _write_json(storyboard_path(run_id), storyboard.model_dump())
+
+
 def mock_generate_storyboard(run_id: str, research: Research) -> Storyboard:
-    run_dir = RUNS_DIR / run_id
-    char_dir = run_dir / "characters"
-    obj_dir = run_dir / "objects"
-    env_dir = run_dir / "environments"
-    frame_dir = run_dir / "frames"
+    output_dir = run_dir(run_id)
+    char_dir = output_dir / "characters"
+    obj_dir = output_dir / "objects"
+    env_dir = output_dir / "environments"
+    frame_dir = output_dir / "frames"
     for d in (char_dir, obj_dir, env_dir, frame_dir):
         d.mkdir(parents=True, exist_ok=True)
     script = research.selected_script
 
     def _copy_sample(src_name: str, dest: Path) -> str:
+        # dest may be a hardlink into the image cache from an earlier Gemini run:
+        # replace it, never write through it
         src = SAMPLE_INPUTS_DIR / src_name
+        placeholder = f"placeholder for {src_name}".encode("utf-8")
         try:
-            if src.exists():
-                shutil.copy(src, dest)
-            else:
-                dest.write_text(f"placeholder for {src_name}", encoding="utf-8")
-        except Exception:
-            dest.write_text(f"placeholder for {src_name}", encoding="utf-8")
+            write_image(src.read_bytes() if src.exists() else placeholder, dest)
+        except OSError:
+            write_image(placeholder, dest)
         return "/" + "/".join(dest.parts[dest.parts.index("public") + 1 :])
 
     assets = {
@@ -164,102 +246,235 @@ def _slugify(name: str) -> str:
     )
 
 
-def generate_storyboard(run_id: str, research: Research) -> Storyboard:
+def timings_report(scheduler: TaskScheduler, reused: Sequence[str] = ()) -> Dict[str, Any]:
+    return {
+        "critical_path": scheduler.critical_path(),
+        # Tasks answered from the progress manifest instead of being rerun
+        "reused": sorted(reused),
+        "tasks": [timing.as_dict() for timing in scheduler.timings()],
+    }
+
+
+def _collect_variants(
+    results: Dict[str, Dict[str, Any]],
+    futures: Dict[str, Future],
+    timeout: float,
+) -> None:
+    """Add variant URLs for derivatives finished within timeout; the rest keep image_url only."""
+    wait_until = time.monotonic() + timeout
+    for key, future in futures.items():
+        try:
+            variants = future.result(timeout=max(0.0, wait_until - time.monotonic()))
+        except Exception as exc:  # noqa: BLE001 - variants are optional
+            print(f"[storyboard] Variants for {key} skipped: {type(exc).__name__}: {exc}")
+            continue
+        results[key]["variants"] = variant_urls(results[key]["image_url"], variants)
+
+
+def generate_storyboard(
+    run_id: str,
+    research: Research,
+    fresh_images: bool = False,
+    resume: bool = True,
+    cancel: Optional[threading.Event] = None,
+) -> Storyboard:
+    """
+    Regeneration is incremental: every LLM call and image whose inputs (prompt
+    text, model, upstream results) match a finished task in the run's progress
+    manifest is reused, so editing one scene only reruns that scene's frame and
+    a failed run only reruns what is missing or failed.
+
+    resume=False ignores the manifest and reruns every task.
+    fresh_images=True regenerates every image instead of reusing earlier ones.
+    Setting cancel stops new tasks from starting and raises CancelledError.
+
+    Images that still fail after the image engine's retries come back with
+    status="failed" instead of failing the whole storyboard.
+    """
     script = research.selected_script
 
-    # Write generated assets to sample-inputs to mirror example outputs
-    char_dir = SAMPLE_INPUTS_DIR / "characters"
-    env_dir = SAMPLE_INPUTS_DIR / "environments"
-    obj_dir = SAMPLE_INPUTS_DIR / "objects"
-    frame_dir = SAMPLE_INPUTS_DIR / "frames"
+    # Each run writes its own images, so concurrent runs never share a file
+    output_dir = run_dir(run_id)
+    char_dir = output_dir / "characters"
+    env_dir = output_dir / "environments"
+    obj_dir = output_dir / "objects"
+    frame_dir = output_dir / "frames"
     for d in (char_dir, env_dir, obj_dir, frame_dir):
         d.mkdir(parents=True, exist_ok=True)
 
-    # PHASE 1: Parallel LLM calls for characters and environments
-    print("[storyboard] Phase 1: Generating characters and environments in parallel...")
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        characters_future = executor.submit(generate_characters, research)
-        environments_future = executor.submit(generate_environments, research)
-        characters: List[LLMCharacter] = characters_future.result()
-        environments: List[LLMEnvironment] = environments_future.result()
-    print(f"[storyboard] Got {len(characters)} characters, {len(environments)} environments")
-
-    # PHASE 2: Parallel image generation for ALL assets
-    # Prepare all image generation tasks
-    image_tasks: List[Tuple[str, str, str, Path, dict]] = []
-    
-    # Character images
-    for char in characters:
-        image_tasks.append((
-            "character",
-            char.id,
-            f"Portrait: {char.name}. {char.role}. {char.description}.",
-            char_dir / f"{char.id}.png",
-            {"name": char.name},
-        ))
-    
+    progress = ProgressManifest.load(progress_path(run_id)) if resume else ProgressManifest(progress_path(run_id))
+    if resume:
+        print(f"[storyboard] Reusing unchanged tasks from progress manifest: {progress.summary()}")
+    reuse_images = resume and not fresh_images
+    # Task ids whose checkpoint matched the current inputs
+    reused: List[str] = []
+
+    # Storyboard as a DAG: object and frame images only need the script, so they
+    # start right away; character / environment images start as soon as their
+    # LLM call returns; nothing waits for a whole phase to finish
+    results: Dict[str, Dict[str, Any]] = {}
+    engine = get_image_engine()
+    # Thumbnails / previews start as soon as each image is written
+    derivatives = get_derivative_pipeline()
+    derivative_futures: Dict[str, Future] = {}
+    # LLM calls + image calls in flight at once; the engine's rate limiter paces the images
+    scheduler = TaskScheduler(max_workers=2 + engine.max_workers, cancel=cancel)
+
+    def image_task(
+        task_type: str,
+        task_id: str,
+        prompt: str,
+        dest: Path,
+        extra: Dict[str, Any],
+        upstream: Dict[str, str],
+    ):
+        key = f"{task_type}_{task_id}"
+        inputs = task_inputs(prompt, engine.model, upstream)
+
+        def run() -> None:
+            done = progress.completed(key, inputs) if reuse_images else None
+            if done:
+                written = Path(done["output"])
+                reused.append(key)
+                print(f"[storyboard] ↺ Reused {task_type} {task_id}")
+            else:
+                progress.update(key, inputs, RUNNING, output=str(dest))
+                try:
+                    written = engine.generate(prompt, dest, use_cache=not fresh_images).dest
+                except Exception as exc:
+                    print(f"[storyboard] ✗ Failed {task_type} {task_id}: {exc}")
+                    progress.update(key, inputs, FAILED, error=str(exc))
+                    raise
+                progress.update(key, inputs, DONE, output=str(written))
+                print(f"[storyboard] ✓ Generated {task_type} {task_id}")
+            results[key] = {"image_url": public_path(written), **extra}
+            if derivatives is not None:
+                derivative_futures[key] = derivatives.submit(written)
+
+        return run
+
+    def add_image(
+        task_type: str,
+        task_id: str,
+        prompt: str,
+        dest: Path,
+        extra: Dict[str, Any],
+        deps=(),
+        upstream: Optional[Dict[str, str]] = None,
+    ) -> None:
+        # Optional: a failed image leaves a failed asset, not a failed storyboard.
+        # One attempt: engine.generate() already retried (see LLM_TASK_ATTEMPTS)
+        scheduler.add(
+            f"{task_type}_{task_id}",
+            image_task(task_type, task_id, prompt, dest, extra, upstream or {}),
+            deps=deps,
+            stage="images",
+            required=False,
+        )
+
+    def checkpointed(key: str, prompt: str, generate, item_type):
+        """Run an LLM step only when its prompt changed; otherwise reuse its stored result."""
+        inputs = task_inputs(prompt, TEXT_MODEL)
+        done = progress.completed(key, inputs) if resume else None
+        if done:
+            reused.append(key)
+            return [item_type(**item) for item in done["result"]]
+        progress.update(key, inputs, RUNNING)
+        try:
+            items = generate(research)
+        except Exception as exc:
+            progress.update(key, inputs, FAILED, error=str(exc))
+            raise
+        progress.update(key, inputs, DONE, result=[vars(item) for item in items])
+        return items
+
+    def characters_task() -> List[LLMCharacter]:
+        characters = checkpointed("characters", characters_prompt(research), generate_characters, LLMCharacter)
+        print(f"[storyboard] Got {len(characters)} characters")
+        for char in characters:
+            add_image(
+                "character",
+                char.id,
+                f"Portrait: {char.name}. {char.role}. {char.description}.",
+                char_dir / f"{char.id}.png",
+                {"name": char.name},
+                deps=("characters",),
+                # Only this character's entry matters, not the rest of the cast
+                upstream={"characters": content_hash(vars(char))},
+            )
+        return characters
+
+    def environments_task() -> List[LLMEnvironment]:
+        environments = checkpointed(
+            "environments", environments_prompt(research), generate_environments, LLMEnvironment
+        )
+        print(f"[storyboard] Got {len(environments)} environments")
+        for env in environments:
+            add_image(
+                "environment",
+                env.id,
+                f"Environment: {env.name}. {env.description}.",
+                env_dir / f"{env.id}.png",
+                {"name": env.name},
+                deps=("environments",),
+                upstream={"environments": content_hash(vars(env))},
+            )
+        return environments
+
+    scheduler.add("characters", characters_task, stage="characters", attempts=LLM_TASK_ATTEMPTS)
+    scheduler.add("environments", environments_task, stage="environments", attempts=LLM_TASK_ATTEMPTS)
+
     # Object images
     for obj in script.assets.objects:
         oid = _slugify(obj.name)
-        image_tasks.append((
+        add_image(
             "object",
             oid,
             f"Product object: {obj.name}. {obj.visual_prompt}. Studio lighting, product shot.",
             obj_dir / f"{oid}.png",
             {"name": obj.name},
-        ))
-    
-    # Environment images
-    for env in environments:
-        image_tasks.append((
-            "environment",
-            env.id,
-            f"Environment: {env.name}. {env.description}.",
-            env_dir / f"{env.id}.png",
-            {"name": env.name},
-        ))
-    
+        )
+
     # Frame images
     for idx, scene in enumerate(script.scenes, start=1):
-        image_tasks.append((
+        add_image(
             "frame",
             str(idx),
             f"Storyboard frame for scene {scene.scene_id}: {scene.visual}",
             frame_dir / f"scene-{scene.scene_id}.png",
             {"scene_id": scene.scene_id, "visual": scene.visual, "audio": scene.audio},
-        ))
+        )
 
-    print(f"[storyboard] Phase 2: Generating {len(image_tasks)} images in parallel...")
-    
-    # Execute all image generations in parallel
-    results: Dict[str, Dict[str, Any]] = {}
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_task = {
-            executor.submit(generate_image, prompt, dest): (task_type, task_id, extra)
-            for task_type, task_id, prompt, dest, extra in image_tasks
-        }
-        for future in as_completed(future_to_task):
-            task_type, task_id, extra = future_to_task[future]
-            try:
-                image_path = future.result()
-                results[f"{task_type}_{task_id}"] = {"image_url": image_path, **extra}
-                print(f"[storyboard] ✓ Generated {task_type} {task_id}")
-            except Exception as exc:
-                print(f"[storyboard] ✗ Failed {task_type} {task_id}: {exc}")
-                raise
+    print("[storyboard] Running storyboard tasks (LLM calls and images as their inputs are ready)...")
+    try:
+        outputs = scheduler.run()
+    finally:
+        _write_json(timings_path(run_id), timings_report(scheduler, reused))
+    characters: List[LLMCharacter] = outputs["characters"]
+    environments: List[LLMEnvironment] = outputs["environments"]
+    print(f"[storyboard] Critical path: {' -> '.join(scheduler.critical_path())}")
+    rerun = sorted(set(outputs) - set(reused))
+    print(f"[storyboard] Reused {len(reused)} tasks, ran {len(rerun)}: {rerun}")
+    failed = scheduler.failed()
+    if failed:
+        print(f"[storyboard] ⚠ {len(failed)} images failed (resume=true retries only these): {sorted(failed)}")
+
+    with cost_stage("derivatives"):
+        _collect_variants(results, derivative_futures, DERIVATIVE_WAIT_SECONDS)
 
     print("[storyboard] Phase 3: Assembling storyboard...")
     
     # Assemble character assets
     character_assets: List[StoryboardAsset] = []
     for char in characters:
-        result = results[f"character_{char.id}"]
+        result = results.get(f"character_{char.id}", {"name": char.name})
         character_assets.append(
             StoryboardAsset(
                 id=char.id,
                 name=result["name"],
-                image_url=result["image_url"],
-                status="approved",
+                image_url=result.get("image_url", ""),
+                status="approved" if "image_url" in result else "failed",
+                variants=result.get("variants", {}),
             )
         )
 
@@ -267,40 +482,44 @@ def generate_storyboard(run_id: str, research: Research) -> Storyboard:
     object_assets: List[StoryboardAsset] = []
     for obj in script.assets.objects:
         oid = _slugify(obj.name)
-        result = results[f"object_{oid}"]
+        result = results.get(f"object_{oid}", {"name": obj.name})
         object_assets.append(
             StoryboardAsset(
                 id=oid,
                 name=result["name"],
-                image_url=result["image_url"],
-                status="approved",
+                image_url=result.get("image_url", ""),
+                status="approved" if "image_url" in result else "failed",
+                variants=result.get("variants", {}),
             )
         )
 
     # Assemble environment assets
     environment_assets: List[StoryboardAsset] = []
     for env in environments:
-        result = results[f"environment_{env.id}"]
+        result = results.get(f"environment_{env.id}", {"name": env.name})
         environment_assets.append(
             StoryboardAsset(
                 id=env.id,
                 name=result["name"],
-                image_url=result["image_url"],
-                status="approved",
+                image_url=result.get("image_url", ""),
+                status="approved" if "image_url" in result else "failed",
+                variants=result.get("variants", {}),
             )
         )
 
     # Assemble storyboard frames
     storyboard_frames: List[StoryboardFrame] = []
     for idx, scene in enumerate(script.scenes, start=1):
-        result = results[f"frame_{idx}"]
+        result = results.get(f"frame_{idx}", {})
         storyboard_frames.append(
             StoryboardFrame(
                 frame_id=idx,
-                scene_id=result["scene_id"],
-                description=result["visual"],
-                image_url=result["image_url"],
-                audio_prompt=result["audio"],
+                scene_id=scene.scene_id,
+                description=scene.visual,
+                image_url=result.get("image_url", ""),
+                audio_prompt=scene.audio,
+                variants=result.get("variants", {}),
+                status="approved" if "image_url" in result else "failed",
             )
         )
 
@@ -10,8 +10,10 @@ import json
 import os
 import shutil
 import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Any, Dict, Generator
+from typing import Any, Callable, Dict, Generator, List, Type
 
 import pytest
 
@@ -20,6 +22,8 @@ BACKEND_DIR = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(BACKEND_DIR))
 
 from fastapi.testclient import TestClient
+import gemini_utils
+import rate_limiter
 from main import app
 from storyboard.storyboard_service import RUNS_DIR
 
@@ -57,6 +61,39 @@ def temp_run_dir(runs_directory: Path) -> Generator[Path, None, None]:
         shutil.rmtree(run_dir)
 
 
+@pytest.fixture
+def gemini_stub_server(monkeypatch) -> Generator[Callable[..., ThreadingHTTPServer], None, None]:
+    """
+    Start a local stand-in for the Gemini REST API and point gemini_utils at it.
+
+        server = gemini_stub_server(_StubHandler, requests=[])   # attributes set on the server
+
+    Each test also gets a test API key, no response cache or context cache, and
+    a fresh rate limiter, so no state leaks between tests.
+    """
+    servers: List[ThreadingHTTPServer] = []
+
+    def start(handler: Type[BaseHTTPRequestHandler], **state: Any) -> ThreadingHTTPServer:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        for name, value in state.items():
+            setattr(server, name, value)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(gemini_utils, "GEMINI_API_BASE_URL", f"http://127.0.0.1:{server.server_port}")
+        return server
+
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.setenv("GEMINI_RESPONSE_CACHE", "0")
+    monkeypatch.setattr(gemini_utils, "_context_cache_manager", None)
+    # Fresh limiter per test so RPM tokens spent by one test do not slow the next
+    monkeypatch.setattr(rate_limiter, "_rate_limiter", rate_limiter.RateLimiter())
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
 @pytest.fixture
 def sample_brief() -> Dict[str, Any]:
     """
@@ -0,0 +1,106 @@
+"""
+Tests for the per-run cost ledger.
+
+Run with: pytest tests/test_cost_ledger.py -v
+"""
+from __future__ import annotations
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import cost_ledger
+from cost_ledger import (
+    CostLedger,
+    cost_scope,
+    cost_stage,
+    get_cost_ledger,
+    record_usage,
+    track_call,
+    usage_counters,
+)
+from deadlines import bind
+
+
+@pytest.fixture(autouse=True)
+def fresh_ledger(monkeypatch):
+    monkeypatch.setattr(cost_ledger, "_ledger", CostLedger())
+
+
+class TestUsageCounters:
+    """usage_counters()"""
+
+    def test_rest_and_sdk_usage_shapes(self):
+        """camelCase REST dicts and snake_case SDK objects give the same counters."""
+        rest = {
+            "promptTokenCount": 100,
+            "candidatesTokenCount": 20,
+            "thoughtsTokenCount": 7,
+            "cachedContentTokenCount": 50,
+        }
+        sdk = SimpleNamespace(
+            prompt_token_count=100,
+            candidates_token_count=20,
+            thoughts_token_count=7,
+            cached_content_token_count=50,
+        )
+        expected = {"prompt_tokens": 100, "output_tokens": 20, "thinking_tokens": 7, "cached_tokens": 50}
+        assert usage_counters(rest) == expected
+        assert usage_counters(sdk) == expected
+        assert usage_counters(None) == {}
+
+
+class TestLedger:
+    """cost_scope / cost_stage / track_call"""
+
+    def test_calls_grouped_by_run_stage_and_model(self):
+        """Totals split by stage and model; other runs are not included."""
+        with cost_scope("run-a"):
+            with cost_stage("characters"), track_call("text-model") as call:
+                call.add_usage({"promptTokenCount": 10, "candidatesTokenCount": 4})
+            with cost_stage("images"):
+                with track_call("image-model") as call:
+                    call.add_usage({"promptTokenCount": 3})
+                record_usage("image-model", images=1)
+        with cost_scope("run-b"), track_call("text-model"):
+            pass
+
+        totals = get_cost_ledger().totals("run-a")
+
+        assert totals["total"]["calls"] == 2
+        assert totals["total"]["prompt_tokens"] == 13
+        assert totals["by_stage"]["characters"]["output_tokens"] == 4
+        assert totals["by_stage"]["images"]["images"] == 1
+        assert "wall_seconds" in totals["by_stage"]["images"]
+        assert totals["by_model"]["image-model"]["calls"] == 1
+        assert get_cost_ledger().totals("run-b")["total"]["calls"] == 1
+
+    def test_failed_call_counts_as_error(self):
+        """Exceptions inside track_call are recorded and re-raised."""
+        with cost_scope("run"):
+            with pytest.raises(ValueError):
+                with track_call("m"):
+                    raise ValueError("boom")
+
+        assert get_cost_ledger().totals("run")["total"]["errors"] == 1
+
+    def test_scope_follows_bound_worker_threads(self):
+        """Calls made from executor workers via bind() keep the run and stage."""
+
+        def work():
+            with track_call("m") as call:
+                call.video_seconds = 8
+
+        with cost_scope("run"), cost_stage("video"):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                for future in [executor.submit(bind(work)) for _ in range(3)]:
+                    future.result()
+
+        totals = get_cost_ledger().totals("run")
+        assert totals["by_stage"]["video"]["video_seconds"] == 24
+        assert not get_cost_ledger().has_run(cost_ledger.UNSCOPED_RUN)
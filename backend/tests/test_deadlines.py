@@ -0,0 +1,139 @@
+"""
+Tests for request deadlines and hedged calls.
+
+Run with: pytest tests/test_deadlines.py -v
+"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import deadlines
+import gemini_utils
+from deadlines import (
+    DeadlineExceeded,
+    HedgePolicy,
+    bind,
+    deadline,
+    hedged,
+    remaining,
+    request_timeout,
+)
+from rate_limiter import ModelLimits, RateLimiter
+
+
+@pytest.fixture(autouse=True)
+def fresh_latencies(monkeypatch):
+    monkeypatch.setattr(deadlines, "_latencies", deadlines.LatencyTracker())
+
+
+class TestDeadlineContext:
+    """deadline() / request_timeout() / bind()"""
+
+    def test_no_deadline_uses_default(self):
+        """Outside a deadline block calls keep their own timeout."""
+        assert remaining() is None
+        assert request_timeout(120) == 120
+
+    def test_nested_deadline_only_shortens(self):
+        """An inner deadline longer than the outer one does not extend it."""
+        with deadline(5):
+            with deadline(60):
+                assert remaining() <= 5
+                assert request_timeout(120) <= 5
+            with deadline(1):
+                assert request_timeout(120) <= 1
+        assert remaining() is None
+
+    def test_expired_deadline_raises(self):
+        """Calls made after the deadline fail fast."""
+        with deadline(0.01):
+            time.sleep(0.02)
+            with pytest.raises(DeadlineExceeded):
+                request_timeout(120)
+
+    def test_bind_carries_deadline_into_threads(self):
+        """Executor workers see the submitting request's deadline."""
+        with deadline(30):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                bound = executor.submit(bind(remaining)).result()
+                unbound = executor.submit(remaining).result()
+        assert bound is not None and 0 < bound <= 30
+        assert unbound is None
+
+    def test_call_gemini_respects_deadline(self, monkeypatch):
+        """gemini_utils does not send requests once the deadline has passed."""
+        monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+        monkeypatch.setenv("GEMINI_RESPONSE_CACHE", "0")
+        with deadline(0.01):
+            time.sleep(0.02)
+            with pytest.raises(DeadlineExceeded):
+                gemini_utils.call_gemini(
+                    system_prompt="sys",
+                    contents=[{"role": "user", "parts": [{"text": "hi"}]}],
+                    model="gemini-2.5-flash",
+                )
+
+    def test_rate_limiter_wait_stops_at_deadline(self):
+        """Queueing for a rate-limited slot gives up at the deadline."""
+        limiter = RateLimiter({"m": ModelLimits(rpm=1, max_concurrency=1)})
+        with limiter.slot("m"):
+            pass
+        with deadline(0.1):
+            with pytest.raises(DeadlineExceeded):
+                with limiter.slot("m"):
+                    pass
+
+
+class TestHedging:
+    """hedged()"""
+
+    def test_disabled_runs_once(self):
+        """Without HEDGE_REQUESTS the call runs exactly once."""
+        calls = []
+        assert hedged("t", lambda: calls.append(1) or "ok", enabled=False) == "ok"
+        assert calls == [1]
+
+    def test_slow_first_attempt_is_hedged(self):
+        """A duplicate is sent after the hedge delay and the faster answer wins."""
+        attempts = []
+        lock = threading.Lock()
+
+        def call():
+            with lock:
+                attempts.append(None)
+                attempt = len(attempts)
+            time.sleep(1.0 if attempt == 1 else 0.01)
+            return attempt
+
+        policy = HedgePolicy(initial_delay_seconds=0.05, min_delay_seconds=0.0)
+        started = time.monotonic()
+        assert hedged("t", call, policy=policy, enabled=True) == 2
+        assert time.monotonic() - started < 0.5
+
+    def test_fast_failure_is_not_duplicated(self):
+        """Errors before the hedge delay are raised without a second attempt."""
+        attempts = []
+
+        def call():
+            attempts.append(None)
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            hedged("t", call, policy=HedgePolicy(initial_delay_seconds=1), enabled=True)
+        assert len(attempts) == 1
+
+    def test_delay_follows_observed_percentile(self):
+        """After enough samples, the hedge delay is the configured latency percentile."""
+        policy = HedgePolicy(percentile=0.9, min_samples=5, min_delay_seconds=0.0)
+        assert deadlines.hedge_delay("t", policy) == policy.initial_delay_seconds
+        for seconds in (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0):
+            deadlines._latencies.record("t", seconds)
+        assert deadlines.hedge_delay("t", policy) == 1.0
@@ -38,6 +38,18 @@ from storyboard.storyboard_service import (
 )
 
 
+def wait_for_storyboard(client, response, timeout: float = 30.0) -> Dict[str, Any]:
+    """Poll the job returned by POST /runs/<id>/storyboard until it finishes; returns the job."""
+    assert response.status_code == 202, response.text
+    job = response.json()
+    deadline = time.monotonic() + timeout
+    while job["status"] in ("queued", "running"):
+        assert time.monotonic() < deadline, f"storyboard job did not finish: {job}"
+        time.sleep(0.05)
+        job = client.get(f"/jobs/{job['job_id']}").json()
+    return job
+
+
 # Test fixtures
 @pytest.fixture(scope="module")
 def client():
@@ -244,33 +256,32 @@ class TestStep3Storyboard:
 
     def test_get_storyboard_not_found(self, client):
         """Test GET storyboard returns 404 when not exists."""
-        # Use the 'first' run ID as the backend hardcodes it
-        # This test verifies error handling
         response = client.get("/runs/nonexistent/storyboard")
-        # Note: Backend always uses run_id="first", so this tests that path
-        # In real implementation, would return 404 for missing storyboard
-        assert response.status_code in [200, 404]
+        assert response.status_code == 404
+
+    def test_invalid_run_id_is_rejected(self, client):
+        """Run ids are directory names; anything else is a 400."""
+        response = client.get("/runs/bad.id/status")
+        assert response.status_code == 400
 
-    def test_create_storyboard_mock(self, client, setup_test_run, minimal_research_output, monkeypatch):
+    def test_create_storyboard_mock(self, client, setup_test_run, test_run_id, minimal_research_output, monkeypatch):
         """Test creating storyboard via API (mock mode) - uses minimal data for speed."""
         # Force mock mode for fast testing
         monkeypatch.setenv("FORCE_MOCK", "1")
         
         run_dir = setup_test_run
         
-        # First, save research output to the expected location for 'first' run
-        # (Backend hardcodes run_id to 'first')
-        first_run_dir = RUNS_DIR / "first"
-        first_run_dir.mkdir(parents=True, exist_ok=True)
-        research_output_path = first_run_dir / "research_output.json"
+        research_output_path = run_dir / "research_output.json"
         
         # Save minimal research output for faster testing
         with open(research_output_path, "w", encoding="utf-8") as f:
             json.dump(minimal_research_output, f, indent=2)
         
-        # Call storyboard generation API
-        response = client.post("/runs/test/storyboard")
-        
+        # Call storyboard generation API (runs as a background job)
+        job = wait_for_storyboard(client, client.post(f"/runs/{test_run_id}/storyboard"))
+        assert job["status"] == "done", job
+
+        response = client.get(f"/runs/{test_run_id}/storyboard")
         assert response.status_code == 200
         storyboard_data = response.json()
         
@@ -283,10 +294,8 @@ class TestStep3Storyboard:
         assert len(storyboard.storyboard_frames) > 0
         
         print(f"✓ Storyboard created with {len(storyboard.storyboard_frames)} frames")
-        
-        # Cleanup
-        if research_output_path.exists():
-            research_output_path.unlink()
+        # Images land in the run's own directory
+        assert storyboard.storyboard_frames[0].image_url.startswith(f"/runs/{test_run_id}/")
 
     def test_storyboard_status_flow(self, client):
         """Test status updates during storyboard generation."""
@@ -513,19 +522,11 @@ class TestE2EFullFlow:
             print("\n[STEP 3] Storyboard Generation")
             print("-" * 40)
             
-            # For API test, we need to use 'first' run (hardcoded in backend)
-            first_run_dir = RUNS_DIR / "first"
-            first_run_dir.mkdir(parents=True, exist_ok=True)
-            first_research_path = first_run_dir / "research_output.json"
-            
-            # Copy research output to first run
-            with open(first_research_path, "w", encoding="utf-8") as f:
-                json.dump(sample_research_output, f, indent=2)
-            
-            # Call storyboard API
-            response = client.post("/runs/first/storyboard")
-            assert response.status_code == 200, f"Storyboard creation failed: {response.text}"
-            
+            # Call storyboard API on the research saved above
+            job = wait_for_storyboard(client, client.post(f"/runs/{test_run_id}/storyboard"))
+            assert job["status"] == "done", f"Storyboard creation failed: {job}"
+
+            response = client.get(f"/runs/{test_run_id}/storyboard")
             storyboard = Storyboard.model_validate(response.json())
             print(f"  ✓ Assets generated:")
             print(f"    - Characters: {len(storyboard.assets.get('characters', []))}")
@@ -690,9 +691,6 @@ class TestE2EFullFlow:
             # Cleanup test run directory
             if run_dir.exists():
                 shutil.rmtree(run_dir)
-            # Cleanup first run research if we created it
-            first_research = RUNS_DIR / "first" / "research_output.json"
-            # Don't delete if it was pre-existing (check content)
 
 
 class TestAPIEndpoints:
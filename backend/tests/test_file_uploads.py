@@ -0,0 +1,256 @@
+"""
+Tests for hash-deduplicated File API uploads.
+
+A fake google-genai client stands in for client.files; a local HTTP server
+stands in for the REST resumable upload protocol.
+
+Run with: pytest tests/test_file_uploads.py -v
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import file_uploads
+import gemini_utils
+from file_uploads import UploadedFile, UploadManifest, upload_file
+
+
+class _FakeFiles:
+    def __init__(self) -> None:
+        self.remote = {}
+        self.uploads = 0
+        self.lock = threading.Lock()
+
+    def upload(self, file, config=None):
+        with self.lock:
+            self.uploads += 1
+            name = f"files/f{self.uploads}"
+        expires = datetime.now(timezone.utc) + timedelta(hours=48)
+        self.remote[name] = SimpleNamespace(
+            name=name,
+            uri=f"https://files.example/{name}",
+            state=SimpleNamespace(name="PROCESSING"),
+            mime_type="video/mp4",
+            expiration_time=expires,
+        )
+        return self.remote[name]
+
+    def get(self, name):
+        if name not in self.remote:
+            raise RuntimeError(f"404 {name} not found")
+        remote = self.remote[name]
+        # The first poll after upload finishes processing
+        remote.state = SimpleNamespace(name="ACTIVE")
+        return remote
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(file_uploads, "PROCESSING_POLL_SECONDS", 0)
+    return SimpleNamespace(files=_FakeFiles())
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "walkthrough.mp4"
+    path.write_bytes(b"\x00\x00\x00\x18ftypmp42" * 1000)
+    return path
+
+
+class TestUploadManifest:
+    """upload_file() / UploadManifest"""
+
+    def test_second_upload_reuses_active_file(self, client, video, tmp_path):
+        """Same content uploads once; the manifest entry is reused while ACTIVE."""
+        manifest = UploadManifest(tmp_path / "manifest.json")
+
+        first = upload_file(client, video, manifest=manifest)
+        second = upload_file(client, video, manifest=manifest)
+
+        assert client.files.uploads == 1
+        assert first.reused is False and second.reused is True
+        assert second.uri == first.uri
+        assert manifest.get(first.sha256).name == "files/f1"
+
+    def test_missing_remote_file_is_uploaded_again(self, client, video, tmp_path):
+        """A manifest entry whose file is gone from the File API is replaced."""
+        manifest = UploadManifest(tmp_path / "manifest.json")
+        first = upload_file(client, video, manifest=manifest)
+        del client.files.remote[first.name]
+
+        second = upload_file(client, video, manifest=manifest)
+
+        assert client.files.uploads == 2
+        assert second.name == "files/f2"
+        assert manifest.get(first.sha256).name == "files/f2"
+
+    def test_entry_near_expiry_is_not_reused(self):
+        """Files expiring within the margin are treated as stale."""
+        soon = (datetime.now(timezone.utc) + timedelta(minutes=10)).isoformat()
+        later = (datetime.now(timezone.utc) + timedelta(hours=10)).isoformat()
+        assert UploadedFile("files/a", "uri", "x", expiration_time=soon).expires_soon()
+        assert not UploadedFile("files/a", "uri", "x", expiration_time=later).expires_soon()
+
+    def test_concurrent_uploads_of_same_file_upload_once(self, client, video, tmp_path):
+        """Parallel callers serialize on the file's hash and share one upload."""
+        results = []
+
+        def run():
+            results.append(upload_file(client, video, manifest=UploadManifest(tmp_path / "manifest.json")))
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert client.files.uploads == 1
+        assert {r.uri for r in results} == {"https://files.example/files/f1"}
+
+    def test_concurrent_writers_keep_every_entry(self, tmp_path):
+        """Manifest updates from many writers are not lost."""
+        path = tmp_path / "manifest.json"
+
+        def put(i):
+            UploadManifest(path).put(UploadedFile(f"files/{i}", f"uri-{i}", f"sha-{i}"))
+
+        threads = [threading.Thread(target=put, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        manifest = UploadManifest(path)
+        assert all(manifest.get(f"sha-{i}") is not None for i in range(20))
+
+
+class _StubFilesHandler(BaseHTTPRequestHandler):
+    """Resumable upload sessions plus files.get for a local File API stand-in."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _json(self, payload: Dict[str, Any], status: int = 200, headers: Dict[str, str] = None) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        server = self.server
+        path = self.path.split("?")[0]
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        command = self.headers.get("X-Goog-Upload-Command", "")
+        if path.startswith("/upload/v1beta/files"):
+            session = f"/session/{len(server.sessions) + 1}"
+            server.sessions[session] = bytearray()
+            self._json({}, headers={"X-Goog-Upload-URL": f"http://127.0.0.1:{server.server_port}{session}"})
+            return
+        received = server.sessions[path]
+        if command == "query":
+            self._json({}, headers={"X-Goog-Upload-Size-Received": str(len(received))})
+            return
+        server.chunks.append((int(self.headers["X-Goog-Upload-Offset"]), len(body)))
+        if server.fail_chunks:
+            # Drop the response after committing part of the chunk
+            server.fail_chunks -= 1
+            received.extend(body[: len(body) // 2])
+            self._json({"error": {"code": 503, "message": "backend unavailable"}}, status=503)
+            return
+        received.extend(body)
+        if "finalize" in command:
+            name = f"files/{path.rsplit('/', 1)[1]}"
+            server.files[name] = {"bytes": bytes(received), "polls": 0}
+            self._json({"file": {"name": name, "uri": f"https://files.example/{name}", "state": "PROCESSING"}})
+        else:
+            self._json({})
+
+    def do_GET(self) -> None:
+        server = self.server
+        name = self.path.split("?")[0][len("/v1beta/"):]
+        entry = server.files[name]
+        entry["polls"] += 1
+        state = "ACTIVE" if entry["polls"] >= server.polls_until_active else "PROCESSING"
+        server.poll_times.append(time.monotonic())
+        self._json({"name": name, "uri": f"https://files.example/{name}", "state": state})
+
+
+@pytest.fixture
+def files_stub(gemini_stub_server, monkeypatch):
+    """Local REST upload / files.get stand-in."""
+    monkeypatch.setattr(file_uploads, "DEFAULT_CHUNK_SIZE", file_uploads.UPLOAD_GRANULARITY)
+    monkeypatch.setattr(file_uploads, "PROCESSING_POLL_SECONDS", 0.05)
+    monkeypatch.setattr(file_uploads, "UPLOAD_RETRY_SECONDS", 0)
+    return gemini_stub_server(
+        _StubFilesHandler,
+        sessions={},
+        files={},
+        chunks=[],
+        poll_times=[],
+        fail_chunks=0,
+        polls_until_active=2,
+    )
+
+def _video_bytes(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(bytes(i % 251 for i in range(size)))
+    return path
+
+
+class TestResumableUpload:
+    """REST path: chunked, resumable, async waits"""
+
+    def test_chunked_upload_with_progress(self, files_stub, tmp_path):
+        """The file goes up in granularity-sized chunks and progress reaches the total."""
+        size = int(file_uploads.UPLOAD_GRANULARITY * 2.5)
+        path = _video_bytes(tmp_path, "a.mp4", size)
+        progress = []
+
+        uploaded = upload_file(
+            None, path, manifest=UploadManifest(tmp_path / "m.json"), progress=lambda s, t: progress.append(s)
+        )
+
+        assert files_stub.files[uploaded.name]["bytes"] == path.read_bytes()
+        assert [length for _, length in files_stub.chunks] == [262144, 262144, 131072]
+        assert progress[-1] == size
+
+    def test_dropped_chunk_resumes_from_committed_offset(self, files_stub, tmp_path):
+        """After a failed chunk the upload continues from what the server committed."""
+        files_stub.fail_chunks = 1
+        path = _video_bytes(tmp_path, "b.mp4", file_uploads.UPLOAD_GRANULARITY * 2)
+
+        uploaded = upload_file(None, path, manifest=UploadManifest(tmp_path / "m.json"), progress=None)
+
+        assert files_stub.files[uploaded.name]["bytes"] == path.read_bytes()
+        offsets = [offset for offset, _ in files_stub.chunks]
+        assert offsets == [0, 131072, 393216]
+
+    def test_processing_waits_run_concurrently(self, files_stub, tmp_path):
+        """aupload_files waits for all files together rather than one after another."""
+        files_stub.polls_until_active = 4
+        paths = [_video_bytes(tmp_path, f"{n}.mp4", 1000 + n) for n in range(3)]
+
+        uploads = asyncio.run(file_uploads.aupload_files(paths, manifest=UploadManifest(tmp_path / "m.json")))
+
+        assert [u.source for u in uploads] == [str(p) for p in paths]
+        polls = sorted(files_stub.poll_times)
+        # 3 files x 4 polls with backoff 0.05 -> 0.075 -> 0.11: serial would take > 0.6s
+        assert polls[-1] - polls[0] < 0.5
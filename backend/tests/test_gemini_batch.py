@@ -0,0 +1,214 @@
+"""
+Tests for gemini_batch against a local stand-in for the Batch API.
+
+The stand-in implements the resumable File API upload, batchGenerateContent,
+batch polling and the responses-file download.
+
+Run with: pytest tests/test_gemini_batch.py -v
+"""
+from __future__ import annotations
+
+import base64
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Any, Dict
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import gemini_utils
+from gemini_batch import BatchError, BatchJob, text_result, write_image_results
+from image_cache import ImageCache
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\nstand-in"
+
+
+def _answer(request: Dict[str, Any]) -> Dict[str, Any]:
+    prompt = request["contents"][0]["parts"][0]["text"]
+    if "fail" in prompt:
+        return {"error": {"code": 400, "message": f"rejected: {prompt}"}}
+    if "IMAGE" in request.get("generationConfig", {}).get("responseModalities", []):
+        part = {"inlineData": {"mimeType": "image/png", "data": base64.b64encode(PNG_BYTES).decode()}}
+    else:
+        part = {"text": f"echo: {prompt}"}
+    return {"response": {"candidates": [{"content": {"parts": [part]}, "finishReason": "STOP"}]}}
+
+
+class _StubBatchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, headers: Dict[str, str] = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, payload: Dict[str, Any], status: int = 200, headers: Dict[str, str] = None) -> None:
+        self._send(status, json.dumps(payload).encode(), headers)
+
+    def do_POST(self) -> None:
+        server = self.server
+        path = self.path.split("?")[0]
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server.calls.append(("POST", path))
+
+        if path.startswith("/upload/v1beta/files"):
+            session = f"/upload-session/{len(server.files) + 1}"
+            self._json({}, headers={"X-Goog-Upload-URL": f"http://127.0.0.1:{server.server_port}{session}"})
+        elif path.startswith("/upload-session/"):
+            name = f"files/input-{path.rsplit('/', 1)[1]}"
+            server.files[name] = body.decode()
+            self._json({"file": {"name": name}})
+        elif path.endswith(":batchGenerateContent"):
+            batch = json.loads(body)["batch"]
+            name = f"batches/{len(server.batches) + 1}"
+            server.batches[name] = {"input": batch["input_config"]["file_name"], "polls": 0}
+            self._json({"name": name, "metadata": {"state": "BATCH_STATE_PENDING"}})
+        else:
+            self._json({"error": {"code": 404, "message": path}}, status=404)
+
+    def do_GET(self) -> None:
+        server = self.server
+        path = self.path.split("?")[0]
+        server.calls.append(("GET", path))
+
+        if path.startswith("/v1beta/batches/"):
+            name = path[len("/v1beta/"):]
+            batch = server.batches[name]
+            batch["polls"] += 1
+            if batch["polls"] < 2:
+                self._json({"name": name, "metadata": {"state": "BATCH_STATE_RUNNING"}})
+                return
+            if server.final_state != "BATCH_STATE_SUCCEEDED":
+                self._json({"name": name, "done": True, "metadata": {"state": server.final_state}})
+                return
+            lines = []
+            for line in server.files[batch["input"]].splitlines():
+                entry = json.loads(line)
+                lines.append(json.dumps({"key": entry["key"], **_answer(entry["request"])}))
+            output = f"files/output-{name.rsplit('/', 1)[1]}"
+            server.files[output] = "\n".join(lines) + "\n"
+            self._json({
+                "name": name,
+                "done": True,
+                "metadata": {"state": "BATCH_STATE_SUCCEEDED"},
+                "response": {"responsesFile": output},
+            })
+        elif path.startswith("/download/v1beta/"):
+            name = path[len("/download/v1beta/"):].split(":download")[0]
+            self._send(200, server.files[name].encode())
+        else:
+            self._json({"error": {"code": 404, "message": path}}, status=404)
+
+
+@pytest.fixture
+def batch_stub(gemini_stub_server):
+    """Local Batch API stand-in; gemini_utils / gemini_batch are pointed at it."""
+    return gemini_stub_server(
+        _StubBatchHandler,
+        calls=[],
+        files={},
+        batches={},
+        final_state="BATCH_STATE_SUCCEEDED",
+    )
+
+def _run(job: BatchJob) -> Dict[str, Any]:
+    return job.run(poll_interval=0.01)
+
+
+class TestBatchJob:
+    """submit / wait / results"""
+
+    def test_image_job_maps_results_to_paths(self, batch_stub, tmp_path):
+        """Image responses are decoded and written to each key's destination."""
+        job = BatchJob("images", model="gemini-3-pro-image-preview", work_dir=tmp_path)
+        job.add_image("frame_1", "a capybara")
+        job.add_image("frame_2", "a corgi")
+
+        written = write_image_results(
+            _run(job),
+            {"frame_1": tmp_path / "out" / "f1.png", "frame_2": tmp_path / "out" / "f2.png"},
+        )
+
+        assert written["frame_1"].read_bytes() == PNG_BYTES
+        assert written["frame_2"].read_bytes() == PNG_BYTES
+        submitted = batch_stub.files["files/input-1"].splitlines()
+        assert json.loads(submitted[0])["key"] == "frame_1"
+        assert job.state == "BATCH_STATE_SUCCEEDED"
+
+    def test_image_results_replace_cache_hardlinks(self, batch_stub, tmp_path):
+        """A dest left hardlinked to a cache blob by a live run is replaced, not written through."""
+        cache = ImageCache(tmp_path / "cache")
+        dest = tmp_path / "out" / "f1.png"
+        old = b"\x89PNG\r\n\x1a\ncached"
+        digest = cache.put("frame_1", old, dest)
+        blob = tmp_path / "cache" / "blobs" / digest[:2] / digest
+        assert os.path.samefile(blob, dest)
+        job = BatchJob("images", model="gemini-3-pro-image-preview", work_dir=tmp_path)
+        job.add_image("frame_1", "a capybara")
+
+        written = write_image_results(_run(job), {"frame_1": dest})
+
+        assert written["frame_1"].read_bytes() == PNG_BYTES
+        assert blob.read_bytes() == old
+
+    def test_image_results_follow_the_real_type(self, batch_stub, tmp_path):
+        """A PNG answer for a .jpg destination is saved as .png."""
+        job = BatchJob("images", model="gemini-3-pro-image-preview", work_dir=tmp_path)
+        job.add_image("frame_1", "a capybara")
+
+        written = write_image_results(_run(job), {"frame_1": tmp_path / "out" / "f1.jpg"})
+
+        assert written["frame_1"] == tmp_path / "out" / "f1.png"
+        assert not (tmp_path / "out" / "f1.jpg").exists()
+
+    def test_text_results_and_per_request_errors(self, batch_stub, tmp_path):
+        """Text results parse like live calls; failed lines raise on access only."""
+        job = BatchJob("text", model="gemini-2.5-flash", work_dir=tmp_path)
+        job.add_text("ok", "hello", response_mime_type="application/json", temperature=0.8)
+        job.add_text("bad", "please fail")
+
+        results = _run(job)
+
+        assert text_result(results["ok"])["text"] == "echo: hello"
+        with pytest.raises(RuntimeError, match="rejected"):
+            text_result(results["bad"])
+
+    def test_rerun_resumes_instead_of_resubmitting(self, batch_stub, tmp_path):
+        """A second run with the same requests reuses the saved batch."""
+        for _ in range(2):
+            job = BatchJob("resume", model="gemini-2.5-flash", work_dir=tmp_path)
+            job.add_text("a", "hello")
+            _run(job)
+
+        creates = [c for c in batch_stub.calls if c[1].endswith(":batchGenerateContent")]
+        assert len(creates) == 1
+
+    def test_changed_requests_are_resubmitted(self, batch_stub, tmp_path):
+        """Editing a prompt invalidates the saved batch."""
+        for prompt in ("hello", "hello again"):
+            job = BatchJob("changed", model="gemini-2.5-flash", work_dir=tmp_path)
+            job.add_text("a", prompt)
+            results = _run(job)
+
+        assert text_result(results["a"])["text"] == "echo: hello again"
+        creates = [c for c in batch_stub.calls if c[1].endswith(":batchGenerateContent")]
+        assert len(creates) == 2
+
+    def test_failed_batch_raises(self, batch_stub, tmp_path):
+        """A batch ending in a non-success state raises BatchError."""
+        batch_stub.final_state = "BATCH_STATE_FAILED"
+        job = BatchJob("failed", model="gemini-2.5-flash", work_dir=tmp_path)
+        job.add_text("a", "hello")
+
+        with pytest.raises(BatchError, match="BATCH_STATE_FAILED"):
+            _run(job)
@@ -0,0 +1,475 @@
+"""
+Tests for gemini_utils and its transport layer.
+
+A local HTTP/1.1 server stands in for generativelanguage.googleapis.com,
+so no API key or network access is needed.
+
+Run with: pytest tests/test_gemini_utils.py -v
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import cost_ledger
+import gemini_cache
+import gemini_utils
+from json_sections import JsonSectionParser
+from gemini_transport import AsyncGeminiTransport, GeminiTransport, TransportConfig
+
+
+def _text_response(text: str) -> Dict[str, Any]:
+    return {
+        "candidates": [
+            {
+                "content": {"parts": [{"text": text}]},
+                "finishReason": "STOP",
+            }
+        ],
+        "usageMetadata": {"promptTokenCount": 10, "candidatesTokenCount": 5},
+    }
+
+
+class _StubGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests.append({"method": self.command, "path": self.path, "body": body})
+        response = self.server.responder(self.path, body)
+        if isinstance(response, list):
+            # A list of chunks is served as an SSE stream
+            payload = "".join(f"data: {json.dumps(c)}\r\n\r\n" for c in response).encode("utf-8")
+            content_type = "text/event-stream"
+        else:
+            payload = json.dumps(response).encode("utf-8")
+            content_type = "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_POST = do_PATCH = do_DELETE = _handle
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def gemini_stub(gemini_stub_server):
+    """Local Gemini REST stand-in; gemini_utils is pointed at it for the test."""
+    return gemini_stub_server(
+        _StubGeminiHandler,
+        requests=[],
+        responder=lambda path, body: _text_response('{"ok": true}'),
+    )
+
+class TestTransport:
+    """Pooled keep-alive transport"""
+
+    def test_call_gemini_reuses_connection(self, gemini_stub):
+        """Back-to-back calls share one keep-alive connection."""
+        transport = GeminiTransport(TransportConfig(pool_maxsize=2))
+
+        for _ in range(3):
+            result = gemini_utils.call_gemini(
+                system_prompt="sys",
+                contents=[{"role": "user", "parts": [{"text": "hi"}]}],
+                model="gemini-2.5-flash",
+                transport=transport,
+            )
+            assert result["text"] == '{"ok": true}'
+
+        stats = transport.stats.snapshot()
+        assert stats["requests"] == 3
+        assert stats["connections_opened"] == 1
+        assert stats["connections_reused"] == 2
+        assert stats["hosts"]["127.0.0.1"]["requests"] == 3
+        transport.close()
+
+    def test_call_usage_recorded_in_cost_ledger(self, gemini_stub, monkeypatch):
+        """Token usage from usageMetadata lands in the current run's ledger."""
+        monkeypatch.setattr(cost_ledger, "_ledger", cost_ledger.CostLedger())
+        with cost_ledger.cost_scope("run"):
+            result = gemini_utils.call_gemini(
+                system_prompt="sys",
+                contents=[{"role": "user", "parts": [{"text": "hi"}]}],
+                model="gemini-2.5-flash",
+            )
+
+        assert result["usage"] == {"prompt_tokens": 10, "output_tokens": 5}
+        totals = cost_ledger.get_cost_ledger().totals("run")
+        assert totals["by_model"]["gemini-2.5-flash"]["prompt_tokens"] == 10
+        assert totals["by_model"]["gemini-2.5-flash"]["output_tokens"] == 5
+
+    def test_host_limits_mount_dedicated_adapter(self):
+        """Per-host overrides get their own pool size."""
+        transport = GeminiTransport(
+            TransportConfig(pool_maxsize=4, host_limits={"example.com": 32})
+        )
+        adapter = transport.session.get_adapter("https://example.com/v1")
+        default = transport.session.get_adapter("https://other.com/v1")
+        assert adapter._pool_maxsize == 32
+        assert default._pool_maxsize == 4
+        transport.close()
+
+
+class TestAsyncAPI:
+    """acall_gemini / acall_gemini_with_video"""
+
+    def test_acall_gemini_concurrent_calls(self, gemini_stub):
+        """Concurrent async calls return GeminiCallResult and share pooled connections."""
+
+        async def run():
+            transport = AsyncGeminiTransport(
+                TransportConfig(pool_connections=1, pool_maxsize=2)
+            )
+            try:
+                return await asyncio.gather(
+                    *[
+                        gemini_utils.acall_gemini_with_video(
+                            video_uri="files/abc",
+                            system_prompt="sys",
+                            user_message=f"turn {i}",
+                            model="gemini-3-pro-preview",
+                            transport=transport,
+                        )
+                        for i in range(6)
+                    ]
+                ), transport.stats.snapshot()
+            finally:
+                await transport.aclose()
+
+        results, stats = asyncio.run(run())
+
+        assert [r["text"] for r in results] == ['{"ok": true}'] * 6
+        assert stats["requests"] == 6
+        assert stats["connections_opened"] <= 2
+        assert len(gemini_stub.requests) == 6
+        assert gemini_stub.requests[0]["path"].startswith(
+            "/v1alpha/models/gemini-3-pro-preview:generateContent"
+        )
+        video_part = gemini_stub.requests[0]["body"]["contents"][0]["parts"][0]
+        assert video_part["fileData"]["fileUri"] == "files/abc"
+
+    def test_acall_gemini_raises_api_error(self, gemini_stub):
+        """API errors surface as RuntimeError like the sync path."""
+        gemini_stub.responder = lambda path, body: {"error": {"message": "quota"}}
+
+        with pytest.raises(RuntimeError, match="quota"):
+            asyncio.run(
+                gemini_utils.acall_gemini(
+                    system_prompt="sys",
+                    contents=[{"role": "user", "parts": [{"text": "hi"}]}],
+                    model="gemini-2.5-flash",
+                )
+            )
+
+
+def _stream_chunks() -> List[Dict[str, Any]]:
+    return [
+        {"candidates": [{"content": {"parts": [{"text": '{"product_'}]}}]},
+        {"candidates": [{"content": {"parts": [{"text": "overview"}, {"text": "skip", "thought": True}]}}]},
+        {
+            "candidates": [
+                {
+                    "content": {
+                        "parts": [
+                            {"text": '": {}}'},
+                            {"functionCall": {"name": "update_shotlist", "args": {"title": "T"}}},
+                            {"thoughtSignature": "sig-1"},
+                        ]
+                    },
+                    "finishReason": "STOP",
+                }
+            ]
+        },
+    ]
+
+
+class TestStreaming:
+    """stream_gemini / astream_gemini"""
+
+    def test_stream_gemini_yields_deltas_then_result(self, gemini_stub):
+        """Deltas arrive in order and the final result matches call_gemini's shape."""
+        gemini_stub.responder = lambda path, body: _stream_chunks()
+
+        events = list(
+            gemini_utils.stream_gemini(
+                system_prompt="sys",
+                contents=[{"role": "user", "parts": [{"text": "hi"}]}],
+                model="gemini-2.5-flash",
+            )
+        )
+
+        assert "streamGenerateContent" in gemini_stub.requests[0]["path"]
+        assert "alt=sse" in gemini_stub.requests[0]["path"]
+        assert [e["type"] for e in events] == [
+            "text", "text", "text", "tool_call", "thought_signature", "done",
+        ]
+        result = events[-1]["result"]
+        assert result["text"] == '{"product_overview": {}}'
+        assert result["tool_calls"] == [{"name": "update_shotlist", "args": {"title": "T"}}]
+        assert result["thought_signature"] == "sig-1"
+        assert result["finish_reason"] == "STOP"
+
+    def test_astream_gemini_matches_sync(self, gemini_stub):
+        """The async stream assembles the same final result."""
+        gemini_stub.responder = lambda path, body: _stream_chunks()
+
+        async def run():
+            transport = AsyncGeminiTransport()
+            try:
+                return [
+                    e
+                    async for e in gemini_utils.astream_gemini(
+                        system_prompt="sys",
+                        contents=[{"role": "user", "parts": [{"text": "hi"}]}],
+                        model="gemini-2.5-flash",
+                        transport=transport,
+                    )
+                ]
+            finally:
+                await transport.aclose()
+
+        events = asyncio.run(run())
+        assert events[-1]["result"]["text"] == '{"product_overview": {}}'
+
+    def test_stream_prompt_blocked(self, gemini_stub):
+        """A blocked prompt ends with a filtered result instead of raising."""
+        gemini_stub.responder = lambda path, body: [{"promptFeedback": {"blockReason": "OTHER"}}]
+
+        events = list(
+            gemini_utils.stream_gemini(
+                system_prompt="sys",
+                contents=[{"role": "user", "parts": [{"text": "hi"}]}],
+                model="gemini-2.5-flash",
+            )
+        )
+        assert events[-1]["result"]["was_filtered"] is True
+        assert events[-1]["result"]["filter_reason"] == "OTHER"
+
+
+class TestJsonSections:
+    """Incremental top-level section parsing"""
+
+    def test_sections_emitted_as_they_close(self):
+        """Sections close one by one, even when fed a character at a time."""
+        text = (
+            '```json\n{"product_overview": {"working_name": "Boards {beta}", "q": "say \\"hi\\""},\n'
+            ' "target_users": [{"segment_name": "PMs"}], "score": 7, "ok": true,\n'
+            ' "usage_contexts": ["standups]"]}\n```'
+        )
+        parser = JsonSectionParser()
+        order = []
+        for ch in text:
+            for key, _ in parser.feed(ch):
+                order.append(key)
+
+        assert order == ["product_overview", "target_users", "score", "ok", "usage_contexts"]
+        assert parser.done
+        assert parser.sections == json.loads(text.split("\n", 1)[1].rsplit("\n", 1)[0])
+
+    def test_section_available_before_object_closes(self):
+        """An early section is returned before later ones have arrived."""
+        parser = JsonSectionParser()
+        assert parser.feed('{"product_overview": {"a": 1') == []
+        assert parser.feed('}, "target') == [("product_overview", {"a": 1})]
+        assert not parser.done
+
+    def test_stream_walkthrough_sections(self, gemini_stub):
+        """The walkthrough stream yields sections, then the full result."""
+        full = json.dumps({"product_overview": {"working_name": "X"}, "core_value_props": []})
+        gemini_stub.responder = lambda path, body: [
+            {"candidates": [{"content": {"parts": [{"text": full[:20]}]}}]},
+            {"candidates": [{"content": {"parts": [{"text": full[20:]}]}, "finishReason": "STOP"}]},
+        ]
+
+        events = list(
+            gemini_utils.stream_walkthrough_sections(video_uri="files/abc", model="gemini-2.5-flash")
+        )
+
+        assert [(e["type"], e.get("section")) for e in events] == [
+            ("section", "product_overview"),
+            ("section", "core_value_props"),
+            ("done", None),
+        ]
+        assert events[-1]["result"]["text"] == full
+
+
+class TestResponseCache:
+    """Content-addressed response cache"""
+
+    @pytest.fixture
+    def cache(self, gemini_stub, tmp_path, monkeypatch):
+        monkeypatch.setenv("GEMINI_RESPONSE_CACHE", "1")
+        cache = gemini_cache.ResponseCache(gemini_cache.DiskResponseCache(tmp_path))
+        monkeypatch.setattr(gemini_cache, "_cache", cache)
+        monkeypatch.setattr(gemini_cache, "_cache_configured", True)
+        return cache
+
+    @staticmethod
+    def _call(**kwargs):
+        return gemini_utils.call_gemini(
+            system_prompt="sys",
+            contents=[{"role": "user", "parts": [{"text": "hi"}]}],
+            model="gemini-2.5-flash",
+            **kwargs,
+        )
+
+    def test_repeat_call_served_from_cache(self, gemini_stub, cache):
+        """Identical deterministic calls hit the cache; use_cache=False goes upstream."""
+        first = self._call(temperature=0)
+        second = self._call(temperature=0)
+        self._call(temperature=0, use_cache=False)
+
+        assert first == second
+        assert len(gemini_stub.requests) == 2
+        assert cache.stats() == {
+            "hits": 1, "misses": 1, "coalesced": 0, "bypassed": 1, "evictions": 0,
+        }
+
+    def test_creative_calls_are_cached_only_on_request(self, gemini_stub, cache):
+        """temperature > 0 regenerates every time unless the caller passes use_cache=True."""
+        self._call()
+        self._call()
+        self._call(use_cache=True)
+        self._call(use_cache=True)
+
+        assert len(gemini_stub.requests) == 3
+        assert cache.stats()["hits"] == 1 and cache.stats()["bypassed"] == 2
+
+    def test_concurrent_identical_calls_coalesce(self, cache):
+        """Single-flight: concurrent callers share one upstream call."""
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_call():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {"text": "shared"}
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(cache.get_or_call("k", slow_call)))
+        leader.start()
+        started.wait(5)
+        followers = [
+            threading.Thread(target=lambda: results.append(cache.get_or_call("k", slow_call)))
+            for _ in range(3)
+        ]
+        for t in followers:
+            t.start()
+        while cache.stats()["coalesced"] < 3:
+            pass
+        release.set()
+        for t in [leader, *followers]:
+            t.join(5)
+
+        assert len(calls) == 1
+        assert results == [{"text": "shared"}] * 4
+
+    def test_incomplete_backend_fails_at_construction(self):
+        """A backend missing set() is rejected when created, not on the first call."""
+        class GetOnly(gemini_cache.ResponseCacheBackend):
+            def get(self, key):
+                return None
+
+        with pytest.raises(TypeError):
+            GetOnly()
+
+    def test_disk_cache_ttl_and_lru_eviction(self, tmp_path, monkeypatch):
+        """Expired entries miss; the least recently used entry is evicted first."""
+        disk = gemini_cache.DiskResponseCache(tmp_path, ttl_seconds=60, max_bytes=10_000)
+        disk.set("aa1", {"text": "x" * 4000})
+        disk.set("bb2", {"text": "y" * 4000})
+        assert disk.get("aa1") is not None  # aa1 is now most recently used
+        disk.set("cc3", {"text": "z" * 4000})
+
+        assert disk.get("bb2") is None
+        assert disk.get("aa1") is not None
+        assert disk.evictions == 1
+
+        real_time = gemini_cache.time.time
+        monkeypatch.setattr(gemini_cache.time, "time", lambda: real_time() + 120)
+        assert disk.get("cc3") is None
+
+
+class TestContextCache:
+    """Server-side cachedContents for multi-turn video analysis"""
+
+    @staticmethod
+    def _responder(path, body):
+        if "cachedContents" in path:
+            return {"name": "cachedContents/c1", "model": "models/gemini-3-pro-preview"}
+        return _text_response("refined")
+
+    @staticmethod
+    def _follow_up():
+        return gemini_utils.call_gemini_with_video(
+            video_uri="files/abc",
+            system_prompt=gemini_utils.WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT,
+            user_message="analyze",
+            model="gemini-3-pro-preview",
+            previous_messages=[
+                {"role": "model", "text": "{}", "thoughtSignature": "sig"},
+                {"role": "user", "text": "shorter please"},
+            ],
+        )
+
+    def test_follow_up_turns_reference_cached_content(self, gemini_stub):
+        """Prompt + video are registered once and referenced by later turns."""
+        gemini_stub.responder = self._responder
+
+        assert self._follow_up()["text"] == "refined"
+        assert self._follow_up()["text"] == "refined"
+
+        creates = [r for r in gemini_stub.requests if r["path"].startswith("/v1alpha/cachedContents")]
+        generates = [r for r in gemini_stub.requests if ":generateContent" in r["path"]]
+        assert len(creates) == 1
+        assert creates[0]["body"]["ttl"] == f"{gemini_utils.CONTEXT_CACHE_TTL_SECONDS}s"
+        assert "fileData" in creates[0]["body"]["contents"][0]["parts"][0]
+        for req in generates:
+            assert req["body"]["cachedContent"] == "cachedContents/c1"
+            assert "systemInstruction" not in req["body"]
+            assert req["body"]["contents"][0]["parts"] == [{"text": "analyze"}]
+
+    def test_renew_then_recreate_on_expiry(self, gemini_stub):
+        """Handles near expiry are renewed; expired handles are recreated."""
+        gemini_stub.responder = self._responder
+        self._follow_up()
+        handle = next(iter(gemini_utils.get_context_cache_manager()._handles.values()))
+
+        handle.expires_at = gemini_utils.time.time() + 10
+        self._follow_up()
+        assert gemini_stub.requests[-2]["method"] == "PATCH"
+        assert "updateMask=ttl" in gemini_stub.requests[-2]["path"]
+
+        handle.expires_at = gemini_utils.time.time() - 1
+        self._follow_up()
+        assert gemini_stub.requests[-2]["method"] == "POST"
+        assert gemini_stub.requests[-2]["path"].startswith("/v1alpha/cachedContents")
+
+    def test_falls_back_when_caching_fails(self, gemini_stub):
+        """If the cache cannot be created the full request is sent."""
+        gemini_stub.responder = lambda path, body: (
+            {"error": {"message": "too few tokens"}} if "cachedContents" in path
+            else _text_response("ok")
+        )
+
+        assert self._follow_up()["text"] == "ok"
+        body = gemini_stub.requests[-1]["body"]
+        assert "cachedContent" not in body
+        assert "fileData" in body["contents"][0]["parts"][0]
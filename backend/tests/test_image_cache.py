@@ -0,0 +1,125 @@
+"""
+Tests for the content-addressed image cache.
+
+Run with: pytest tests/test_image_cache.py -v
+"""
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import image_cache
+from image_cache import ImageCache, cached_image, configure_image_cache, image_cache_key
+
+MODEL = "gemini-3-pro-image-preview"
+CONFIG = {"response_modalities": ["IMAGE", "TEXT"]}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ImageCache(tmp_path / "cache", max_bytes=1024)
+    configure_image_cache(cache)
+    yield cache
+    configure_image_cache(None)
+    image_cache._cache_configured = False
+
+
+class TestImageCache:
+    """ImageCache / cached_image()"""
+
+    def test_key_covers_prompt_and_config(self):
+        """Style prefixes and generation config are part of the key."""
+        base = image_cache_key(MODEL, "Generate an image: fox", CONFIG)
+        assert base == image_cache_key(MODEL, "Generate an image: fox", dict(CONFIG))
+        assert base != image_cache_key(MODEL, "Generate an image: Pixar. fox", CONFIG)
+        assert base != image_cache_key(MODEL, "Generate an image: fox", {"response_modalities": ["IMAGE"]})
+
+    def test_hit_is_a_hardlink_to_the_blob(self, cache, tmp_path):
+        """Re-runs skip generate() and link the stored bytes into the new run."""
+        calls = []
+
+        def generate():
+            calls.append(1)
+            return b"png bytes"
+
+        first, second = tmp_path / "runs" / "a" / "fox.png", tmp_path / "runs" / "b" / "fox.png"
+        assert cached_image(MODEL, "fox", CONFIG, first, generate)
+        assert cached_image(MODEL, "fox", CONFIG, second, generate)
+
+        assert len(calls) == 1
+        assert second.read_bytes() == b"png bytes"
+        assert os.stat(first).st_ino == os.stat(second).st_ino
+        assert cache.stats()["hits"] == 1 and cache.stats()["blobs"] == 1
+
+    def test_fresh_take_replaces_the_cached_image(self, cache, tmp_path):
+        """use_cache=False regenerates; the next cached read returns the new image."""
+        dest = tmp_path / "fox.png"
+        cached_image(MODEL, "fox", CONFIG, dest, lambda: b"first take")
+        cached_image(MODEL, "fox", CONFIG, dest, lambda: b"second take", use_cache=False)
+        cached_image(MODEL, "fox", CONFIG, tmp_path / "again.png", lambda: pytest.fail("should hit"))
+
+        assert dest.read_bytes() == b"second take"
+        assert (tmp_path / "again.png").read_bytes() == b"second take"
+        assert cache.stats()["refreshed"] == 1
+
+    def test_hit_leaves_linked_run_files_untouched(self, cache, tmp_path):
+        """A cache hit must not bump the mtime shared by every hardlink of the blob."""
+        first = tmp_path / "runs" / "a" / "fox.png"
+        cached_image(MODEL, "fox", CONFIG, first, lambda: b"png bytes")
+        os.utime(first, (1_000_000, 1_000_000))
+
+        cached_image(MODEL, "fox", CONFIG, tmp_path / "runs" / "b" / "fox.png", lambda: pytest.fail("should hit"))
+        assert os.stat(first).st_mtime == 1_000_000
+
+    def test_eviction_keeps_run_outputs(self, cache, tmp_path):
+        """Blobs above max_bytes are evicted LRU; linked run files survive, the key misses."""
+        for name in ("a", "b", "c"):
+            cached_image(MODEL, name, CONFIG, tmp_path / f"{name}.png", lambda name=name: name.encode() * 400)
+
+        assert cache.total_bytes <= 1024
+        assert cache.stats()["evictions"] == 1
+        assert (tmp_path / "a.png").read_bytes() == b"a" * 400
+        calls = []
+        cached_image(MODEL, "a", CONFIG, tmp_path / "a2.png", lambda: calls.append(1) or b"new a")
+        assert calls == [1]
+
+    def test_disabled_cache_still_writes(self, monkeypatch, tmp_path):
+        """IMAGE_CACHE=0 calls generate() every time and writes dest directly."""
+        monkeypatch.setenv("IMAGE_CACHE", "0")
+        dest = tmp_path / "fox.png"
+        assert cached_image(MODEL, "fox", CONFIG, dest, lambda: b"png")
+        assert dest.read_bytes() == b"png"
+        assert not cached_image(MODEL, "fox", CONFIG, dest, lambda: None)
+
+
+class TestMockAfterCachedRun:
+    """The mock storyboard fallback on top of a run whose images are cache hardlinks"""
+
+    def test_mock_replaces_linked_outputs_without_touching_blobs(self, cache, tmp_path, monkeypatch):
+        from storyboard import storyboard_service
+        from storyboard.schemas import Research
+
+        runs = tmp_path / "public" / "runs"
+        monkeypatch.setattr(storyboard_service, "RUNS_DIR", runs)
+        # What a cached Gemini run leaves behind: run outputs hardlinked to blobs
+        for path in (runs / "first" / "characters" / "char_01.png", runs / "first" / "environments" / "env_01.png"):
+            cached_image(MODEL, path.name, CONFIG, path, lambda path=path: b"gemini " + path.name.encode())
+
+        research = Research.model_validate({
+            "selected_script": {
+                "id": "script_01", "title": "T", "hook": "H", "tone": "T",
+                "assets": {"characters": [], "objects": [], "environments": []},
+                "scenes": [{"scene_id": 1, "visual": "v", "audio": "a"}],
+            }
+        })
+        storyboard_service.mock_generate_storyboard("first", research)
+
+        assert (runs / "first" / "characters" / "char_01.png").read_bytes() != b"gemini char_01.png"
+        # The cached Gemini images are still intact for the next hit
+        cached_image(MODEL, "char_01.png", CONFIG, tmp_path / "hit.png", lambda: pytest.fail("should hit"))
+        assert (tmp_path / "hit.png").read_bytes() == b"gemini char_01.png"
@@ -0,0 +1,109 @@
+"""
+Tests for storyboard image derivatives (thumbnail, preview, WebP).
+
+Run with: pytest tests/test_image_derivatives.py -v
+"""
+from __future__ import annotations
+
+import os
+import sys
+from concurrent.futures import Future
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from image_cache import ImageCache
+from image_derivatives import DerivativePipeline, build_derivatives, variant_urls
+from storyboard.storyboard_service import _collect_variants
+
+
+def _png(path: Path, size=(1600, 900)) -> Path:
+    Image.new("RGB", size, (200, 120, 40)).save(path, format="PNG")
+    return path
+
+
+class TestImageDerivatives:
+    """build_derivatives() / DerivativePipeline / variant URLs"""
+
+    def test_variants_are_written_next_to_the_source(self, tmp_path):
+        """Three WebP files with the longest edge capped per variant."""
+        source = _png(tmp_path / "scene-1.png")
+        variants = build_derivatives(source)
+
+        assert variants == {
+            "webp": "scene-1.webp",
+            "preview": "scene-1.preview.webp",
+            "thumbnail": "scene-1.thumb.webp",
+        }
+        sizes = {name: Image.open(tmp_path / filename).size for name, filename in variants.items()}
+        assert sizes == {"webp": (1600, 900), "preview": (960, 540), "thumbnail": (320, 180)}
+        assert (tmp_path / "scene-1.thumb.webp").stat().st_size < source.stat().st_size
+
+    def test_fresh_variants_are_reused(self, tmp_path):
+        """Variants of unchanged source bytes are not rebuilt, whatever the source mtime."""
+        source = _png(tmp_path / "scene-1.png")
+        build_derivatives(source)
+        thumb = tmp_path / "scene-1.thumb.webp"
+        built_at = thumb.stat().st_mtime_ns
+
+        later = thumb.stat().st_mtime + 10
+        os.utime(source, (later, later))
+        build_derivatives(source)
+        assert thumb.stat().st_mtime_ns == built_at
+
+    def test_relinked_older_image_rebuilds_variants(self, tmp_path):
+        """Going back to an older cached image (older mtime) still replaces the variants."""
+        cache = ImageCache(tmp_path / "cache")
+        frames = tmp_path / "frames"
+        frames.mkdir()
+        source = frames / "scene-1.png"
+        red, blue = tmp_path / "red.png", tmp_path / "blue.png"
+        Image.new("RGB", (400, 400), (255, 0, 0)).save(red, format="PNG")
+        Image.new("RGB", (400, 400), (0, 0, 255)).save(blue, format="PNG")
+
+        cache.put("A", red.read_bytes(), source)
+        build_derivatives(source)
+        cache.put("B", blue.read_bytes(), source)
+        build_derivatives(source)
+        assert cache.get("A", source)
+        variants = build_derivatives(source)
+
+        with Image.open(frames / variants["thumbnail"]) as thumb:
+            assert thumb.convert("RGB").getpixel((10, 10))[0] > 200
+
+    def test_webp_source_is_not_overwritten(self, tmp_path):
+        """A WebP image from the model is its own full-size variant."""
+        source = tmp_path / "scene-1.webp"
+        Image.new("RGB", (1600, 900), (200, 120, 40)).save(source, format="WEBP", quality=95)
+        original = source.read_bytes()
+
+        variants = build_derivatives(source)
+
+        assert variants["webp"] == "scene-1.webp"
+        assert source.read_bytes() == original
+        assert Image.open(tmp_path / variants["preview"]).size == (960, 540)
+
+    def test_pipeline_runs_on_a_thread_pool(self, tmp_path):
+        """submit() returns a future of the variant names."""
+        pipeline = DerivativePipeline(max_workers=1)
+        try:
+            variants = pipeline.submit(_png(tmp_path / "char_01.png", (400, 400))).result(timeout=60)
+        finally:
+            pipeline.shutdown()
+        assert Image.open(tmp_path / variants["thumbnail"]).size == (320, 320)
+
+    def test_storyboard_records_variant_urls(self):
+        """Finished derivatives become URLs next to image_url; unfinished ones are left out."""
+        done, pending = Future(), Future()
+        done.set_result({"thumbnail": "scene-1.thumb.webp"})
+        results = {
+            "frame_1": {"image_url": "/runs/first/frames/scene-1.png"},
+            "frame_2": {"image_url": "/runs/first/frames/scene-2.png"},
+        }
+        _collect_variants(results, {"frame_1": done, "frame_2": pending}, timeout=0.01)
+
+        assert results["frame_1"]["variants"] == {"thumbnail": "/runs/first/frames/scene-1.thumb.webp"}
+        assert "variants" not in results["frame_2"]
+        assert variant_urls("/a/b.png", {}) == {}
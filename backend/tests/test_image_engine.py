@@ -0,0 +1,196 @@
+"""
+Tests for the shared image generation engine.
+
+The genai client is replaced by a fake whose generate_content returns canned
+responses or raises.
+
+Run with: pytest tests/test_image_engine.py -v
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import image_engine
+from image_engine import ImageEngine, ImageGenerationError, is_retryable_error, sniff_image_type
+from rate_limiter import configure_rate_limiter
+
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+
+
+def _png_bytes(size=(8, 8)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (10, 20, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _response(data=PNG_HEADER + b"png bytes", mime_type="image/png"):
+    part = SimpleNamespace(inline_data=SimpleNamespace(mime_type=mime_type, data=data))
+    return SimpleNamespace(
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))],
+        usage_metadata=None,
+    )
+
+
+class FakeModels:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def generate_content(self, model, contents, config):
+        with self.lock:
+            self.calls.append(contents)
+            outcome = self.outcomes.pop(0) if self.outcomes else _response()
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+class ApiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+@pytest.fixture(autouse=True)
+def no_image_cache(monkeypatch):
+    monkeypatch.setenv("IMAGE_CACHE", "0")
+    monkeypatch.setenv("RATE_LIMITER_DISABLED", "1")
+    configure_rate_limiter(None)
+    yield
+    configure_rate_limiter(None)
+
+
+def _engine(*outcomes, **kwargs):
+    models = FakeModels(outcomes)
+    engine = ImageEngine(client=SimpleNamespace(models=models), retry_base_seconds=0.001, **kwargs)
+    return engine, models
+
+
+class TestImageEngine:
+    """ImageEngine.generate / submit / asubmit"""
+
+    def test_generate_writes_image_and_metrics(self, tmp_path):
+        """One call: the image lands at dest and latency / size are recorded."""
+        data = PNG_HEADER + b"x" * 92
+        engine, models = _engine(_response(data))
+        result = engine.generate("a fox", tmp_path / "fox.png")
+
+        assert models.calls == ["Generate an image: a fox"]
+        assert (tmp_path / "fox.png").read_bytes() == data
+        assert (result.size_bytes, result.attempts, result.cached) == (100, 1, False)
+        stats = engine.stats()
+        assert stats["generated"] == 1 and stats["bytes"] == 100
+        assert "latency_p50_seconds" in stats
+
+    def test_rate_limits_and_server_errors_are_retried(self, tmp_path):
+        """429 and 503 are retried with backoff; the third attempt succeeds."""
+        engine, models = _engine(
+            ApiError(429, "RESOURCE_EXHAUSTED"), ApiError(503, "unavailable"), _response()
+        )
+        result = engine.generate("a fox", tmp_path / "fox.png")
+
+        assert result.attempts == 3
+        assert engine.stats()["retries"] == 2
+
+    def test_connection_drops_and_timeouts_are_retried(self, tmp_path):
+        """httpx transport errors from google-genai count as connection errors."""
+        engine, models = _engine(httpx.ConnectError("refused"), httpx.ReadTimeout("slow"), _response())
+        result = engine.generate("a fox", tmp_path / "fox.png")
+
+        assert result.attempts == 3
+        assert is_retryable_error(httpx.RemoteProtocolError("dropped"))
+
+    def test_request_errors_fail_immediately(self, tmp_path):
+        """A 400 is not retried and surfaces as ImageGenerationError."""
+        engine, models = _engine(ApiError(400, "invalid prompt"))
+        with pytest.raises(ImageGenerationError, match="invalid prompt"):
+            engine.generate("a fox", tmp_path / "fox.png")
+
+        assert len(models.calls) == 1
+        assert engine.stats()["failed"] == 1
+        assert not is_retryable_error(ApiError(400, "bad"))
+
+    def test_attempts_are_bounded(self, tmp_path):
+        """A model that keeps throttling gives up after max_attempts."""
+        engine, models = _engine(*[ApiError(429, "quota")] * 5, max_attempts=3)
+        with pytest.raises(ImageGenerationError):
+            engine.generate("a fox", tmp_path / "fox.png")
+        assert len(models.calls) == 3
+
+    def test_response_without_image(self, tmp_path):
+        """A text-only answer is an error, not an empty file."""
+        engine, _ = _engine(SimpleNamespace(candidates=[], usage_metadata=None))
+        with pytest.raises(ImageGenerationError, match="no image data"):
+            engine.generate("a fox", tmp_path / "fox.png")
+        assert not (tmp_path / "fox.png").exists()
+
+    def test_submit_and_asubmit_return_futures(self, tmp_path):
+        """submit() runs on the bounded pool; asubmit() is awaitable."""
+        engine, models = _engine(max_workers=2)
+        futures = [engine.submit(f"shot {i}", tmp_path / f"{i}.png") for i in range(4)]
+        assert all(f.result(timeout=5).dest.exists() for f in futures)
+
+        async def run():
+            return await engine.asubmit("async shot", tmp_path / "async.png")
+
+        assert asyncio.run(run()).dest == tmp_path / "async.png"
+        assert len(models.calls) == 5
+        engine.shutdown()
+
+
+class TestImagePersistence:
+    """Bytes are written as returned; type from magic bytes, decode only to convert"""
+
+    def test_sniffing(self):
+        """PNG, JPEG, WebP and GIF headers are recognized; anything else is not."""
+        assert sniff_image_type(PNG_HEADER) == "image/png"
+        assert sniff_image_type(b"\xff\xd8\xff\xe0") == "image/jpeg"
+        assert sniff_image_type(b"RIFF\x00\x00\x00\x00WEBP") == "image/webp"
+        assert sniff_image_type(b"GIF89a") == "image/gif"
+        assert sniff_image_type(b"<html>") is None
+
+    def test_bytes_are_written_without_decoding(self, monkeypatch, tmp_path):
+        """The API's PNG lands byte for byte; PIL is never asked to open it."""
+        monkeypatch.setattr(image_engine.Image, "open", lambda *a, **k: pytest.fail("decoded"))
+        data = _png_bytes()
+        engine, _ = _engine(_response(data))
+        result = engine.generate("a fox", tmp_path / "fox.png")
+        assert result.dest.read_bytes() == data and result.mime_type == "image/png"
+
+    def test_extension_follows_the_sniffed_type(self, tmp_path):
+        """JPEG bytes requested as .png are saved as .jpg, even when mislabelled."""
+        engine, _ = _engine(_response(b"\xff\xd8\xff\xe0 jpeg", mime_type="image/png"))
+        result = engine.generate("a fox", tmp_path / "fox.png")
+
+        assert result.dest == tmp_path / "fox.jpg"
+        assert result.mime_type == "image/jpeg"
+        assert not (tmp_path / "fox.png").exists()
+
+    def test_convert_to_reencodes(self, tmp_path):
+        """An explicit convert_to decodes and writes the requested type."""
+        engine, _ = _engine(_response(_png_bytes()))
+        result = engine.generate("a fox", tmp_path / "fox.png", convert_to="image/jpeg")
+
+        assert result.dest == tmp_path / "fox.jpg"
+        assert sniff_image_type(result.dest.read_bytes()[:16]) == "image/jpeg"
+        assert not (tmp_path / "fox.png").exists()
+
+    def test_non_image_bytes_fail(self, tmp_path):
+        """Bytes that are not an image are an error, not a broken .png."""
+        engine, _ = _engine(_response(b"<html>quota page</html>"))
+        with pytest.raises(ImageGenerationError, match="not a PNG"):
+            engine.generate("a fox", tmp_path / "fox.png")
+        assert not (tmp_path / "fox.png").exists()
@@ -0,0 +1,145 @@
+"""
+Tests for the background job queue and the asynchronous storyboard endpoint.
+
+Run with: pytest tests/test_jobs.py -v
+"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from concurrent.futures import CancelledError
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import main
+from jobs import CANCELLED, DONE, FAILED, JobQueue, JobQueueFull, configure_job_queue
+
+
+def wait_until_finished(queue: JobQueue, job_id: str, timeout: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while not queue.get(job_id).finished:
+        assert time.monotonic() < deadline, queue.info(job_id)
+        time.sleep(0.01)
+    return queue.info(job_id)
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=1, max_queued=2)
+    yield queue
+    queue.shutdown(wait=True)
+
+
+class TestJobQueue:
+    """JobQueue.submit / cancel / position"""
+
+    def test_job_runs_and_keeps_its_result(self, queue):
+        job, created = queue.submit("storyboard:first", lambda job: "storyboard")
+        assert created
+        assert wait_until_finished(queue, job.id)["status"] == DONE
+        assert queue.get(job.id).result == "storyboard"
+
+    def test_same_key_returns_the_active_job(self, queue):
+        """A second submit while the first is running does not start another job."""
+        release = threading.Event()
+        job, _ = queue.submit("storyboard:first", lambda job: release.wait(5))
+        again, created = queue.submit("storyboard:first", lambda job: pytest.fail("ran twice"))
+
+        assert not created
+        assert again is job
+        release.set()
+        wait_until_finished(queue, job.id)
+
+        # Once finished, the key is free again
+        _, created = queue.submit("storyboard:first", lambda job: None)
+        assert created
+
+    def test_queue_positions_and_queued_cancel(self, queue):
+        """Waiting jobs report their place in line; cancelling one drops it."""
+        started, release = threading.Event(), threading.Event()
+        running, _ = queue.submit("a", lambda job: started.set() or release.wait(5))
+        started.wait(5)
+        second, _ = queue.submit("b", lambda job: "b")
+        third, _ = queue.submit("c", lambda job: "c")
+
+        assert queue.position(running.id) is None
+        assert queue.position(second.id) == 1
+        assert queue.position(third.id) == 2
+
+        queue.cancel(second.id)
+        assert queue.info(second.id)["status"] == CANCELLED
+        assert queue.position(third.id) == 1
+
+        release.set()
+        assert wait_until_finished(queue, third.id)["status"] == DONE
+        assert queue.get(second.id).result is None
+
+    def test_running_job_stops_on_cancel(self, queue):
+        """Running work sees cancel_event and ends as cancelled."""
+        started = threading.Event()
+
+        def work(job):
+            started.set()
+            job.cancel_event.wait(5)
+            raise CancelledError()
+
+        job, _ = queue.submit("storyboard:first", work)
+        started.wait(5)
+        queue.cancel(job.id)
+        assert wait_until_finished(queue, job.id)["status"] == CANCELLED
+
+    def test_failure_is_reported(self, queue):
+        def work(job):
+            raise RuntimeError("research missing")
+
+        job, _ = queue.submit("storyboard:first", work)
+        info = wait_until_finished(queue, job.id)
+        assert info["status"] == FAILED
+        assert info["error"] == "RuntimeError: research missing"
+
+    def test_full_queue_rejects_new_jobs(self, queue):
+        started, release = threading.Event(), threading.Event()
+        queue.submit("a", lambda job: started.set() or release.wait(5))
+        started.wait(5)
+        queue.submit("b", lambda job: None)
+        queue.submit("c", lambda job: None)
+        with pytest.raises(JobQueueFull):
+            queue.submit("d", lambda job: None)
+        release.set()
+
+
+class TestStoryboardJobEndpoints:
+    """POST /runs/<id>/storyboard as a background job"""
+
+    @pytest.fixture
+    def client(self, monkeypatch, queue):
+        def slow_storyboard(run_id, fresh_images, resume, job):
+            # Runs until the test cancels it
+            job.cancel_event.wait(5)
+            raise CancelledError()
+
+        monkeypatch.setattr(main, "load_research", lambda run_id: None)
+        monkeypatch.setattr(main, "write_status", lambda status: None)
+        monkeypatch.setattr(main, "_run_storyboard", slow_storyboard)
+        configure_job_queue(queue)
+        yield TestClient(main.app)
+        configure_job_queue(None)
+
+    def test_post_returns_202_and_deduplicates(self, client):
+        first = client.post("/runs/first/storyboard")
+        second = client.post("/runs/first/storyboard")
+
+        assert first.status_code == 202
+        assert second.json()["job_id"] == first.json()["job_id"]
+        assert client.get(f"/jobs/{first.json()['job_id']}/position").status_code == 200
+
+        cancelled = client.post(f"/jobs/{first.json()['job_id']}/cancel").json()
+        assert cancelled["cancel_requested"]
+
+    def test_unknown_job_is_404(self, client):
+        assert client.get("/jobs/nope").status_code == 404
@@ -0,0 +1,85 @@
+"""
+Tests for scene-change keyframe selection and the keyframe request mode.
+
+Frames are synthesized with NumPy; ffmpeg is not needed.
+
+Run with: pytest tests/test_keyframes.py -v
+"""
+from __future__ import annotations
+
+import base64
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import gemini_utils
+
+np = pytest.importorskip("numpy")
+
+from keyframes import scene_scores, select_keyframes
+
+
+def _screens(*levels_and_lengths):
+    """Flat grayscale 'screens' with a little noise, one frame per second."""
+    rng = np.random.default_rng(0)
+    frames = [
+        np.clip(level + rng.integers(-3, 4, size=(90, 160)), 0, 255).astype(np.uint8)
+        for level, length in levels_and_lengths
+        for _ in range(length)
+    ]
+    return np.stack(frames), np.arange(len(frames), dtype=np.float64)
+
+
+class TestSceneDetection:
+    """scene_scores() / select_keyframes()"""
+
+    def test_cuts_score_high_and_noise_low(self):
+        """Only the screen changes score above the threshold."""
+        frames, _ = _screens((30, 5), (200, 5), (120, 5))
+        scores = scene_scores(frames)
+        assert scores[0] == 1.0
+        assert set(np.flatnonzero(scores[1:] > 0.25) + 1) == {5, 10}
+        assert scores[1:5].max() < 0.05
+
+    def test_one_keyframe_per_scene_from_its_middle(self):
+        """Each scene gets a keyframe with its timestamp and extent."""
+        frames, timestamps = _screens((30, 6), (200, 4), (120, 8))
+        keyframes = select_keyframes(scene_scores(frames), timestamps)
+
+        assert [k.scene_start_sec for k in keyframes] == [0.0, 6.0, 10.0]
+        assert [k.timestamp_sec for k in keyframes] == [2.0, 7.0, 13.0]
+        assert keyframes[-1].scene_end_sec == 18.0
+
+    def test_min_gap_and_max_frames(self):
+        """Cuts closer than min_gap merge; only the strongest max_frames survive."""
+        frames, timestamps = _screens((30, 3), (200, 1), (60, 3), (250, 3), (0, 3))
+        assert len(select_keyframes(scene_scores(frames), timestamps, min_gap_seconds=2)) == 4
+        capped = select_keyframes(scene_scores(frames), timestamps, min_gap_seconds=0, max_frames=2)
+        assert len(capped) == 2 and capped[0].scene_start_sec == 0.0
+
+
+class TestFrameParts:
+    """gemini_utils keyframe mode"""
+
+    def test_frames_replace_video_part(self):
+        """Keyframes go out as timestamped inlineData images instead of fileData."""
+        frames = [
+            gemini_utils.VideoFrame(timestamp_sec=2.0, mime_type="image/jpeg", data=b"a"),
+            gemini_utils.VideoFrame(timestamp_sec=7.5, mime_type="image/jpeg", data=b"b"),
+        ]
+        contents = gemini_utils.build_video_contents(
+            video_uri="",
+            user_message="analyze",
+            model="gemini-2.5-flash",
+            video_frames=frames,
+        )
+
+        parts = contents[0]["parts"]
+        assert not any("fileData" in p for p in parts)
+        assert [p["text"] for p in parts if p.get("text", "").startswith("[t=")] == ["[t=2.0s]", "[t=7.5s]"]
+        images = [p["inlineData"] for p in parts if "inlineData" in p]
+        assert base64.b64decode(images[1]["data"]) == b"b"
+        assert parts[-1] == {"text": "analyze"}
@@ -0,0 +1,150 @@
+"""
+Tests for the shared per-model rate limiter.
+
+Run with: pytest tests/test_rate_limiter.py -v
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from gemini_utils import raise_for_api_error
+from rate_limiter import ModelLimits, RateLimiter, is_rate_limit_error
+
+
+class _QuotaError(Exception):
+    code = 429
+
+
+@pytest.fixture
+def limiter() -> RateLimiter:
+    return RateLimiter({"m": ModelLimits(rpm=6000, max_concurrency=4)})
+
+
+class TestTokenBucket:
+    """RPM pacing"""
+
+    def test_burst_then_refill_rate(self):
+        """A full bucket allows a burst; further calls wait for refill at the RPM rate."""
+        limiter = RateLimiter({"m": ModelLimits(rpm=600, max_concurrency=2)})
+        start = time.monotonic()
+        for _ in range(4):
+            with limiter.slot("m"):
+                pass
+        elapsed = time.monotonic() - start
+
+        # 2 burst tokens, then 2 more at 10/s
+        assert 0.15 <= elapsed < 1.0
+
+    def test_models_prefix_shares_limiter(self, limiter):
+        """"models/x" and "x" are the same limiter."""
+        assert limiter.for_model("models/m") is limiter.for_model("m")
+
+
+class TestConcurrency:
+    """In-flight cap and AIMD adjustment"""
+
+    def test_in_flight_never_exceeds_limit(self, limiter):
+        """Threads beyond max_concurrency wait for a slot."""
+        peak = 0
+        current = 0
+        lock = threading.Lock()
+
+        def work():
+            nonlocal peak, current
+            with limiter.slot("m"):
+                with lock:
+                    current += 1
+                    peak = max(peak, current)
+                time.sleep(0.02)
+                with lock:
+                    current -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert peak <= 4
+        assert limiter.stats()["m"]["calls"] == 12
+        assert limiter.stats()["m"]["in_flight"] == 0
+
+    def test_throttle_halves_then_success_recovers(self, limiter):
+        """A 429 halves the window; successful calls grow it back additively."""
+        model = limiter.for_model("m")
+        with pytest.raises(_QuotaError):
+            with limiter.slot("m"):
+                raise _QuotaError("quota")
+        assert model.concurrency_limit == 2
+        assert limiter.stats()["m"]["throttled"] == 1
+
+        for _ in range(20):
+            with limiter.slot("m"):
+                pass
+        assert model.concurrency_limit == 4
+
+    def test_other_errors_do_not_shrink(self, limiter):
+        """Non-quota failures are counted but leave the window alone."""
+        with pytest.raises(ValueError):
+            with limiter.slot("m"):
+                raise ValueError("bad prompt")
+        assert limiter.for_model("m").concurrency_limit == 4
+        assert limiter.stats()["m"]["failed"] == 1
+
+    def test_slow_calls_shrink(self):
+        """Calls slower than target_latency_seconds decrease the window."""
+        limiter = RateLimiter(
+            {"m": ModelLimits(rpm=6000, max_concurrency=4, target_latency_seconds=0.01)}
+        )
+        for _ in range(3):
+            with limiter.slot("m"):
+                time.sleep(0.02)
+        assert limiter.for_model("m").concurrency_limit < 4
+        assert limiter.stats()["m"]["slow"] == 3
+
+    def test_aslot_respects_limit(self, limiter):
+        """Async callers share the same in-flight cap."""
+        peak = 0
+        current = 0
+
+        async def work():
+            nonlocal peak, current
+            async with limiter.aslot("m"):
+                current += 1
+                peak = max(peak, current)
+                await asyncio.sleep(0.02)
+                current -= 1
+
+        async def run():
+            await asyncio.gather(*[work() for _ in range(10)])
+
+        asyncio.run(run())
+        assert peak <= 4
+        assert limiter.stats()["m"]["calls"] == 10
+
+
+class TestRateLimitDetection:
+    """is_rate_limit_error"""
+
+    def test_gemini_utils_error_carries_status(self):
+        """REST errors raised by gemini_utils are recognised as throttling."""
+        with pytest.raises(RuntimeError) as excinfo:
+            raise_for_api_error(
+                {"error": {"code": 429, "message": "You exceeded your current quota"}},
+                ok=False,
+                status_code=429,
+            )
+        assert is_rate_limit_error(excinfo.value)
+        assert not is_rate_limit_error(RuntimeError("Invalid argument"))
+
+    def test_message_markers(self):
+        """SDK errors that only carry the status in their message."""
+        assert is_rate_limit_error(Exception("429 RESOURCE_EXHAUSTED"))
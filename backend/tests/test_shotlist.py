@@ -0,0 +1,101 @@
+"""
+Tests for the shotlist executor.
+
+ffmpeg / ffprobe are replaced by fakes that record commands and write files.
+
+Run with: pytest tests/test_shotlist.py -v
+"""
+from __future__ import annotations
+
+import json
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import shotlist
+from shotlist import Shot, build_cut_command, execute_tool_calls, plan_cut, shots_from_tool_calls
+
+KEYFRAMES = [0.0, 2.0, 4.0, 6.0, 8.0]
+
+
+def _tool_call(*shots):
+    return {
+        "name": "update_shotlist",
+        "args": {"title": "Boards in 10s", "description": "fast", "shots": list(shots)},
+    }
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    commands = []
+    lock = threading.Lock()
+
+    def run(command):
+        with lock:
+            commands.append(command)
+        if "bad" in command[-1]:
+            raise RuntimeError("ffmpeg failed (1): invalid data")
+        Path(command[-1]).write_bytes(b"clip")
+
+    monkeypatch.setattr(shotlist.shutil, "which", lambda name: f"/usr/bin/{name}")
+    monkeypatch.setattr(shotlist, "probe_keyframes", lambda source: KEYFRAMES)
+    monkeypatch.setattr(shotlist, "_run_ffmpeg", run)
+    return commands
+
+
+class TestShotlist:
+    """shots_from_tool_calls() / plan_cut() / execute_tool_calls()"""
+
+    def test_last_call_wins_and_invalid_shots_skipped(self):
+        """Only the latest update_shotlist counts; shots with out <= in are dropped."""
+        calls = [
+            _tool_call({"id": "old", "in": 0, "out": 1}),
+            {"name": "other_tool", "args": {}},
+            _tool_call(
+                {"id": "shot 1", "in": 2, "out": 3.5, "audio": "mute"},
+                {"id": "shot-2", "in": 5, "out": 4},
+            ),
+        ]
+        title, _, shots = shots_from_tool_calls(calls)
+        assert title == "Boards in 10s"
+        assert [(s.id, s.start, s.end, s.audio) for s in shots] == [("shot-1", 2.0, 3.5, "mute")]
+
+    def test_keyframe_aligned_cuts_use_stream_copy(self):
+        """In points on or just after a keyframe copy; others re-encode."""
+        assert plan_cut(Shot("a", 4.0, 5.0), KEYFRAMES).mode == "copy"
+        snapped = plan_cut(Shot("b", 2.2, 3.0), KEYFRAMES)
+        assert (snapped.mode, snapped.start) == ("copy", 2.0)
+        assert plan_cut(Shot("c", 3.1, 3.9), KEYFRAMES).mode == "encode"
+
+    def test_commands_for_copy_and_mute(self, tmp_path):
+        """Copy cuts use -c copy; muted shots drop the audio stream."""
+        copy = build_cut_command(tmp_path / "in.mp4", tmp_path / "out.mp4", plan_cut(Shot("a", 4, 5), KEYFRAMES), True)
+        assert "-c" in copy and copy[copy.index("-c") + 1] == "copy"
+        assert "-an" in copy and "0:a:0?" not in copy
+        encode = build_cut_command(tmp_path / "in.mp4", tmp_path / "out.mp4", plan_cut(Shot("c", 3.1, 4), KEYFRAMES), False)
+        assert "libx264" in encode and "0:a:0?" in encode
+
+    def test_execute_writes_clips_and_manifest(self, fake_ffmpeg, tmp_path):
+        """Every shot is cut into run_dir/shots; failures are recorded per shot."""
+        manifest = execute_tool_calls(
+            tmp_path / "source.mp4",
+            [_tool_call(
+                {"id": "hook", "in": 0, "out": 1.5, "label": "hook", "audio": "keep"},
+                {"id": "bad", "in": 3.3, "out": 4.0, "audio": "mute"},
+                {"id": "payoff", "in": 6.1, "out": 8.0, "audio": "keep"},
+            )],
+            tmp_path,
+        )
+
+        assert len(fake_ffmpeg) == 3
+        saved = json.loads((tmp_path / "shotlist.json").read_text())
+        assert saved == manifest
+        assert [s["status"] for s in saved["shots"]] == ["done", "error", "done"]
+        assert [s["mode"] for s in saved["shots"]] == ["copy", "encode", "copy"]
+        assert (tmp_path / saved["shots"][0]["file"]).read_bytes() == b"clip"
+        assert saved["stream_copied"] == 2
+        assert not list((tmp_path / "shots").glob("*.tmp.mp4"))
@@ -0,0 +1,324 @@
+"""
+Tests for the storyboard task scheduler and the DAG-based generate_storyboard.
+
+LLM calls and the image engine are replaced by fakes; nothing hits the API.
+
+Run with: pytest tests/test_storyboard_scheduler.py -v
+"""
+from __future__ import annotations
+
+import json
+import sys
+import threading
+import time
+from concurrent.futures import CancelledError
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from storyboard import storyboard_service
+from storyboard.llm import LLMCharacter, LLMEnvironment
+from storyboard.scheduler import TaskScheduler
+from storyboard.schemas import Research
+
+
+class TestTaskScheduler:
+    """TaskScheduler.add / run / critical_path"""
+
+    def test_tasks_start_when_their_deps_are_done(self):
+        """Independent tasks do not wait for slow unrelated ones."""
+        events = []
+        scheduler = TaskScheduler(max_workers=4)
+        scheduler.add("slow_llm", lambda: time.sleep(0.2) or events.append("slow_llm") or "chars")
+        scheduler.add("frame", lambda: events.append("frame"))
+        scheduler.add("portrait", lambda: events.append("portrait"), deps=("slow_llm",))
+
+        results = scheduler.run()
+
+        assert events == ["frame", "slow_llm", "portrait"]
+        assert results["slow_llm"] == "chars"
+        assert scheduler.critical_path() == ["slow_llm", "portrait"]
+        timings = {t.name: t for t in scheduler.timings()}
+        assert timings["portrait"].started_at >= timings["slow_llm"].finished_at
+
+    def test_running_tasks_can_add_tasks(self):
+        """A task can fan out into tasks that wait for it."""
+        scheduler = TaskScheduler(max_workers=2)
+        seen = []
+
+        def spawn():
+            for i in range(3):
+                scheduler.add(f"child_{i}", lambda i=i: seen.append(i), deps=("parent",))
+            return "spawned"
+
+        scheduler.add("parent", spawn)
+        scheduler.run()
+        assert sorted(seen) == [0, 1, 2]
+
+    def test_failure_skips_dependents_and_raises(self):
+        """The first error is re-raised; tasks waiting on it never run."""
+        scheduler = TaskScheduler(max_workers=2)
+        ran = []
+
+        def boom():
+            raise RuntimeError("LLM down")
+
+        scheduler.add("characters", boom)
+        scheduler.add("portrait", lambda: ran.append("portrait"), deps=("characters",))
+        with pytest.raises(RuntimeError, match="LLM down"):
+            scheduler.run()
+
+        statuses = {t.name: t.status for t in scheduler.timings()}
+        assert statuses == {"characters": "failed", "portrait": "skipped"}
+        assert ran == []
+
+    def test_failed_attempts_are_retried(self):
+        """A task with attempts > 1 is retried until it succeeds."""
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise RuntimeError("503")
+            return "ok"
+
+        scheduler = TaskScheduler(max_workers=1, retry_base_seconds=0.0)
+        scheduler.add("frame_1", flaky, attempts=3)
+
+        assert scheduler.run() == {"frame_1": "ok"}
+        assert scheduler.timings()[0].attempts == 3
+
+    def test_optional_failure_does_not_stop_the_run(self):
+        """required=False tasks that give up are reported by failed(), not raised."""
+        def boom():
+            raise RuntimeError("quota")
+
+        scheduler = TaskScheduler(max_workers=2, retry_base_seconds=0.0)
+        scheduler.add("frame_1", boom, attempts=2, required=False)
+        scheduler.add("frame_1_variant", lambda: "v", deps=("frame_1",))
+        scheduler.add("frame_2", lambda: "ok", required=False)
+
+        assert scheduler.run() == {"frame_2": "ok"}
+        assert scheduler.failed() == {"frame_1": "RuntimeError: quota"}
+        statuses = {t.name: t.status for t in scheduler.timings()}
+        assert statuses["frame_1_variant"] == "skipped"
+
+    def test_cancel_skips_remaining_tasks(self):
+        """Once cancel is set no new task starts and run() raises CancelledError."""
+        cancel = threading.Event()
+        ran = []
+        scheduler = TaskScheduler(max_workers=1, cancel=cancel)
+        scheduler.add("characters", lambda: cancel.set() or "chars")
+        scheduler.add("portrait", lambda: ran.append("portrait"), deps=("characters",))
+
+        with pytest.raises(CancelledError):
+            scheduler.run()
+        assert ran == []
+
+    def test_unknown_dependency_is_rejected(self):
+        scheduler = TaskScheduler(max_workers=1)
+        with pytest.raises(ValueError):
+            scheduler.add("portrait", lambda: None, deps=("characters",))
+
+
+class FakeEngine:
+    max_workers = 4
+    model = "fake-image-model"
+
+    def __init__(self):
+        self.started = {}
+        self.calls = {}
+        self.failing = set()
+        self.lock = threading.Lock()
+
+    def generate(self, prompt, dest, use_cache=True):
+        with self.lock:
+            self.started[Path(dest).name] = time.monotonic()
+            self.calls[Path(dest).name] = self.calls.get(Path(dest).name, 0) + 1
+        if Path(dest).name in self.failing:
+            raise RuntimeError("quota exhausted")
+        Path(dest).parent.mkdir(parents=True, exist_ok=True)
+        Path(dest).write_bytes(b"png")
+        return SimpleNamespace(dest=Path(dest))
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch, tmp_path):
+    public = tmp_path / "public"
+    engine = FakeEngine()
+    finished = {}
+
+    def characters(research):
+        time.sleep(0.2)
+        finished["characters"] = time.monotonic()
+        return [LLMCharacter("char_01", "Ana", "lead", "curious")]
+
+    def environments(research):
+        return [LLMEnvironment("env_01", "Office", "open plan")]
+
+    monkeypatch.setenv("IMAGE_DERIVATIVES", "0")
+    monkeypatch.setattr(storyboard_service, "RUNS_DIR", public / "runs")
+    monkeypatch.setattr(storyboard_service, "get_image_engine", lambda: engine)
+    monkeypatch.setattr(storyboard_service, "generate_characters", characters)
+    monkeypatch.setattr(storyboard_service, "generate_environments", environments)
+    return SimpleNamespace(engine=engine, finished=finished, runs=public / "runs")
+
+
+RESEARCH = {
+    "selected_script": {
+        "id": "script_01",
+        "title": "Quick Test",
+        "hook": "Test hook.",
+        "tone": "Test",
+        "assets": {
+            "characters": [{"name": "Ana", "visual_prompt": "Simple test character."}],
+            "objects": [],
+            "environments": [],
+        },
+        "scenes": [{"scene_id": 1, "visual": "Ana at her desk", "audio": "Typing"}],
+    }
+}
+
+
+class TestGenerateStoryboardDag:
+    """generate_storyboard() on the scheduler"""
+
+    def test_frames_do_not_wait_for_character_llm(self, fake_pipeline):
+        """Frame images start before the characters call returns."""
+        research = Research.model_validate(RESEARCH)
+        storyboard = storyboard_service.generate_storyboard("dag", research)
+
+        started = fake_pipeline.engine.started
+        assert started["scene-1.png"] < fake_pipeline.finished["characters"]
+        assert started["char_01.png"] >= fake_pipeline.finished["characters"]
+        assert storyboard.assets["characters"][0].image_url == "/runs/dag/characters/char_01.png"
+
+        report = json.loads((fake_pipeline.runs / "dag" / "storyboard_timings.json").read_text())
+        assert report["critical_path"] == ["characters", "character_char_01"]
+        assert {t["name"] for t in report["tasks"]} == {
+            "characters", "environments", "frame_1", "character_char_01", "environment_env_01",
+        }
+
+
+class TestStoryboardProgress:
+    """Progress manifest, per-asset failures and incremental regeneration"""
+
+    def test_failed_image_leaves_a_failed_asset(self, fake_pipeline):
+        """One image giving up does not fail the storyboard (nor is it retried on top of the engine)."""
+        fake_pipeline.engine.failing.add("scene-1.png")
+        research = Research.model_validate(RESEARCH)
+        storyboard = storyboard_service.generate_storyboard("partial", research)
+        assert fake_pipeline.engine.calls["scene-1.png"] == 1
+
+        frame = storyboard.storyboard_frames[0]
+        assert frame.status == "failed"
+        assert frame.image_url == ""
+        assert frame.description == "Ana at her desk"
+        assert storyboard.assets["characters"][0].status == "approved"
+
+        progress = json.loads((fake_pipeline.runs / "partial" / "storyboard_progress.json").read_text())
+        assert progress["tasks"]["frame_1"]["state"] == "failed"
+        assert "quota exhausted" in progress["tasks"]["frame_1"]["error"]
+        assert progress["tasks"]["character_char_01"]["state"] == "done"
+        assert progress["tasks"]["characters"]["result"][0]["name"] == "Ana"
+
+    def test_resume_only_reruns_failed_tasks(self, fake_pipeline, monkeypatch):
+        """Done tasks (LLM calls included) are reused; the failed frame is regenerated."""
+        research = Research.model_validate(RESEARCH)
+        fake_pipeline.engine.failing.add("scene-1.png")
+        storyboard_service.generate_storyboard("resume", research)
+
+        fake_pipeline.engine.failing.clear()
+        fake_pipeline.engine.started.clear()
+
+        def no_llm(research):
+            raise AssertionError("LLM step should be reused")
+
+        monkeypatch.setattr(storyboard_service, "generate_characters", no_llm)
+        monkeypatch.setattr(storyboard_service, "generate_environments", no_llm)
+        storyboard = storyboard_service.generate_storyboard("resume", research)
+
+        assert set(fake_pipeline.engine.started) == {"scene-1.png"}
+        assert storyboard.storyboard_frames[0].status == "approved"
+        assert storyboard.assets["characters"][0].image_url == "/runs/resume/characters/char_01.png"
+
+    def test_editing_a_scene_only_reruns_its_frame(self, fake_pipeline, monkeypatch):
+        """A changed scene visual reruns that frame; LLM calls and other images are reused."""
+        research = dict(RESEARCH, selected_script=dict(RESEARCH["selected_script"]))
+        research["selected_script"]["scenes"] = [
+            {"scene_id": 1, "visual": "Ana at her desk", "audio": "Typing"},
+            {"scene_id": 2, "visual": "Ana leaves", "audio": "Door"},
+        ]
+        storyboard_service.generate_storyboard("edited", Research.model_validate(research))
+        fake_pipeline.engine.started.clear()
+
+        def no_llm(research):
+            raise AssertionError("LLM prompts did not change")
+
+        monkeypatch.setattr(storyboard_service, "generate_characters", no_llm)
+        monkeypatch.setattr(storyboard_service, "generate_environments", no_llm)
+        research["selected_script"]["scenes"][0] = {"scene_id": 1, "visual": "Ana at the window", "audio": "Typing"}
+        storyboard = storyboard_service.generate_storyboard("edited", Research.model_validate(research))
+
+        assert set(fake_pipeline.engine.started) == {"scene-1.png"}
+        assert storyboard.storyboard_frames[0].description == "Ana at the window"
+        report = json.loads((fake_pipeline.runs / "edited" / "storyboard_timings.json").read_text())
+        assert "frame_1" not in report["reused"]
+        assert {"characters", "environments", "frame_2", "character_char_01"} <= set(report["reused"])
+
+    def test_resume_false_reruns_everything(self, fake_pipeline):
+        research = Research.model_validate(RESEARCH)
+        storyboard_service.generate_storyboard("full", research)
+        fake_pipeline.engine.started.clear()
+
+        storyboard_service.generate_storyboard("full", research, resume=False)
+        assert set(fake_pipeline.engine.started) == {"scene-1.png", "char_01.png", "env_01.png"}
+
+
+class TestRunIsolation:
+    """Per-run output directories and run_lock()"""
+
+    def test_concurrent_runs_write_their_own_images(self, fake_pipeline):
+        research = Research.model_validate(RESEARCH)
+        storyboards = {}
+
+        def generate(run_id):
+            storyboards[run_id] = storyboard_service.generate_storyboard(run_id, research)
+
+        threads = [threading.Thread(target=generate, args=(run_id,)) for run_id in ("run_a", "run_b")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert storyboards["run_a"].storyboard_frames[0].image_url == "/runs/run_a/frames/scene-1.png"
+        assert storyboards["run_b"].storyboard_frames[0].image_url == "/runs/run_b/frames/scene-1.png"
+        assert (fake_pipeline.runs / "run_a" / "frames" / "scene-1.png").exists()
+        assert (fake_pipeline.runs / "run_b" / "frames" / "scene-1.png").exists()
+
+    def test_run_lock_is_per_run(self, fake_pipeline):
+        """A second holder of the same run waits; other runs do not."""
+        events = []
+
+        def second_holder():
+            with storyboard_service.run_lock("run_a"):
+                events.append("run_a")
+
+        with storyboard_service.run_lock("run_a"):
+            waiter = threading.Thread(target=second_holder)
+            waiter.start()
+            with storyboard_service.run_lock("run_b"):
+                events.append("run_b")
+            time.sleep(0.05)
+            assert events == ["run_b"]
+        waiter.join(5)
+        assert events == ["run_b", "run_a"]
+
+    def test_run_ids_must_be_plain_names(self, fake_pipeline):
+        with pytest.raises(HTTPException) as exc_info:
+            storyboard_service.status_path("../first")
+        assert exc_info.value.status_code == 400
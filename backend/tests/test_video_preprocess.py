@@ -0,0 +1,76 @@
+"""
+Tests for ffmpeg pre-upload transcoding.
+
+ffmpeg itself is replaced by a fake runner that writes a small output file.
+
+Run with: pytest tests/test_video_preprocess.py -v
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import video_preprocess
+from video_preprocess import PROFILES, build_ffmpeg_command, prepare_video, prepare_videos
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    commands = []
+
+    def run(command):
+        commands.append(command)
+        Path(command[-1]).write_bytes(b"small")
+
+    monkeypatch.setattr(video_preprocess, "ffmpeg_available", lambda: True)
+    monkeypatch.setattr(video_preprocess, "_run_ffmpeg", run)
+    return commands
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "walkthrough.mp4"
+    path.write_bytes(b"raw 1080p video" * 1000)
+    return path
+
+
+class TestTranscode:
+    """prepare_video() / build_ffmpeg_command()"""
+
+    def test_command_matches_profile(self, tmp_path):
+        """Scale, fps and bitrate come from the resolution profile; -an drops audio."""
+        command = build_ffmpeg_command(tmp_path / "in.mp4", tmp_path / "out.mp4", PROFILES["low"], drop_audio=True)
+        assert "scale=-2:'min(360,ih)',fps=2" in command
+        assert command[command.index("-b:v") + 1] == "250k"
+        assert "-an" in command and "-c:a" not in command
+
+    def test_result_cached_by_source_hash(self, fake_ffmpeg, source, tmp_path):
+        """The same source and profile transcode once; another resolution is a new entry."""
+        first = prepare_video(source, "medium", cache_dir=tmp_path / "cache")
+        again = prepare_video(source, "medium", cache_dir=tmp_path / "cache")
+        low = prepare_video(source, "low", cache_dir=tmp_path / "cache")
+
+        assert first == again != source
+        assert first.read_bytes() == b"small"
+        assert low != first
+        assert len(fake_ffmpeg) == 2
+
+    def test_larger_output_falls_back_to_source(self, monkeypatch, fake_ffmpeg, tmp_path):
+        """Already-small sources are uploaded unchanged."""
+        tiny = tmp_path / "tiny.mp4"
+        tiny.write_bytes(b"x")
+        assert prepare_video(tiny, "medium", cache_dir=tmp_path / "cache") == tiny
+
+    def test_without_ffmpeg_source_is_used(self, monkeypatch, source, tmp_path):
+        """No ffmpeg on PATH: the stage is skipped."""
+        monkeypatch.setattr(video_preprocess, "ffmpeg_available", lambda: False)
+        assert prepare_video(source, "medium", cache_dir=tmp_path / "cache") == source
+
+    def test_prepare_videos_keeps_order(self, fake_ffmpeg, source, tmp_path):
+        """Single sources skip the pool; results line up with inputs."""
+        assert prepare_videos([source], "high", cache_dir=tmp_path / "cache")[0].name.endswith(".mp4")
+        assert prepare_videos([], "high") == []
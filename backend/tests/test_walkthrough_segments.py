@@ -0,0 +1,113 @@
+"""
+Tests for segmented walkthrough analysis.
+
+Run with: pytest tests/test_walkthrough_segments.py -v
+"""
+from __future__ import annotations
+
+import json
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import gemini_utils
+import walkthrough_segments
+from walkthrough_segments import analyze_walkthrough_segmented, merge_analyses, plan_segments
+
+
+def _analysis(moment_ts, moment, user="Indie hacker", queries=("kanban ads",)):
+    return {
+        "product_overview": {"working_name": "Boards", "category": ""},
+        "target_users": [{"segment_name": user, "key_pains": ["too many tabs"]}],
+        "feature_timeline": {
+            "aha_moments": [{"timestamp_sec": moment_ts, "description": moment}],
+            "friction_points": [],
+        },
+        "research_queries_for_agent": list(queries),
+    }
+
+
+class TestSegments:
+    """plan_segments() / merge_analyses()"""
+
+    def test_windows_overlap_and_cover_video(self):
+        """Windows step by segment - overlap; a short tail folds into the last window."""
+        assert plan_segments(124, 45, 5) == [(0.0, 45.0), (40.0, 85.0), (80.0, 124)]
+        assert plan_segments(30, 45, 5) == [(0.0, 30.0)]
+        assert plan_segments(87, 45, 5) == [(0.0, 45.0), (40.0, 87)]
+
+    def test_clip_is_sent_as_video_metadata(self):
+        """Each window reuses the uploaded file with start/end offsets."""
+        part = gemini_utils.build_video_part("files/x", "gemini-2.5-flash", "medium", (40.0, 85.0))
+        assert part["videoMetadata"] == {"startOffset": "40s", "endOffset": "85s"}
+
+    def test_merge_shifts_timestamps_and_dedupes(self):
+        """Timestamps move by the window offset; overlap repeats and list duplicates collapse."""
+        merged = merge_analyses(
+            [
+                ((0.0, 45.0), _analysis(42, "Drag card to Done")),
+                # Same moment seen again at 2s into the second window (40 + 2)
+                ((40.0, 85.0), _analysis(2, "Card dragged to done column", user="indie hacker")),
+                ((40.0, 85.0), _analysis(30, "Timeline view", queries=("kanban ads", "notion ads"))),
+            ],
+            tolerance_seconds=2.5,
+        )
+
+        moments = merged["feature_timeline"]["aha_moments"]
+        assert [m["timestamp_sec"] for m in moments] == [42.0, 70.0]
+        assert len(merged["target_users"]) == 1
+        assert merged["research_queries_for_agent"] == ["kanban ads", "notion ads"]
+        assert merged["product_overview"]["working_name"] == "Boards"
+
+
+    def test_close_events_outside_the_overlap_are_kept(self):
+        """Only items inside the shared span of two windows can be repeats."""
+        merged = merge_analyses(
+            [
+                # 38.5s is before the 40-45s overlap: the second window never saw it
+                ((0.0, 45.0), _analysis(38.5, "Open card")),
+                ((40.0, 85.0), _analysis(0.5, "Add comment")),
+            ],
+            tolerance_seconds=2.5,
+        )
+        moments = merged["feature_timeline"]["aha_moments"]
+        assert [m["timestamp_sec"] for m in moments] == [38.5, 40.5]
+
+    def test_same_description_within_one_window_is_kept(self):
+        """A window showing the same step twice keeps both occurrences."""
+        analysis = _analysis(5, "Drag card to Done")
+        analysis["feature_timeline"]["aha_moments"].append({"timestamp_sec": 20, "description": "Drag card to Done"})
+        merged = merge_analyses([((0.0, 45.0), analysis)])
+        assert [m["timestamp_sec"] for m in merged["feature_timeline"]["aha_moments"]] == [5.0, 20.0]
+
+
+class TestSegmentedAnalysis:
+    """analyze_walkthrough_segmented()"""
+
+    def test_windows_run_concurrently_and_merge(self, monkeypatch):
+        """Every window is requested with its clip; results merge into one JSON text."""
+        clips = []
+        all_started = threading.Barrier(3, timeout=5)
+
+        def fake_call(**kwargs):
+            clip = kwargs["video_clip"]
+            clips.append(clip)
+            # Blocks unless all three windows are in flight together
+            all_started.wait()
+            return {
+                "text": json.dumps(_analysis(1, f"moment at {clip[0]:g}")),
+                "usage": {"prompt_tokens": 100},
+            }
+
+        monkeypatch.setattr(walkthrough_segments, "call_gemini_with_video", fake_call)
+
+        result = analyze_walkthrough_segmented(
+            video_uri="files/x", model="gemini-2.5-flash", duration_seconds=124
+        )
+
+        analysis = json.loads(result["text"])
+        assert sorted(clips) == [(0.0, 45.0), (40.0, 85.0), (80.0, 124)]
+        assert [m["timestamp_sec"] for m in analysis["feature_timeline"]["aha_moments"]] == [1.0, 41.0, 81.0]
+        assert result["usage"] == {"prompt_tokens": 300}
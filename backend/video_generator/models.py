@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field, HttpUrl
 
 
@@ -75,6 +75,10 @@ class StoryboardFrame(BaseModel):
     image_url: str
     # Optional audio prompt that will be combined into the scene prompt
     audio_prompt: str
+    # "failed" when the storyboard image could not be generated
+    status: str = "approved"
+    # Smaller renditions of image_url ("thumbnail", "preview", "webp")
+    variants: Dict[str, str] = Field(default_factory=dict)
 
 
 class StoryboardInput(BaseModel):
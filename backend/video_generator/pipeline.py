@@ -143,7 +143,10 @@ async def run_storyboard_pipeline_from_data(
         print(f"  Prompt: {clip.prompt_used[:50]}...")
 
         frame = frames_by_id.get(scene.scene_number)
-        thumbnail_url = str(frame.image_url) if frame is not None else ""
+        thumbnail_url = ""
+        if frame is not None:
+            # The preview rendition is plenty for a video poster
+            thumbnail_url = frame.variants.get("preview") or str(frame.image_url)
 
         clip_id = f"clip_{idx:02d}"
 
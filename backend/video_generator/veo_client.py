@@ -6,6 +6,14 @@ from pathlib import Path
 from google import genai
 from google.genai import types, errors as genai_errors
 
+from cost_ledger import track_call
+from deadlines import check_deadline
+from rate_limiter import get_rate_limiter
+
+VIDEO_MODEL = "veo-3.1-generate-preview"
+# Length requested from Veo; also what the cost ledger books per clip
+CLIP_SECONDS = 8
+
 
 class VeoClient:
     def __init__(self, api_key: str, image_base_path: Optional[str] = None):
@@ -89,45 +97,53 @@ class VeoClient:
                     image_obj = types.Image.from_file(location=str(image_path))
                     print(f"Image loaded from local path: {image_path}")
 
-            # Create operation - Generate video using Veo model
-            print("Creating video generation operation...")
-            try:
-                operation = self.client.models.generate_videos(
-                    model="veo-3.1-generate-preview",
-                    prompt=prompt,
-                    image=image_obj,
-                    config=types.GenerateVideosConfig(
-                        number_of_videos=1,
-                        duration_seconds=8,
-                    ),
-                )
-            except genai_errors.ClientError as e:
-                # If image is rejected by the API, retry once without image
-                msg = str(e)
-                if "Unable to process input image" in msg:
-                    print(
-                        "Veo rejected input image, retrying video generation "
-                        "without image..."
-                    )
+            # Hold a Veo slot from creation until the operation completes, so the
+            # shared limiter caps concurrent generations across all callers
+            with get_rate_limiter().slot(VIDEO_MODEL), track_call(VIDEO_MODEL) as call:
+                # Create operation - Generate video using Veo model
+                print("Creating video generation operation...")
+                try:
                     operation = self.client.models.generate_videos(
-                        model="veo-3.1-generate-preview",
+                        model=VIDEO_MODEL,
                         prompt=prompt,
-                        image=None,
+                        image=image_obj,
                         config=types.GenerateVideosConfig(
                             number_of_videos=1,
-                            duration_seconds=8,
+                            duration_seconds=CLIP_SECONDS,
                         ),
                     )
-                else:
-                    raise
-
-            # Poll operation until completion
-            print(f"Operation created: {operation.name}")
-            print("Polling operation status...")
-            while not operation.done:
-                time.sleep(20)
-                operation = self.client.operations.get(operation)
-                print(f"Operation status: done={operation.done}")
+                except genai_errors.ClientError as e:
+                    # If image is rejected by the API, retry once without image
+                    msg = str(e)
+                    if "Unable to process input image" in msg:
+                        print(
+                            "Veo rejected input image, retrying video generation "
+                            "without image..."
+                        )
+                        operation = self.client.models.generate_videos(
+                            model=VIDEO_MODEL,
+                            prompt=prompt,
+                            image=None,
+                            config=types.GenerateVideosConfig(
+                                number_of_videos=1,
+                                duration_seconds=CLIP_SECONDS,
+                            ),
+                        )
+                    else:
+                        raise
+
+                # Poll operation until completion
+                print(f"Operation created: {operation.name}")
+                print("Polling operation status...")
+                while not operation.done:
+                    check_deadline()
+                    time.sleep(20)
+                    operation = self.client.operations.get(operation)
+                    print(f"Operation status: done={operation.done}")
+
+                response = operation.response
+                if response and response.generated_videos:
+                    call.video_seconds = CLIP_SECONDS
 
             print("Operation completed!")
 
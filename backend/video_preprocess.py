@@ -0,0 +1,178 @@
+"""
+Optional ffmpeg transcoding of source videos before File API upload.
+
+Gemini samples video at about 1 fps and scales every frame to the requested
+media_resolution, so a raw 1080p/60fps walkthrough mostly uploads pixels the
+model never sees. prepare_video() downscales resolution, frame rate and
+bitrate to a TranscodeProfile matched to the MediaResolution of the call:
+
+    path = prepare_video(VIDEO_PATH, media_resolution="medium", drop_audio=True)
+    uploaded = upload_file(client, path)
+
+- Output is cached under backend/.cache/transcoded, keyed by the source sha256
+  and the profile, so repeated runs transcode once
+- prepare_videos() transcodes several sources in a process pool
+- Without ffmpeg on PATH (or when the result would be larger) the source is
+  returned unchanged
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from file_uploads import file_sha256
+from gemini_utils import MediaResolution
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "transcoded"
+FFMPEG_TIMEOUT_SECONDS = 600
+
+# ============================================================================
+# PROFILES
+# ============================================================================
+
+
+@dataclass(frozen=True)
+class TranscodeProfile:
+    # Output height in pixels (never upscaled); width follows the aspect ratio
+    max_height: int
+    fps: float
+    video_bitrate: str
+    audio_bitrate: str = "48k"
+
+    def key(self) -> str:
+        return f"{self.max_height}p{self.fps:g}fps{self.video_bitrate}"
+
+
+# Frames above these sizes are downsampled by the API anyway; fps stays above
+# the 1 fps sampling rate so on-screen text between samples is not lost
+PROFILES: Dict[str, TranscodeProfile] = {
+    "low": TranscodeProfile(max_height=360, fps=2, video_bitrate="250k"),
+    "medium": TranscodeProfile(max_height=480, fps=2, video_bitrate="500k"),
+    "high": TranscodeProfile(max_height=720, fps=4, video_bitrate="1200k"),
+}
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def probe_duration(source: Path) -> Optional[float]:
+    """Video length in seconds via ffprobe; None when ffprobe is missing or fails."""
+    if shutil.which("ffprobe") is None:
+        return None
+    completed = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", str(source)],
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    try:
+        return float(completed.stdout.strip())
+    except ValueError:
+        return None
+
+
+def build_ffmpeg_command(
+    source: Path,
+    dest: Path,
+    profile: TranscodeProfile,
+    drop_audio: bool = False,
+) -> List[str]:
+    command = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-i", str(source),
+        # -2 keeps the width even, as libx264 requires
+        "-vf", f"scale=-2:'min({profile.max_height},ih)',fps={profile.fps:g}",
+        "-c:v", "libx264", "-preset", "veryfast",
+        "-b:v", profile.video_bitrate, "-maxrate", profile.video_bitrate,
+        "-bufsize", profile.video_bitrate,
+    ]
+    if drop_audio:
+        command.append("-an")
+    else:
+        command += ["-c:a", "aac", "-ac", "1", "-b:a", profile.audio_bitrate]
+    command += ["-movflags", "+faststart", str(dest)]
+    return command
+
+
+def _run_ffmpeg(command: List[str]) -> None:
+    completed = subprocess.run(command, capture_output=True, text=True, timeout=FFMPEG_TIMEOUT_SECONDS)
+    if completed.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({completed.returncode}): {completed.stderr.strip()[-500:]}")
+
+
+# ============================================================================
+# TRANSCODE
+# ============================================================================
+
+
+def cached_path(
+    source: Path,
+    media_resolution: MediaResolution,
+    drop_audio: bool = False,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    sha256: Optional[str] = None,
+) -> Path:
+    profile = PROFILES[media_resolution]
+    suffix = "-noaudio" if drop_audio else ""
+    digest = sha256 or file_sha256(source)
+    return Path(cache_dir) / f"{digest[:24]}-{profile.key()}{suffix}.mp4"
+
+
+def prepare_video(
+    source: Path,
+    media_resolution: MediaResolution = "medium",
+    drop_audio: bool = False,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+) -> Path:
+    """Transcoded copy of source for media_resolution (cached), or source itself if that is smaller."""
+    source = Path(source)
+    if not ffmpeg_available():
+        print("[transcode] ffmpeg not found, uploading the source video as is")
+        return source
+
+    dest = cached_path(source, media_resolution, drop_audio, cache_dir)
+    if not dest.exists():
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = dest.with_name(f"{dest.stem}.{os.getpid()}.tmp{dest.suffix}")
+        started = time.monotonic()
+        try:
+            _run_ffmpeg(build_ffmpeg_command(source, tmp_path, PROFILES[media_resolution], drop_audio))
+            os.replace(tmp_path, dest)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        print(
+            f"[transcode] {source.name} -> {media_resolution}: "
+            f"{source.stat().st_size / 1024 / 1024:.1f} MB -> {dest.stat().st_size / 1024 / 1024:.1f} MB "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+
+    if dest.stat().st_size >= source.stat().st_size:
+        # Already-small sources can grow when re-encoded
+        return source
+    return dest
+
+
+def prepare_videos(
+    sources: Sequence[Path],
+    media_resolution: MediaResolution = "medium",
+    drop_audio: bool = False,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    max_workers: Optional[int] = None,
+) -> List[Path]:
+    """prepare_video() for several sources in a process pool; results keep the input order."""
+    if len(sources) <= 1:
+        return [prepare_video(s, media_resolution, drop_audio, cache_dir) for s in sources]
+    workers = max_workers or min(len(sources), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(prepare_video, s, media_resolution, drop_audio, cache_dir) for s in sources
+        ]
+        return [future.result() for future in futures]
@@ -0,0 +1,295 @@
+"""
+Segmented walkthrough analysis for long videos.
+
+One generateContent call over a long walkthrough is slow and can come back
+empty ("No response from Gemini. Try a shorter video"). Segmented mode:
+
+- plan_segments(): overlapping windows, e.g. 0-45s, 40-85s, 80-124s
+- each window is analyzed concurrently with the same system prompt, using
+  videoMetadata offsets on the already-uploaded file (no re-upload / cutting)
+- merge_analyses(): one result in WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT's schema;
+  aha_moments / friction_points are shifted by the window offset, list fields
+  are deduplicated (moments seen twice in an overlap are kept once)
+
+    result = analyze_walkthrough_segmented(
+        video_uri=uri, model=ANALYSIS_MODEL, duration_seconds=124.0,
+    )
+    analysis = json.loads(result["text"])
+
+Wall time follows segment_seconds instead of the video length.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from deadlines import bind
+from gemini_utils import (
+    WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT,
+    GeminiCallResult,
+    MediaResolution,
+    ThinkingLevel,
+    VideoClip,
+    build_walkthrough_user_message,
+    call_gemini_with_video,
+)
+
+DEFAULT_SEGMENT_SECONDS = 45.0
+DEFAULT_OVERLAP_SECONDS = 5.0
+# Videos up to this length are analyzed in one call
+MIN_SEGMENTED_SECONDS = 60.0
+
+TIMELINE_KEY = "feature_timeline"
+# Identity field per list of objects; items with the same identity are merged
+LIST_IDENTITY_KEYS = {
+    "target_users": "segment_name",
+    "core_value_props": "name",
+    "ad_angle_ideas": "angle_name",
+}
+
+# ============================================================================
+# SEGMENTS
+# ============================================================================
+
+
+def plan_segments(
+    duration_seconds: float,
+    segment_seconds: float = DEFAULT_SEGMENT_SECONDS,
+    overlap_seconds: float = DEFAULT_OVERLAP_SECONDS,
+) -> List[VideoClip]:
+    """Overlapping (start, end) windows covering the whole video."""
+    if segment_seconds <= overlap_seconds:
+        raise ValueError("segment_seconds must be larger than overlap_seconds")
+    if duration_seconds <= segment_seconds:
+        return [(0.0, float(duration_seconds))]
+    segments: List[VideoClip] = []
+    start = 0.0
+    step = segment_seconds - overlap_seconds
+    while True:
+        end = min(start + segment_seconds, float(duration_seconds))
+        segments.append((start, end))
+        if end >= duration_seconds:
+            break
+        start += step
+    # A last window adding no more than the overlap is folded into the previous one
+    if len(segments) > 1 and segments[-1][1] - segments[-2][1] <= overlap_seconds:
+        segments.pop()
+        segments[-1] = (segments[-1][0], float(duration_seconds))
+    return segments
+
+
+def build_segment_user_message(
+    product_context: str,
+    clip: VideoClip,
+    duration_seconds: float,
+) -> str:
+    start, end = clip
+    return (
+        build_walkthrough_user_message(product_context)
+        + f"\nYou are seeing only the part of the walkthrough from {start:g}s to {end:g}s "
+        f"(the full video is {duration_seconds:g}s). Describe the product from what this part shows. "
+        "Give every timestamp_sec relative to the start of this part (0 = its first frame)."
+    )
+
+
+# ============================================================================
+# MERGE
+# ============================================================================
+
+
+def _norm(value: Any) -> str:
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, sort_keys=True)
+    return re.sub(r"\W+", " ", str(value).lower()).strip()
+
+
+def _merge_list(key: str, lists: List[List[Any]]) -> List[Any]:
+    identity = LIST_IDENTITY_KEYS.get(key)
+    merged: List[Any] = []
+    by_id: Dict[str, Any] = {}
+    for items in lists:
+        for item in items:
+            if isinstance(item, dict) and identity and item.get(identity):
+                ident = _norm(item[identity])
+            else:
+                ident = _norm(item)
+            if not ident:
+                continue
+            if ident not in by_id:
+                # Copied: merging later windows must not edit the per-window analyses
+                by_id[ident] = dict(item) if isinstance(item, dict) else item
+                merged.append(by_id[ident])
+            elif isinstance(item, dict) and isinstance(by_id[ident], dict):
+                # Later windows only fill fields the first one left empty / add list entries
+                existing = by_id[ident]
+                for field, value in item.items():
+                    if isinstance(value, list) and isinstance(existing.get(field), list):
+                        existing[field] = _merge_list(field, [existing[field], value])
+                    elif not existing.get(field):
+                        existing[field] = value
+    return merged
+
+
+def _merge_timeline(
+    parts: List[Tuple[VideoClip, List[Dict[str, Any]]]],
+    tolerance_seconds: float,
+) -> List[Dict[str, Any]]:
+    """
+    Shift per-window timestamps to the full video and drop repeats from overlaps.
+
+    An item is a repeat only of an item from another window when both lie in the
+    span those two windows share, and they are within tolerance_seconds of each
+    other or describe the same thing. Items outside every overlap are all kept.
+    """
+    merged: List[Tuple[int, Dict[str, Any]]] = []
+    for window, ((offset, _), items) in enumerate(parts):
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            shifted = dict(item)
+            try:
+                shifted["timestamp_sec"] = round(float(item.get("timestamp_sec") or 0) + offset, 1)
+            except (TypeError, ValueError):
+                shifted["timestamp_sec"] = offset
+
+            def repeats(other_window: int, other: Dict[str, Any]) -> bool:
+                if other_window == window:
+                    return False
+                overlap_start = max(parts[window][0][0], parts[other_window][0][0])
+                overlap_end = min(parts[window][0][1], parts[other_window][0][1])
+                in_overlap = all(
+                    overlap_start <= entry["timestamp_sec"] <= overlap_end for entry in (shifted, other)
+                )
+                return in_overlap and (
+                    abs(other["timestamp_sec"] - shifted["timestamp_sec"]) <= tolerance_seconds
+                    or _norm(other.get("description")) == _norm(shifted.get("description"))
+                )
+
+            if not any(repeats(other_window, other) for other_window, other in merged):
+                merged.append((window, shifted))
+    return sorted((item for _, item in merged), key=lambda item: item["timestamp_sec"])
+
+
+def _merge_values(key: str, values: List[Any]) -> Any:
+    values = [v for v in values if v not in (None, "", [], {})]
+    if not values:
+        return None
+    if all(isinstance(v, list) for v in values):
+        return _merge_list(key, values)
+    if all(isinstance(v, dict) for v in values):
+        keys: List[str] = []
+        for v in values:
+            keys += [k for k in v if k not in keys]
+        return {k: _merge_values(k, [v.get(k) for v in values]) for k in keys}
+    # Scalars: the first window that has one
+    return values[0]
+
+
+def merge_analyses(
+    analyses: List[Tuple[VideoClip, Dict[str, Any]]],
+    tolerance_seconds: float = DEFAULT_OVERLAP_SECONDS / 2,
+) -> Dict[str, Any]:
+    """((start, end) of the window, analysis) per window -> one analysis in the walkthrough schema."""
+    merged: Dict[str, Any] = {}
+    keys: List[str] = []
+    for _, analysis in analyses:
+        keys += [k for k in analysis if k not in keys]
+
+    for key in keys:
+        if key != TIMELINE_KEY:
+            merged[key] = _merge_values(key, [a.get(key) for _, a in analyses])
+            continue
+        timeline_keys: List[str] = []
+        for _, analysis in analyses:
+            timeline_keys += [k for k in (analysis.get(key) or {}) if k not in timeline_keys]
+        merged[key] = {
+            field: _merge_timeline(
+                [(clip, (a.get(key) or {}).get(field) or []) for clip, a in analyses],
+                tolerance_seconds,
+            )
+            for field in timeline_keys
+        }
+    return merged
+
+
+def parse_analysis_text(text: str) -> Dict[str, Any]:
+    """Analysis JSON from a response, with or without ``` fences."""
+    fenced = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
+    return json.loads(fenced.group(1).strip() if fenced else text)
+
+
+# ============================================================================
+# ANALYSIS
+# ============================================================================
+
+
+def analyze_walkthrough_segmented(
+    *,
+    video_uri: str,
+    model: str,
+    duration_seconds: float,
+    product_context: str = "",
+    media_resolution: MediaResolution = "medium",
+    thinking_level: ThinkingLevel = "high",
+    segment_seconds: float = DEFAULT_SEGMENT_SECONDS,
+    overlap_seconds: float = DEFAULT_OVERLAP_SECONDS,
+    max_workers: Optional[int] = None,
+) -> GeminiCallResult:
+    """
+    analyze_walkthrough_for_ads over overlapping windows, run concurrently and merged.
+
+    Returns a GeminiCallResult whose text is the merged JSON; was_filtered is
+    only set when every window was filtered. The shared rate limiter still
+    caps how many windows are in flight.
+    """
+    segments = plan_segments(duration_seconds, segment_seconds, overlap_seconds)
+    print(f"[segments] Analyzing {duration_seconds:g}s video in {len(segments)} windows")
+
+    def analyze(clip: VideoClip) -> GeminiCallResult:
+        return call_gemini_with_video(
+            video_uri=video_uri,
+            system_prompt=WALKTHROUGH_ANALYSIS_SYSTEM_PROMPT,
+            user_message=build_segment_user_message(product_context, clip, duration_seconds),
+            model=model,
+            media_resolution=media_resolution,
+            thinking_level=thinking_level,
+            video_clip=clip,
+            use_cache=True,
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(segments)) as executor:
+        futures = [executor.submit(bind(analyze), clip) for clip in segments]
+        results = [future.result() for future in futures]
+
+    analyses: List[Tuple[VideoClip, Dict[str, Any]]] = []
+    usage: Dict[str, int] = {}
+    filter_reasons: List[str] = []
+    for (start, end), result in zip(segments, results):
+        for name, value in (result.get("usage") or {}).items():
+            usage[name] = usage.get(name, 0) + value
+        if result.get("was_filtered"):
+            print(f"[segments] ✗ Window {start:g}-{end:g}s filtered: {result.get('filter_reason')}")
+            filter_reasons.append(result.get("filter_reason") or "")
+            continue
+        try:
+            analyses.append(((start, end), parse_analysis_text(result.get("text", ""))))
+        except json.JSONDecodeError as exc:
+            raise RuntimeError(f"Window {start:g}-{end:g}s returned invalid JSON: {exc}") from exc
+
+    if not analyses:
+        return GeminiCallResult(
+            text="",
+            tool_calls=[],
+            was_filtered=True,
+            filter_reason=filter_reasons[0] if filter_reasons else None,
+            usage=usage,
+        )
+    return GeminiCallResult(
+        text=json.dumps(merge_analyses(analyses, tolerance_seconds=overlap_seconds / 2), ensure_ascii=False),
+        tool_calls=[],
+        finish_reason="STOP",
+        usage=usage,
+    )
@@ -11,6 +11,7 @@ interface StoryboardAsset {
   name: string;
   image_url: string;
   status: string;
+  variants?: Record<string, string>;
 }
 
 interface StoryboardFrame {
@@ -19,6 +20,7 @@ interface StoryboardFrame {
   description: string;
   image_url: string;
   audio_prompt: string;
+  variants?: Record<string, string>;
 }
 
 interface StoryboardData {
@@ -37,7 +39,19 @@ interface StatusResponse {
   message?: string;
 }
 
+interface JobResponse {
+  job_id: string;
+  status: string;
+  queue_position: number | null;
+  error?: string | null;
+}
+
 const RUN_ID = 'first';
+const JOB_POLL_MS = 2000;
+
+// Smaller WebP rendition when the backend produced one, else the original PNG
+const imageSrc = (item: { image_url: string; variants?: Record<string, string> }, variant: string) =>
+  item.variants?.[variant] ?? item.image_url;
 const BACKEND_URL = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:8000';
 
 export default function Step3_Storyboard({ onNext }: Step3Props) {
@@ -85,7 +99,7 @@ export default function Step3_Storyboard({ onNext }: Step3Props) {
       try {
         setStatusMessage('Starting storyboard generation...');
         
-        // Trigger generation
+        // Enqueue generation; the backend answers 202 with a job to poll
         const generateResponse = await fetch(`${BACKEND_URL}/runs/${RUN_ID}/storyboard`, {
           method: 'POST',
         });
@@ -95,8 +109,25 @@ export default function Step3_Storyboard({ onNext }: Step3Props) {
           throw new Error(errorData.detail || 'Failed to generate storyboard');
         }
 
-        // Generation completed successfully
-        const data = await generateResponse.json();
+        let job: JobResponse = await generateResponse.json();
+        while (job.status === 'queued' || job.status === 'running') {
+          if (!isMounted) return;
+          if (job.queue_position) {
+            setStatusMessage(`Waiting in queue (position ${job.queue_position})...`);
+          } else {
+            const status = await pollStatus();
+            setStatusMessage(status.message || 'Generating storyboard...');
+          }
+          await new Promise((resolve) => setTimeout(resolve, JOB_POLL_MS));
+          const jobResponse = await fetch(`${BACKEND_URL}/jobs/${job.job_id}`);
+          if (!jobResponse.ok) throw new Error('Failed to fetch storyboard job');
+          job = await jobResponse.json();
+        }
+        if (job.status !== 'done') {
+          throw new Error(job.error || `Storyboard generation ${job.status}`);
+        }
+
+        const data = await fetchStoryboard();
         if (isMounted) {
           setStoryboard(data);
           setStatusMessage('Storyboard ready!');
@@ -194,7 +225,7 @@ export default function Step3_Storyboard({ onNext }: Step3Props) {
               {assets.characters.map((char) => (
                 <div key={char.id} className="group relative bg-zinc-900 rounded-lg border border-zinc-800 overflow-hidden">
                   <img 
-                    src={char.image_url} 
+                    src={imageSrc(char, 'thumbnail')} 
                     alt={char.name} 
                     className="w-full aspect-square object-cover opacity-80 group-hover:opacity-100 transition-opacity" 
                   />
@@ -221,7 +252,7 @@ export default function Step3_Storyboard({ onNext }: Step3Props) {
               {assets.environments.map((env) => (
                 <div key={env.id} className="group relative bg-zinc-900 rounded-lg border border-zinc-800 overflow-hidden">
                   <img 
-                    src={env.image_url} 
+                    src={imageSrc(env, 'thumbnail')} 
                     alt={env.name} 
                     className="w-full aspect-video object-cover opacity-80 group-hover:opacity-100 transition-opacity" 
                   />
@@ -249,7 +280,7 @@ export default function Step3_Storyboard({ onNext }: Step3Props) {
                 {assets.objects.map((obj) => (
                   <div key={obj.id} className="group relative bg-zinc-900 rounded-lg border border-zinc-800 overflow-hidden">
                     <img 
-                      src={obj.image_url} 
+                      src={imageSrc(obj, 'thumbnail')} 
                       alt={obj.name} 
                       className="w-full aspect-square object-cover opacity-80 group-hover:opacity-100 transition-opacity" 
                     />
@@ -279,7 +310,7 @@ export default function Step3_Storyboard({ onNext }: Step3Props) {
               <div key={frame.frame_id} className="group bg-zinc-900 rounded-xl border border-zinc-800 overflow-hidden hover:border-zinc-700 transition-all">
                 <div className="aspect-video relative overflow-hidden">
                   <img 
-                    src={frame.image_url} 
+                    src={imageSrc(frame, 'preview')} 
                     alt={frame.description} 
                     className="w-full h-full object-cover opacity-80 group-hover:opacity-100 transition-opacity" 
                   />